@@ -0,0 +1,408 @@
+#!/usr/bin/python
+
+"""
+assetCache.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Disk cache of downloaded images and tables for tennis scoreboard based on MVC architecture.
+
+An AssetCache keeps what it downloads (flags, player photos, the country table)
+on disk, so a scoreboard made again, or the program run again, does not go back
+to the network for it. A copy younger than the cache's maximum age is used as it
+is. An older one is checked with the server by a conditional request (ETag,
+Last-Modified, see refresh.openConditional), and if the server can not be
+reached, it is used anyway: flaky Wi-Fi at a venue still gets flags.
+
+Copies are stored by content: each file is named after the SHA-1 of its bytes
+(so a flag served from two URLs is kept once, and a damaged file is noticed on
+reading), and index.json maps each URL to its content and validators. The cache
+keeps under a size limit by removing the least recently used copies, and a
+copy no URL refers to any more (its URL now has other content) is removed at once.
+
+Several scoreboard processes can share a cache directory. Content files never
+change once written, and every file is replaced in one step (refresh.writeFile),
+so reading needs no lock. Changes to the index are made under a lock on a file
+in the directory, after reading the index again, so no process loses another's
+changes.
+
+Exported classes:
+
+AssetCache -- Disk cache of downloads, by URL and content.
+
+Exported functions:
+
+getCache -- Returns the cache for a directory.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+try:
+    from httplib import HTTPException # Python 2
+except ImportError:
+    from http.client import HTTPException
+try:
+    import fcntl # POSIX
+except ImportError:
+    fcntl = None
+    try:
+        import msvcrt # Windows
+    except ImportError:
+        msvcrt = None
+
+import tracing
+from refresh import openConditional, writeFile
+
+defaultDir = 'assets' # Where the copies are kept, unless given
+defaultMaxBytes = 50 * 1024 * 1024 # Size limit of the copies, unless given
+defaultMaxAge = 7 * 24 * 60 * 60 # Seconds a copy is used without checking with the server (the tables change weekly at most)
+touchInterval = 60 * 60 # Seconds between noting a copy's use in the index, so using it does not rewrite the index every time
+timeout = 10 # Seconds to wait for a server, shorter than for the ranking lists: a scoreboard waits on these
+
+_caches = {} # Directory -> AssetCache
+_lock = threading.Lock() # Guards _caches
+
+tr = tracing.getTracer('assetCache')
+
+def _lockFile(f):
+    """
+    Waits for, then takes, the lock on an open file, shared with other processes.
+    @type f: file object
+    @param f: The lock file.
+    """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1) # Itself retries for about ten seconds
+                return
+            except IOError:
+                pass
+
+def _unlockFile(f):
+    """
+    Releases the lock on an open file.
+    @type f: file object
+    @param f: The lock file.
+    """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class AssetCache:
+    """Disk cache of downloads, by URL and content."""
+    def __init__(self, directory=defaultDir, maxBytes=defaultMaxBytes, maxAge=defaultMaxAge):
+        """
+        @type directory: string
+        @param directory: Where the copies are kept. Made when first needed.
+        @type maxBytes: integer
+        @param maxBytes: Size limit of the copies.
+        @type maxAge: number
+        @param maxAge: Seconds a copy is used without checking with the server.
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxAge = maxAge
+        self.indexPath = os.path.join(directory, 'index.json')
+        self.lockPath = os.path.join(directory, 'lock')
+        self.lock = threading.Lock() # Between threads; the lock file is between processes
+        self.entries = {} # URL -> {'hash', 'size', 'etag', 'lastModified', 'checked', 'used'}, as last read
+        self.indexStamp = None # Identity of the index file when last read (a new file each time it is written)
+
+    def path(self, digest):
+        """
+        @type digest: string
+        @param digest: SHA-1 of some content, in hex.
+        @rtype: string
+        @return: The file it is kept in.
+        """
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def _readIndex(self):
+        """Reads the index again, if another process (or thread) has changed it since it was last read."""
+        try:
+            st = os.stat(self.indexPath)
+        except OSError:
+            return
+        stamp = (st.st_ino, st.st_mtime, st.st_size)
+        if stamp == self.indexStamp:
+            return
+        try:
+            with open(self.indexPath, 'rb') as f:
+                self.entries = json.loads(f.read().decode('utf-8'))
+            self.indexStamp = stamp
+        except (IOError, ValueError):
+            pass # Being replaced: keep the last copy read
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds the cache lock, across threads and processes, with the index freshly read."""
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(self.lockPath, 'ab') as f:
+                _lockFile(f)
+                try:
+                    self.indexStamp = None
+                    self._readIndex()
+                    yield
+                finally:
+                    _unlockFile(f)
+
+    def _writeIndex(self):
+        """Saves the index. Call holding the lock."""
+        writeFile(self.indexPath, json.dumps(self.entries, indent=1, sort_keys=True).encode('utf-8'))
+        st = os.stat(self.indexPath)
+        self.indexStamp = (st.st_ino, st.st_mtime, st.st_size)
+
+    def _read(self, entry):
+        """
+        @type entry: dictionary
+        @param entry: The index entry of a URL.
+        @rtype: bytes
+        @return: Its copy, or None if it is gone (e.g. removed by another process) or damaged.
+        """
+        try:
+            with open(self.path(entry['hash']), 'rb') as f:
+                body = f.read()
+        except IOError:
+            return None
+        if hashlib.sha1(body).hexdigest() != entry['hash']:
+            return None
+        return body
+
+    def cached(self, url):
+        """
+        Returns the copy of a URL. Never uses the network.
+        @type url: string
+        @param url: The URL.
+        @rtype: bytes
+        @return: The copy, or None if there is none.
+        """
+        self._readIndex()
+        entry = self.entries.get(url)
+        return self._read(entry) if entry is not None else None
+
+    def get(self, url):
+        """
+        Returns the contents of a URL: the copy if it is recent, else from the server if it has changed.
+        Falls back on the copy, however old, if the server can not be reached.
+        @type url: string
+        @param url: The URL.
+        @rtype: bytes
+        @return: The contents, or None if there is no copy and the server can not be reached.
+        """
+        self._readIndex()
+        entry = self.entries.get(url)
+        body = self._read(entry) if entry is not None else None
+        now = time.time()
+        if body is None:
+            entry = {}
+        elif now - entry['checked'] < self.maxAge:
+            if tr.debug:
+                tr.debugEvent('hit', url=url)
+            if now - entry.get('used', 0) >= touchInterval:
+                self._update(url, entry['hash'], used=now)
+            return body
+        try:
+            response = openConditional(url, entry.get('etag'), entry.get('lastModified'), timeout)
+            if response is None: # Not modified
+                if tr.info:
+                    tr.event('notModified', url=url)
+                self._update(url, entry['hash'], checked=now, used=now)
+                return body
+            try:
+                new = response.read()
+                info = response.info()
+            finally:
+                response.close()
+            length = info.get('Content-Length')
+            if length is not None and length.isdigit() and len(new) < int(length): # Python 2 does not check
+                raise IOError("Connection closed after {} of {} bytes".format(len(new), length))
+        except (IOError, HTTPException, ValueError) as e: # e.g. IncompleteRead, BadStatusLine
+            if body is None:
+                print("Couldn't get {}: {!r}".format(url, e))
+            elif tr.info:
+                tr.event('stale', url=url, error=str(e))
+            return body
+        if tr.info:
+            tr.event('fetched', url=url, size=len(new))
+        self._store(url, new, info.get('ETag'), info.get('Last-Modified'))
+        return new
+
+    def _update(self, url, digest, **fields):
+        """
+        Changes the index entry of a URL, if it is still for the same content.
+        @type url: string
+        @param url: The URL.
+        @type digest: string
+        @param digest: The content the change is for.
+        @param fields: The fields to change.
+        """
+        try:
+            with self._locked():
+                entry = self.entries.get(url)
+                if entry is None or entry['hash'] != digest:
+                    return # Changed by another process meanwhile
+                entry.update(fields)
+                self._writeIndex()
+        except (IOError, OSError) as e:
+            print("Couldn't update {}: {}".format(self.indexPath, e))
+
+    def _store(self, url, body, etag, lastModified):
+        """
+        Keeps a copy of a URL, removing its previous copy if no other URL has the same content,
+        and removes the least recently used copies if over the size limit.
+        @type url: string
+        @param url: The URL.
+        @type body: bytes
+        @param body: The contents.
+        @type etag: string
+        @param etag: The ETag the server sent, or None.
+        @type lastModified: string
+        @param lastModified: The Last-Modified the server sent, or None.
+        """
+        digest = hashlib.sha1(body).hexdigest()
+        path = self.path(digest)
+        now = time.time()
+        try:
+            with self._locked():
+                if not os.path.exists(path):
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    writeFile(path, body)
+                old = self.entries.get(url)
+                self.entries[url] = {'hash': digest, 'size': len(body), 'etag': etag,
+                    'lastModified': lastModified, 'checked': now, 'used': now}
+                if old is not None and old['hash'] != digest and \
+                        not any(e['hash'] == old['hash'] for e in self.entries.values()):
+                    self._remove(old['hash'])
+                self._evict(digest)
+                self._writeIndex()
+        except (IOError, OSError) as e:
+            print("Couldn't save {}: {}".format(url, e))
+
+    def _evict(self, keep):
+        """
+        Removes the least recently used copies while over the size limit. Call holding the lock.
+        @type keep: string
+        @param keep: Hash of content never to remove (the copy just stored).
+        """
+        used = {} # Hash -> (last use by any URL, size)
+        for entry in self.entries.values():
+            (last, size) = used.get(entry['hash'], (0, entry['size']))
+            used[entry['hash']] = (max(last, entry.get('used', 0)), size)
+        total = sum(size for (last, size) in used.values())
+        if total <= self.maxBytes:
+            return
+        gone = set()
+        for (last, digest) in sorted((last, digest) for (digest, (last, size)) in used.items()):
+            if total <= self.maxBytes:
+                break
+            if digest == keep:
+                continue
+            gone.add(digest)
+            total -= used[digest][1]
+            self._remove(digest)
+        for url in [url for (url, entry) in self.entries.items() if entry['hash'] in gone]:
+            del self.entries[url]
+        if tr.info:
+            tr.event('evicted', copies=len(gone), size=total)
+
+    def _remove(self, digest):
+        """
+        Removes a copy, if it is still there. Call holding the lock.
+        @type digest: string
+        @param digest: Hash of the content.
+        """
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
+
+    def size(self):
+        """
+        @rtype: integer
+        @return: Bytes of copies kept, as last read from the index.
+        """
+        return sum(dict((e['hash'], e['size']) for e in self.entries.values()).values())
+
+def getCache(directory=defaultDir):
+    """
+    Returns the cache for a directory, making it on first use, so one is shared by all its users.
+    @type directory: string
+    @param directory: Where the copies are kept.
+    @rtype: AssetCache
+    @return: The cache.
+    """
+    with _lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = AssetCache(directory)
+        return cache
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    from refresh import standInServer
+    flag = b'GIF89a' + b'\0' * 1000
+    files = {'/countries.txt': b'USA,United States,us\nSRB,Serbia,rs\n', '/flags_of_Serbia.gif': flag,
+        '/flags_of_Serbia_copy.gif': flag, '/pics/novak_djokovic.jpg': b'\xff\xd8' + b'\1' * 4000}
+    (server, base) = standInServer(files)
+    directory = tempfile.mkdtemp()
+    def getAll(cache):
+        return [cache.get(base + path) is not None for path in sorted(files)]
+    for run in ('Cold start', 'Warm start'):
+        before = server.requests
+        cache = AssetCache(directory) # A new one each time, as in a new process
+        print("{}: got {}, {} requests to the server".format(run, getAll(cache), server.requests - before))
+    print("{} files kept for {} URLs, {} bytes".format(sum(len(names) for (d, dirs, names) in os.walk(directory)
+        if d != directory), len(cache.entries), cache.size()))
+    # A week later: each copy is checked with the server, which has changed the countries
+    files['/countries.txt'] += b'SUI,Switzerland,ch\n'
+    cache = AssetCache(directory, maxAge=0)
+    before = server.requests
+    print("Revalidated: countries {!r}, {} requests".format(cache.get(base + '/countries.txt'),
+        server.requests - before))
+    print("Old countries copy removed: {} files for {} URLs".format(sum(len(names)
+        for (d, dirs, names) in os.walk(directory) if d != directory), len(cache.entries)))
+    # Several processes at once, each with its own cache object
+    def worker(i):
+        c = AssetCache(directory, maxAge=0)
+        for n in range(20):
+            c.get('{}/extra{}.gif'.format(base, (i + n) % 8))
+    for i in range(8):
+        files['/extra{}.gif'.format(i)] = (b'%d' % i) * 500
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cache = AssetCache(directory)
+    cache._readIndex()
+    print("After 4 concurrent users: {} URLs in the index, all readable: {}".format(len(cache.entries),
+        all(cache.cached(url) is not None for url in cache.entries)))
+    # Over the size limit: the least recently used go
+    small = AssetCache(directory, maxBytes=6000)
+    small.get(base + '/pics/novak_djokovic.jpg')
+    small._store(base + '/extra0.gif', files['/extra0.gif'], None, None)
+    print("Limited to 6000 bytes: {} URLs, {} bytes kept".format(len(small.entries), small.size()))
+    server.shutdown()
+    server.server_close()
+    cache = AssetCache(directory, maxAge=0)
+    print("Server gone, stale copy: {!r}".format(cache.get(base + '/countries.txt')))
+    shutil.rmtree(directory)
@@ -7,23 +7,60 @@ The observable class for tennis scoreboard based on MVC architecture.
 
 Exported classes:
 
-Observable -- Provides an observable object, useful for MVC. 
+Observable -- Provides an observable object, useful for MVC.
+
+Transaction -- Defers and coalesces Observable callbacks until a group of changes is complete.
+
+CallbackTimer -- Call counts and latency histograms for callbacks.
+
+Exported functions:
+
+freeze -- Returns an immutable copy of a value, lists becoming tuples.
+
+diff -- Lists the parts of two (nested) values that differ.
+
+enableTiming -- Starts timing every callback run by Observables and Transactions.
+
+disableTiming -- Stops timing callbacks.
 
 Credit:
 
 observable.py copied directly from I{http://tkinter.unpythonic.net/wiki/ToyMVC}
 with (I believe) no modification. GPL licensed.
+Since extended with names, transactions for batched notification, and an
+optional value mode (frozen payloads, unchanged sets skipped, old and new values
+passed to change callbacks), and opt-in timing of each callback.
 """
 
+import time
+
+# Highest resolution clock available (time.perf_counter is Python 3.3 and later)
+_clock = getattr(time, 'perf_counter', time.time)
+
+timer = None # The CallbackTimer while timing is enabled, see enableTiming
+
 class Observable:
     """Provides an observable object, useful for MVC."""
-    def __init__(self, initialValue=None):
+    def __init__(self, initialValue=None, name=None, transaction=None, frozen=False):
         """
         @type initialValue: TBD at runtime
         @param initialValue: Initial value for the observable data.
+        @type name: string
+        @param name: Name used to report this observable in a transaction's change set.
+        @type transaction: Transaction
+        @param transaction: While this transaction is open, callbacks are deferred until it commits.
+        @type frozen: boolean
+        @param frozen: Flag, True for value mode: data is stored frozen (see freeze), so it can not be
+        changed in place, and setting an equal value does not run callbacks.
         """
-        self.data = initialValue
+        self.frozen = frozen
+        self.data = freeze(initialValue) if frozen else initialValue
         self.callbacks = {}
+        self.changeCallbacks = {}
+        self.name = name
+        self.transaction = transaction
+        self.deferred = False # True if callbacks are waiting for the transaction to commit
+        self.before = None # Value before the first deferred change
 
     def addCallback(self, func):
         """
@@ -39,14 +76,55 @@ class Observable:
         @type func: function
         @param func: Function to for callback routine to delete.
         """
-        del self.callback[func]
+        del self.callbacks[func]
 
-    def _docallbacks(self):
+    def addChangeCallback(self, func):
+        """
+        Adds callback routine for when data is modified, receiving the old and new values.
+        Use diff to find what changed within them.
+        @type func: function
+        @param func: Function to execute with (old value, new value) when data is modified.
+        """
+        self.changeCallbacks[func] = 1
+
+    def delChangeCallback(self, func):
+        """
+        Deletes change callback routine.
+        @type func: function
+        @param func: Function for change callback routine to delete.
+        """
+        del self.changeCallbacks[func]
+
+    def _docallbacks(self, old=None):
         """
         Executes all callback routines.
+        @type old: TBD at runtime
+        @param old: The value before the change, for change callbacks.
         """
         for func in self.callbacks:
              func(self.data)
+        for func in self.changeCallbacks:
+             func(old, self.data)
+
+    def _timedcallbacks(self, old=None):
+        """
+        Executes all callback routines, timing each one. Replaces _docallbacks while timing is enabled.
+        @type old: TBD at runtime
+        @param old: The value before the change, for change callbacks.
+        """
+        t = timer
+        for func in self.callbacks:
+            start = _clock()
+            try:
+                func(self.data)
+            finally:
+                t.record(self.name, func, _clock() - start)
+        for func in self.changeCallbacks:
+            start = _clock()
+            try:
+                func(old, self.data)
+            finally:
+                t.record(self.name, func, _clock() - start)
 
     def set(self, data):
         """
@@ -54,8 +132,16 @@ class Observable:
         @type data: TBD at runtime
         @param data: Value to set the observable's data to.
         """
+        if self.frozen:
+            data = freeze(data)
+            if data == self.data and not self.deferred:
+                return # No change, nothing to notify
+        old = self.data
         self.data = data
-        self._docallbacks()
+        if self.transaction is not None and self.transaction.depth:
+            self.transaction.defer(self, old)
+        else:
+            self._docallbacks(old)
 
     def get(self):
         """
@@ -67,4 +153,269 @@ class Observable:
 
     def unset(self):
         """Resets the observable's data to None."""
-        self.data = None
\ No newline at end of file
+        self.data = None
+
+class Transaction:
+    """
+    Defers and coalesces Observable callbacks until a group of changes is complete.
+    Use as a context manager; nested use is allowed, and only the outermost exit commits.
+    On commit, each changed Observable runs its callbacks once, with its final value, in the
+    order the Observables were first changed. Observables in value mode that end up equal to
+    their value before the transaction are skipped. Then transaction callbacks receive the
+    whole change set.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.pending = []
+        self.callbacks = {}
+
+    def __enter__(self):
+        """
+        Opens (or re-enters) the transaction.
+        @rtype: Transaction
+        @return: This transaction.
+        """
+        self.depth += 1
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """
+        Leaves the transaction, committing when the outermost level exits.
+        @rtype: boolean
+        @return: False, so exceptions are not suppressed.
+        """
+        self.depth -= 1
+        if self.depth == 0:
+            self.commit()
+        return False
+
+    def addCallback(self, func):
+        """
+        Adds callback routine for when a transaction commits changes.
+        @type func: function
+        @param func: Function to execute with the change set, a dictionary of Observable name to new value.
+        """
+        self.callbacks[func] = 1
+
+    def delCallback(self, func):
+        """
+        Deletes callback routine.
+        @type func: function
+        @param func: Function for callback routine to delete.
+        """
+        del self.callbacks[func]
+
+    def defer(self, observable, old):
+        """
+        Records an Observable whose callbacks wait for the commit.
+        @type observable: Observable
+        @param observable: The changed Observable.
+        @type old: TBD at runtime
+        @param old: The Observable's value before this change.
+        """
+        if not observable.deferred:
+            observable.deferred = True
+            observable.before = old
+            self.pending.append(observable)
+
+    def commit(self):
+        """
+        Runs the deferred callbacks, then the transaction callbacks with the change set.
+        """
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+        # Every Observable is taken out of the transaction before any callback runs, so one that raises
+        # does not leave the rest deferred, with their later changes dropped
+        befores = []
+        for o in pending:
+            befores.append(o.before)
+            o.deferred = False
+            o.before = None
+        changed = []
+        for (o, before) in zip(pending, befores):
+            if o.frozen and before == o.data:
+                continue # Changed back within the transaction
+            changed.append(o)
+            o._docallbacks(before)
+        if self.callbacks and changed:
+            self._docallbacks(dict((o.name, o.data) for o in changed))
+
+    def _docallbacks(self, changes):
+        """
+        Executes all transaction callback routines.
+        @type changes: dictionary
+        @param changes: The change set, Observable name to new value.
+        """
+        for func in self.callbacks:
+            func(changes)
+
+    def _timedcallbacks(self, changes):
+        """
+        Executes all transaction callback routines, timing each one. Replaces _docallbacks while timing is enabled.
+        @type changes: dictionary
+        @param changes: The change set, Observable name to new value.
+        """
+        t = timer
+        for func in self.callbacks:
+            start = _clock()
+            try:
+                func(changes)
+            finally:
+                t.record('<transaction>', func, _clock() - start)
+
+# Untimed dispatch methods, restored by disableTiming
+_plainObservableCallbacks = vars(Observable)['_docallbacks']
+_plainTransactionCallbacks = vars(Transaction)['_docallbacks']
+
+class CallbackTimer:
+    """
+    Call counts and latency histograms for callbacks, keyed by Observable name and callback name.
+    Filled in by Observables and Transactions while timing is enabled, see enableTiming.
+    """
+    # Upper bounds (seconds) of the histogram buckets. One more bucket holds anything slower.
+    bounds = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+    labels = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '>=1s')
+
+    def __init__(self):
+        self.stats = {} # (Observable name, callback name) -> [calls, total seconds, slowest seconds, bucket counts]
+        self.names = {} # Callback -> name
+
+    def callbackName(self, func):
+        """
+        Returns a readable name for a callback, e.g. Controller.gameScoreChanged.
+        @type func: function
+        @param func: The callback.
+        @rtype: string
+        @return: The name: the qualified name if there is one, else the class and method, or function name.
+        """
+        name = self.names.get(func)
+        if name is None:
+            name = getattr(func, '__qualname__', None)
+            if name is None: # Python 2
+                owner = getattr(func, '__self__', None)
+                name = getattr(func, '__name__', repr(func))
+                if owner is not None:
+                    name = owner.__class__.__name__ + '.' + name
+            self.names[func] = name
+        return name
+
+    def record(self, source, func, seconds):
+        """
+        Records one call.
+        @type source: string
+        @param source: Name of the Observable (or '<transaction>') that ran the callback.
+        @type func: function
+        @param func: The callback.
+        @type seconds: float
+        @param seconds: How long the call took.
+        """
+        key = (source, self.callbackName(func))
+        s = self.stats.get(key)
+        if s is None:
+            s = self.stats[key] = [0, 0.0, 0.0, [0] * (len(self.bounds) + 1)]
+        s[0] += 1
+        s[1] += seconds
+        if seconds > s[2]:
+            s[2] = seconds
+        i = 0
+        for bound in self.bounds:
+            if seconds < bound:
+                break
+            i += 1
+        s[3][i] += 1
+
+    def reset(self):
+        """Clears all counts."""
+        self.stats = {}
+
+    def report(self):
+        """
+        Returns the counts, slowest callbacks (by total time) first.
+        @rtype: list of dictionaries
+        @return: observable, callback, calls, total, mean and max (seconds), and histogram (counts per bucket, see labels).
+        """
+        rows = []
+        for ((source, name), (calls, total, slowest, buckets)) in self.stats.items():
+            rows.append({'observable': source, 'callback': name, 'calls': calls, 'total': total,
+                'mean': total / calls, 'max': slowest, 'histogram': list(buckets)})
+        rows.sort(key=lambda r: (-r['total'], r['observable'], r['callback']))
+        return rows
+
+    def format(self):
+        """
+        Returns the report as a text table.
+        @rtype: string
+        @return: One line per callback, slowest first, times in milliseconds.
+        """
+        lines = ['{:<18} {:<40} {:>7} {:>10} {:>8} {:>8}  {}'.format('Observable', 'Callback', 'Calls',
+            'Total ms', 'Mean ms', 'Max ms', ' '.join('{:>6}'.format(l) for l in self.labels))]
+        for r in self.report():
+            lines.append('{:<18} {:<40} {:>7} {:>10.3f} {:>8.3f} {:>8.3f}  {}'.format(str(r['observable']),
+                r['callback'], r['calls'], 1000 * r['total'], 1000 * r['mean'], 1000 * r['max'],
+                ' '.join('{:>6}'.format(n) for n in r['histogram'])))
+        return '\n'.join(lines)
+
+def enableTiming():
+    """
+    Starts timing every callback run by Observables and Transactions.
+    Timing swaps in timed versions of the dispatch methods, so there is no cost at all while it is disabled.
+    @rtype: CallbackTimer
+    @return: The timer, which collects the counts (the same one if timing was already enabled).
+    """
+    global timer
+    if timer is None:
+        timer = CallbackTimer()
+        Observable._docallbacks = vars(Observable)['_timedcallbacks']
+        Transaction._docallbacks = vars(Transaction)['_timedcallbacks']
+    return timer
+
+def disableTiming():
+    """
+    Stops timing callbacks.
+    @rtype: CallbackTimer
+    @return: The timer, with the counts so far, or None if timing was not enabled.
+    """
+    global timer
+    t = timer
+    if t is not None:
+        Observable._docallbacks = _plainObservableCallbacks
+        Transaction._docallbacks = _plainTransactionCallbacks
+        timer = None
+    return t
+
+def freeze(value):
+    """
+    Returns an immutable copy of a value, lists (at any depth) becoming tuples.
+    @type value: TBD at runtime
+    @param value: The value to freeze.
+    @rtype: TBD at runtime
+    @return: The frozen value. Values other than lists and tuples are returned as they are.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def diff(old, new, path=()):
+    """
+    Lists the parts of two (nested) values that differ.
+    For example, a set score change gives [((1, 0), 3, 4)]: set 2, team 1 games went from 3 to 4.
+    @type old: TBD at runtime
+    @param old: The old value.
+    @type new: TBD at runtime
+    @param new: The new value.
+    @type path: tuple
+    @param path: Index path of these values within the outer value.
+    @rtype: list of tuples
+    @return: (index path, old part, new part) for each differing part.
+    """
+    if isinstance(old, tuple) and isinstance(new, tuple) and len(old) == len(new):
+        changes = []
+        for i in range(len(old)):
+            if old[i] != new[i]:
+                changes.extend(diff(old[i], new[i], path + (i,)))
+        return changes
+    if old != new:
+        return [(path, old, new)]
+    return []
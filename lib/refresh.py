@@ -0,0 +1,386 @@
+#!/usr/bin/python
+
+"""
+refresh.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Conditional downloads for tennis scoreboard based on MVC architecture.
+
+A Refresher keeps the last copy of each URL it has fetched on disk, with the
+ETag and Last-Modified values the server sent for it. Fetching the URL again
+sends those back (If-None-Match, If-Modified-Since), so a list that has not
+changed costs one short request, answered 304 with no body to read or parse.
+If the server can not be reached, the saved copy is still there to use.
+
+Saved copies and their validators live in one directory: the copies in files
+named after the URL, and the validators in index.json. Every file is replaced
+in one step (written aside, then renamed), so a crash never leaves part of one.
+
+Exported classes:
+
+Refresher -- Downloads URLs when they have changed, keeping the last copy.
+
+Download -- A changed URL, as it arrives.
+
+Exported functions:
+
+getRefresher -- Returns the refresher for a directory.
+
+openConditional -- Asks a server for a URL, unless the copy held is current.
+
+writeFile -- Writes a file in one step.
+
+standInServer -- Starts a local HTTP server standing in for the real one.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+try:
+    import urllib2 as request # Python 2
+    from httplib import HTTPException
+except ImportError:
+    import urllib.request as request
+    from http.client import HTTPException
+
+import tracing
+
+defaultDir = 'cache' # Where the copies are kept, unless given
+blockSize = 1 << 16 # Most bytes read at a time
+timeout = 30 # Seconds to wait for a server
+
+_replace = getattr(os, 'replace', os.rename) # Python 2: rename replaces on POSIX
+_refreshers = {} # Directory -> Refresher
+_lock = threading.Lock() # Guards _refreshers
+
+tr = tracing.getTracer('refresh')
+
+def writeFile(path, data):
+    """
+    Writes a file in one step: a reader sees the old contents or the new, never part of them.
+    @type path: string
+    @param path: The file.
+    @type data: bytes
+    @param data: The new contents.
+    """
+    temp = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+    with open(temp, 'wb') as f:
+        f.write(data)
+    _replace(temp, path)
+
+def openConditional(url, etag=None, lastModified=None, wait=timeout):
+    """
+    Asks a server for a URL, unless the copy held is current.
+    @type url: string
+    @param url: The URL.
+    @type etag: string
+    @param etag: The ETag sent with the copy held, or None.
+    @type lastModified: string
+    @param lastModified: The Last-Modified sent with the copy held, or None.
+    @type wait: number
+    @param wait: Seconds to wait for the server.
+    @rtype: file-like object
+    @return: The open response, to read and close. None if the server answered 304 (not modified).
+    @raise IOError: If the server can not be reached, or does not have the URL.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if lastModified:
+        headers['If-Modified-Since'] = lastModified
+    try:
+        response = request.urlopen(request.Request(url, headers=headers), timeout=wait)
+    except request.HTTPError as e:
+        if e.code == 304 and headers:
+            return None
+        raise IOError("{} from {}".format(e, url))
+    except ValueError as e: # Not a URL
+        raise IOError("{}: {}".format(e, url))
+    if response.getcode() != 200:
+        response.close()
+        raise IOError("Resource not found on server {} : code = {}".format(url, response.getcode()))
+    return response
+
+class Download:
+    """A changed URL, as it arrives. Iterate over it for the blocks, then save it."""
+    def __init__(self, refresher, url, response):
+        """
+        @type refresher: Refresher
+        @param refresher: Where the copy is kept.
+        @type url: string
+        @param url: The URL.
+        @type response: file-like object
+        @param response: The open response from the server.
+        """
+        self.refresher = refresher
+        self.url = url
+        self.response = response
+        self.etag = response.info().get('ETag')
+        self.lastModified = response.info().get('Last-Modified')
+        try:
+            self.length = int(response.info().get('Content-Length')) # Bytes the server said it would send
+        except (TypeError, ValueError):
+            self.length = None # Not given: read until the server closes the connection
+        self.blocks = [] # As read so far
+        self.complete = False
+
+    def __iter__(self):
+        """
+        Yields the body a block at a time, as it arrives.
+        @raise IOError: If the connection fails part way, including with fewer bytes than Content-Length.
+        """
+        got = 0
+        try:
+            while True:
+                try:
+                    block = self.response.read(blockSize)
+                except HTTPException as e: # e.g. IncompleteRead
+                    raise IOError("{!r} reading {}".format(e, self.url))
+                if not block:
+                    break
+                got += len(block)
+                self.blocks.append(block)
+                yield block
+            if self.length is not None and got < self.length:
+                raise IOError("Connection closed after {} of {} bytes of {}".format(got, self.length, self.url))
+            self.complete = True
+        finally:
+            self.response.close()
+
+    def body(self):
+        """
+        @rtype: bytes
+        @return: The whole body (read now, if it has not been).
+        """
+        if not self.complete:
+            for block in self:
+                pass
+        return b''.join(self.blocks)
+
+    def save(self):
+        """
+        Keeps the body as the copy of the URL, with its validators, for the next fetch. Call once whatever
+        was made from the body has been stored, so the copy is never newer than it.
+        """
+        self.refresher._store(self.url, self.body(), self.etag, self.lastModified)
+
+class Refresher:
+    """Downloads URLs when they have changed, keeping the last copy."""
+    def __init__(self, directory=defaultDir):
+        """
+        @type directory: string
+        @param directory: Where the copies are kept. Made when first needed.
+        """
+        self.directory = directory
+        self.indexPath = os.path.join(directory, 'index.json')
+        self.lock = threading.Lock() # Guards entries and the index file
+        try:
+            with open(self.indexPath, 'rb') as f:
+                self.entries = json.loads(f.read().decode('utf-8')) # URL -> {'file', 'etag', 'lastModified', 'checked'}
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def path(self, url):
+        """
+        @type url: string
+        @param url: A URL.
+        @rtype: string
+        @return: The file its copy is kept in.
+        """
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, '{}-{}'.format(digest, url.rstrip('/').rsplit('/', 1)[-1]))
+
+    def cached(self, url):
+        """
+        Returns the saved copy of a URL. Never uses the network.
+        @type url: string
+        @param url: The URL.
+        @rtype: bytes
+        @return: The copy, or None if there is none.
+        """
+        if url not in self.entries:
+            return None
+        try:
+            with open(self.path(url), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def fetch(self, url, conditional=True):
+        """
+        Asks the server for a URL, if it has changed since the saved copy.
+        @type url: string
+        @param url: The URL.
+        @type conditional: boolean
+        @param conditional: False to ask for it whether or not it has changed.
+        @rtype: Download
+        @return: The new contents, to read and then save. None if it has not changed (the saved copy is current).
+        @raise IOError: If the server can not be reached, or does not have the URL.
+        """
+        entry = self.entries.get(url, {}) if conditional and os.path.exists(self.path(url)) else {}
+        response = openConditional(url, entry.get('etag'), entry.get('lastModified'))
+        if response is None:
+            if tr.info:
+                tr.event('notModified', url=url)
+            self._checked(url)
+            return None
+        if tr.info:
+            tr.event('changed', url=url, etag=response.info().get('ETag'))
+        return Download(self, url, response)
+
+    def get(self, url):
+        """
+        Returns the current contents of a URL: from the server if it has changed, else the saved copy.
+        Falls back on the saved copy if the server can not be reached.
+        @type url: string
+        @param url: The URL.
+        @rtype: bytes
+        @return: The contents, or None if the server can not be reached and there is no saved copy.
+        """
+        try:
+            download = self.fetch(url)
+            if download is None:
+                return self.cached(url)
+            body = download.body()
+        except IOError as e:
+            if tr.info:
+                tr.event('offline', url=url, error=str(e))
+            return self.cached(url)
+        download.save()
+        return body
+
+    def getSoon(self, url):
+        """
+        Returns the saved copy of a URL at once, and checks the server for a newer one in the background,
+        for next time. With no saved copy, waits for the server (as get).
+        @type url: string
+        @param url: The URL.
+        @rtype: bytes
+        @return: The contents, or None if there is no saved copy and the server can not be reached.
+        """
+        body = self.cached(url)
+        if body is None:
+            return self.get(url)
+        t = threading.Thread(target=self.get, args=(url,))
+        t.daemon = True
+        t.start()
+        return body
+
+    def _store(self, url, body, etag, lastModified):
+        """
+        Saves a copy of a URL and its validators.
+        @type url: string
+        @param url: The URL.
+        @type body: bytes
+        @param body: The copy.
+        @type etag: string
+        @param etag: The ETag the server sent, or None.
+        @type lastModified: string
+        @param lastModified: The Last-Modified the server sent, or None.
+        """
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            writeFile(self.path(url), body)
+            self.entries[url] = {'file': os.path.basename(self.path(url)), 'etag': etag,
+                'lastModified': lastModified, 'checked': time.time()}
+            self._writeIndex()
+
+    def _checked(self, url):
+        """
+        Notes that the saved copy of a URL was found current.
+        @type url: string
+        @param url: The URL.
+        """
+        with self.lock:
+            self.entries[url]['checked'] = time.time()
+            self._writeIndex()
+
+    def _writeIndex(self):
+        """Saves the validators. Call holding the lock."""
+        writeFile(self.indexPath, json.dumps(self.entries, indent=1, sort_keys=True).encode('utf-8'))
+
+def getRefresher(directory=defaultDir):
+    """
+    Returns the refresher for a directory, making it on first use, so one is shared by all its users.
+    @type directory: string
+    @param directory: Where the copies are kept.
+    @rtype: Refresher
+    @return: The refresher.
+    """
+    with _lock:
+        refresher = _refreshers.get(directory)
+        if refresher is None:
+            refresher = _refreshers[directory] = Refresher(directory)
+        return refresher
+
+def standInServer(files):
+    """
+    Starts a local HTTP server standing in for the real one, e.g. for demos. It sends an ETag and
+    Last-Modified with each file, and answers conditional requests for an unchanged file with 304.
+    @type files: dictionary
+    @param files: Path (e.g. '/menSingles.txt') -> contents (bytes). Change it to change what is served.
+    @rtype: tuple
+    @return: (the server, its base URL). Call shutdown on the server to stop it. Its requests attribute
+        counts the requests answered.
+    """
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler # Python 2
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+    from email.utils import formatdate
+    started = formatdate(time.time(), usegmt=True)
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.server.requests += 1
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', started)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass # Quiet
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = 0
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return (server, 'http://127.0.0.1:{}'.format(server.server_address[1]))
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    files = {'/countries.txt': b'USA,United States,us\nSRB,Serbia,rs\n'}
+    (server, base) = standInServer(files)
+    url = base + '/countries.txt'
+    directory = tempfile.mkdtemp()
+    r = Refresher(directory)
+    print("First fetch: {!r}".format(r.get(url)))
+    print("Unchanged: fetch returns {}".format(r.fetch(url)))
+    files['/countries.txt'] += b'SUI,Switzerland,ch\n'
+    print("Changed: {!r}".format(r.get(url)))
+    r = Refresher(directory) # As on the next run
+    print("Next run, validators kept: fetch returns {}".format(r.fetch(url)))
+    server.shutdown()
+    server.server_close()
+    print("Server gone, saved copy: {!r}".format(r.get(url)))
+    shutil.rmtree(directory)
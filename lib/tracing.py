@@ -0,0 +1,223 @@
+#!/usr/bin/python
+
+"""
+tracing.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Structured tracing for tennis scoreboard based on MVC architecture.
+
+Each module gets a Tracer, whose level says which of its events are recorded.
+Call sites test the level before building anything:
+
+    if tr.info:
+        tr.event('gameWon', team=team, score=s)
+
+so an event that is turned off costs one attribute test, and no strings are made.
+Events are (time, module, level, kind, fields) tuples, kept in one ring buffer shared
+by all tracers (the most recent events only), and formatted only when dumped, e.g.
+after an incident. Recording an event is a tuple and an append, cheap enough to leave
+the info level on all the time.
+
+Levels can be set per module, e.g. configure('tennisModel=debug,tennisView=off').
+
+Exported classes:
+
+Tracer -- Records structured events for one module.
+
+Exported functions:
+
+getTracer -- Returns the tracer for a module.
+
+setLevel -- Sets the level of a module, or of all modules.
+
+configure -- Sets levels from a text specification.
+
+events -- Returns the recorded events, oldest first.
+
+clear -- Discards the recorded events.
+
+formatEvent -- Formats one event as a line of text.
+
+dump -- Writes the recorded events to a file.
+"""
+
+import sys
+import time
+from collections import deque
+
+# Levels. An event is recorded if its level is at or below the tracer's level.
+OFF = 0
+INFO = 1 # Match events: points, games, sets, setup choices. On by default.
+DEBUG = 2 # Internals, e.g. the score before the message check.
+levelNames = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+defaultLevel = INFO
+capacity = 4096 # Events kept in the ring buffer
+
+echo = None # If not None, a file each event is also written to as it is recorded (e.g. sys.stdout)
+
+_buffer = deque(maxlen=capacity)
+_tracers = {} # Module name -> Tracer
+_levels = {} # Module name -> level, for modules set before (or after) their tracer was made
+
+class Tracer:
+    """Records structured events for one module."""
+    def __init__(self, name, level):
+        """
+        @type name: string
+        @param name: The module name.
+        @type level: integer
+        @param level: OFF, INFO, or DEBUG.
+        """
+        self.name = name
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        """
+        Sets which events are recorded.
+        @type level: integer
+        @param level: OFF, INFO, or DEBUG.
+        """
+        self.level = level
+        self.info = level >= INFO # Test before calling event
+        self.debug = level >= DEBUG # Test before calling debugEvent
+
+    def event(self, kind, **fields):
+        """
+        Records an info level event. Test info first.
+        @type kind: string
+        @param kind: What happened, e.g. 'gameWon'.
+        @type fields: keyword arguments
+        @param fields: Details, as plain values (not formatted).
+        """
+        _record((time.time(), self.name, INFO, kind, fields))
+
+    def debugEvent(self, kind, **fields):
+        """
+        Records a debug level event. Test debug first.
+        @type kind: string
+        @param kind: What happened.
+        @type fields: keyword arguments
+        @param fields: Details, as plain values (not formatted).
+        """
+        _record((time.time(), self.name, DEBUG, kind, fields))
+
+def _record(e):
+    """
+    Adds an event to the ring buffer, dropping the oldest if it is full.
+    @type e: tuple
+    @param e: The event: (time, module, level, kind, fields).
+    """
+    _buffer.append(e)
+    if echo is not None:
+        echo.write(formatEvent(e) + '\n')
+
+def getTracer(name):
+    """
+    Returns the tracer for a module, making it on first use.
+    @type name: string
+    @param name: The module name.
+    @rtype: Tracer
+    @return: The tracer.
+    """
+    tracer = _tracers.get(name)
+    if tracer is None:
+        tracer = _tracers[name] = Tracer(name, _levels.get(name, _levels.get('*', defaultLevel)))
+    return tracer
+
+def setLevel(name, level):
+    """
+    Sets the level of a module, or of all modules.
+    @type name: string
+    @param name: The module name, or '*' for all modules (those set by name keep their own level).
+    @type level: integer
+    @param level: OFF, INFO, or DEBUG.
+    """
+    _levels[name] = level
+    if name == '*':
+        for (n, tracer) in _tracers.items():
+            if n not in _levels:
+                tracer.setLevel(level)
+    elif name in _tracers:
+        _tracers[name].setLevel(level)
+
+def configure(spec):
+    """
+    Sets levels from a text specification, e.g. from an environment variable.
+    @type spec: string
+    @param spec: Comma separated module=level items, level one of off, info, debug. A level on its own applies to all modules.
+    @raise ValueError: If a level name is not known.
+    """
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        (name, sep, level) = item.rpartition('=')
+        if level.strip().lower() not in levelNames:
+            raise ValueError("Unknown trace level: {}".format(level))
+        setLevel(name.strip() or '*', levelNames[level.strip().lower()])
+
+def events():
+    """
+    Returns the recorded events, oldest first.
+    @rtype: list of tuples
+    @return: (time, module, level, kind, fields) for each event.
+    """
+    return list(_buffer)
+
+def clear():
+    """Discards the recorded events."""
+    _buffer.clear()
+
+def formatEvent(e):
+    """
+    Formats one event as a line of text.
+    @type e: tuple
+    @param e: The event: (time, module, level, kind, fields).
+    @rtype: string
+    @return: e.g. "14:02:31.207 tennisModel info gameWon score=[4, 2] team=0".
+    """
+    (t, name, level, kind, fields) = e
+    stamp = time.strftime('%H:%M:%S', time.localtime(t)) + '.{:03d}'.format(int(t * 1000) % 1000)
+    levelName = 'debug' if level == DEBUG else 'info'
+    details = ' '.join('{}={}'.format(k, fields[k]) for k in sorted(fields))
+    return '{} {} {} {} {}'.format(stamp, name, levelName, kind, details).rstrip()
+
+def dump(file=None):
+    """
+    Writes the recorded events to a file, oldest first.
+    @type file: file object
+    @param file: Where to write. If None, sys.stderr.
+    @rtype: integer
+    @return: The number of events written.
+    """
+    if file is None:
+        file = sys.stderr
+    recorded = events()
+    for e in recorded:
+        file.write(formatEvent(e) + '\n')
+    return len(recorded)
+
+if __name__ == '__main__':
+    tr = getTracer('demo')
+    for point in range(5):
+        if tr.info:
+            tr.event('point', team=point % 2, score=[point, 0])
+        if tr.debug: # Off by default, nothing is built
+            tr.debugEvent('detail', text='not recorded')
+    configure('demo=debug')
+    if tr.debug:
+        tr.debugEvent('detail', text='recorded')
+    dump(sys.stdout)
+    start = time.time()
+    for i in range(100000):
+        if tr.info:
+            tr.event('point', team=i % 2)
+    print("Recorded 100000 events in {:.3f} s, {} kept".format(time.time() - start, len(events())))
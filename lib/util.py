@@ -23,6 +23,7 @@ except:
 import urllib
 if py == 3:
     import urllib.request
+import base64
 
 # centering routine from:
 # http://stackoverflow.com/questions/3352918/how-to-center-a-window-on-the-screen-in-tkinter
@@ -97,6 +98,34 @@ def getUrlAsString(url):
     u.close()
     return str
 
+def urlBlocks(url, size=1 << 16, timeout=30):
+    """
+    Yields the contents of the given URL a block at a time, as they arrive.
+    @type url: string
+    @param url: The URL to read.
+    @type size: integer
+    @param size: Most bytes per block.
+    @type timeout: float
+    @param timeout: Seconds to wait for the server before giving up.
+    @rtype: generator of bytes
+    @return: The blocks.
+    @raise IOError: If the server can not be reached, or does not have the resource.
+    """
+    if py == 2:
+        u = urllib.urlopen(url)
+    else: # Python 3
+        u = urllib.request.urlopen(url, timeout=timeout)
+    try:
+        if u.getcode() != 200:
+            raise IOError("Resource not found on server {} : code = {}".format(url, u.getcode()))
+        while True:
+            block = u.read(size)
+            if not block:
+                return
+            yield block
+    finally:
+        u.close()
+
 def lineIter(s):
     """
     Provides a line iterator for a string.
@@ -117,16 +146,16 @@ def decode(bytes):
     """
     return bytes.decode('utf-8')
 
-def dbgprint(debug, s):
+def gifImage(data):
     """
-    Prints a string if debug boolean is true.
-    @type debug: boolean
-    @param debug: Flag, true if string should be printed.
-    @type s: string
-    @param s: String to be printed.
+    Decodes a GIF image (e.g. a flag) for display. Needs a Tk root window.
+    @type data: bytes
+    @param data: The GIF file contents.
+    @rtype: tk.PhotoImage
+    @return: The image.
     """
-    if debug:
-        print(s)
+    # Tk takes image data base 64 encoded. (base64.encodestring is gone from Python 3.9.)
+    return tk.PhotoImage(data=base64.b64encode(data))
 
 if __name__ == '__main__':
     root = tk.Tk()
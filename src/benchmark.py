@@ -0,0 +1,511 @@
+#!/usr/bin/python
+"""
+benchmark.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Benchmark suite for tennis scoreboard based on MVC architecture.
+
+Times the hot paths of the scoreboard on fixed, generated inputs, so runs are
+reproducible and need no network: scoring points through Model.incrementGameScore,
+replaying whole matches (Model and MatchEngine), Observable callback dispatch (also
+with callback timing enabled), parsing large player lists (setup3.parsePlayers,
+player.parsePlayerString), making Player and Team objects and their scoreboard
+names, setup3.duplicates at growing list sizes, building, saving and opening
+structured rosters and making players from them, building and searching the player
+picker index, and flag GIF decoding. Flag decoding needs a
+display for Tk, and is skipped without one.
+
+Each benchmark reports a rate (work per second, best of several runs). Results are
+compared with a baseline JSON file, and a rate more than the threshold below its
+baseline is a regression: the run exits with status 1. Baselines depend on the
+machine and Python version, so save one on the machine that runs the comparison.
+
+Usage: python benchmark.py [--save] [--baseline file] [--threshold fraction] [--repeat n] [name ...]
+
+Exported functions:
+
+runBenchmarks -- Runs benchmarks, and returns their rates.
+compare -- Compares rates with a baseline, and returns the regressions.
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+sys.path.append('../lib')
+
+from tennisModel import Model
+from matchEngine import MatchEngine
+from observable import Observable
+import observable
+from matchFormat import preset
+import player
+import setup3
+from playerSearch import PlayerIndex
+from rosterStore import Roster, applyChanges
+import util
+from assetCache import AssetCache
+
+defaultBaseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark.json')
+defaultThreshold = 0.25 # Fraction below baseline rate that counts as a regression
+defaultRepeat = 5 # Runs per benchmark, the best is kept
+
+# CPU time of this process, so other load on the machine counts for less (time.clock on Python 2)
+timer = getattr(time, 'process_time', None) or time.clock
+
+seed = 2014
+servePoints = 20000 # Points scored per incrementGameScore run
+matchFormat = preset("Five sets")
+replayMatches = 50 # Matches per replay run
+dispatchSets = 20000 # Observable sets per dispatch run
+subscriberCounts = (1, 10, 100)
+rosterSize = 5000 # Players in the generated roster
+duplicateSizes = (500, 2000, 8000)
+searchRoster = 2000 # Players in the searched roster, about a full ranking list
+searchQueries = ('n', 'na', 'nad', 'nada', 'k', 'ka', 'kar', 'karo', 'vicka', 'ro 100-500', '@FRA', 'zz')
+flagDecodes = 200 # Flag images per decode run
+assetLookups = 200 # Cached flags looked up per asset cache run
+
+def _teams():
+	"""
+	@rtype: list of player.Team
+	@return: Placeholder teams for a benchmark match.
+	"""
+	return [player.Team(player.Player(1, 'First', 'Player', 'USA')), player.Team(player.Player(2, 'Second', 'Player', 'FRA'))]
+
+def _newModel(keepHistory=True):
+	"""
+	@type keepHistory: boolean
+	@param keepHistory: Flag, False to skip undo snapshots.
+	@rtype: tennisModel.Model
+	@return: A five set singles match, ready for the first point.
+	"""
+	m = Model()
+	m.setMensMatch(1)
+	m.setFormat(matchFormat)
+	m.setTeams(_teams())
+	m.server.set(0)
+	m.keepHistory = keepHistory
+	return m
+
+def _matchPoints(rng, serveWin=0.62):
+	"""
+	Plays one match with random points, the server winning each with probability serveWin.
+	@type rng: random.Random
+	@param rng: The random stream.
+	@type serveWin: float
+	@param serveWin: Probability of the server winning a point.
+	@rtype: list of integers
+	@return: The team that won each point.
+	"""
+	m = _newModel(False)
+	points = []
+	while not m.matchOver:
+		server = m.server.get()
+		team = server if rng.random() < serveWin else 1 - server
+		m.incrementGameScore(team)
+		points.append(team)
+	return points
+
+def rosterText(n, rng):
+	"""
+	Generates a player list in the format read by setup3.readPlayers.
+	@type n: integer
+	@param n: Number of players.
+	@type rng: random.Random
+	@param rng: The random stream.
+	@rtype: bytes
+	@return: The player list, UTF-8 encoded.
+	"""
+	syllables = ('ka', 'ro', 'li', 'na', 'vic', 'ova', 'ber', 'ti', 'sch', u'm\u00fc', 'do', u'i\u0107', 'ez', 'an')
+	countries = ('USA', 'FRA', 'ESP', 'SRB', 'CZE', 'GER', 'ARG', 'AUS', 'ROU', 'CHN')
+	def name(parts):
+		return u''.join(rng.choice(syllables) for i in range(parts)).capitalize()
+	lines = [u'{}\t{}, {} ({})'.format(rank, name(rng.randint(2, 4)), name(2), rng.choice(countries))
+		for rank in range(1, n + 1)]
+	return u'\n'.join(lines).encode('utf-8')
+
+def flagGif(width=60, height=40):
+	"""
+	Generates a flag sized GIF image (three vertical stripes), so decoding can be timed offline.
+	The image data is written without compression: a clear code every 100 pixels keeps each
+	LZW code one byte long.
+	@type width: integer
+	@param width: Image width in pixels.
+	@type height: integer
+	@param height: Image height in pixels.
+	@rtype: bytes
+	@return: The GIF file contents.
+	"""
+	palette = bytearray(3 * 128) # Colors 0-2 used, 128 entries for 7-bit pixel codes
+	palette[0:9] = bytearray((0, 85, 164, 255, 255, 255, 239, 65, 53))
+	pixels = [3 * x // width for y in range(height) for x in range(width)]
+	codes = bytearray()
+	for i in range(0, len(pixels), 100):
+		codes.append(128) # Clear code
+		codes.extend(pixels[i:i + 100])
+	codes.append(129) # End of information
+	data = bytearray(b'GIF89a')
+	data += bytearray((width & 255, width >> 8, height & 255, height >> 8, 0xf6, 0, 0)) # Global color table, 128 entries
+	data += palette
+	data += bytearray((0x2c, 0, 0, 0, 0, width & 255, width >> 8, height & 255, height >> 8, 0, 7))
+	for i in range(0, len(codes), 255):
+		block = codes[i:i + 255]
+		data.append(len(block))
+		data += block
+	data += bytearray((0, 0x3b))
+	return bytes(data)
+
+def benchIncrementGameScore(rng):
+	"""Points scored per second through Model.incrementGameScore, with undo history."""
+	serves = [rng.random() < 0.62 for i in range(servePoints)]
+	def run():
+		m = _newModel()
+		for wonByServer in serves:
+			if m.matchOver:
+				m = _newModel()
+			server = m.server.get()
+			m.incrementGameScore(server if wonByServer else 1 - server)
+		return servePoints
+	return run
+
+def benchMatchReplay(rng):
+	"""Whole matches replayed per second through Model (no undo history), as in bulkReplay."""
+	matches = [_matchPoints(rng) for i in range(replayMatches)]
+	def run():
+		for points in matches:
+			m = _newModel(False)
+			for team in points:
+				m.incrementGameScore(team)
+		return len(matches)
+	return run
+
+def benchEngineReplay(rng):
+	"""Points replayed per second through MatchEngine.applyPoints."""
+	matches = [_matchPoints(rng) for i in range(replayMatches)]
+	total = sum(len(points) for points in matches)
+	def run():
+		for points in matches:
+			MatchEngine(format=matchFormat).applyPoints(points)
+		return total
+	return run
+
+def benchObservableDispatch(subscribers, timed=False):
+	"""
+	Returns a benchmark of callbacks run per second by Observable.set.
+	@type subscribers: integer
+	@param subscribers: Number of callbacks on the Observable.
+	@type timed: boolean
+	@param timed: Flag, True to run with callback timing enabled (see observable.enableTiming).
+	@rtype: function
+	@return: The benchmark.
+	"""
+	def bench(rng):
+		o = Observable(0, 'benchmark')
+		for i in range(subscribers):
+			o.addCallback(lambda data: None)
+		def run():
+			if timed:
+				observable.enableTiming()
+			try:
+				for i in range(dispatchSets):
+					o.set(i)
+			finally:
+				if timed:
+					observable.disableTiming()
+			return dispatchSets * subscribers
+		return run
+	bench.__doc__ = "Callbacks run per second by Observable.set, {} subscribers{}.".format(subscribers,
+		", timed" if timed else "")
+	return bench
+
+def benchParsePlayers(rng):
+	"""Players parsed per second from a player list by setup3.parsePlayers."""
+	txt = rosterText(rosterSize, rng)
+	def run():
+		return len(setup3.parsePlayers(txt))
+	return run
+
+def benchParsePlayerString(rng):
+	"""Player strings parsed per second by player.parsePlayerString."""
+	strings = setup3.parsePlayers(rosterText(rosterSize, rng))
+	def run():
+		for s in strings:
+			player.parsePlayerString(s)
+		return len(strings)
+	return run
+
+def benchPlayerBuild(rng):
+	"""Players made per second from player strings, as player.Player objects in doubles teams."""
+	props = [player.parsePlayerString(s) for s in setup3.parsePlayers(rosterText(rosterSize, rng))]
+	def run():
+		players = [player.Player(*p) for p in props]
+		[player.Team(players[i], players[i + 1]) for i in range(0, len(players) - 1, 2)]
+		return len(players)
+	return run
+
+def benchTeamNames(rng):
+	"""Scoreboard and button names per second from player.Team, as asked for by the Controller."""
+	strings = setup3.parsePlayers(rosterText(searchRoster, rng))
+	players = [player.Player(*player.parsePlayerString(s)) for s in strings[:200]]
+	teams = [player.Team(players[i], players[i + 1]) for i in range(0, len(players), 2)]
+	dups = setup3.duplicates(strings)
+	special = [('Pliskova', 'K')]
+	def run():
+		for i in range(20):
+			for team in teams:
+				team.scoreName(dups, special)
+				team.scoreName(dups, special)
+				team.buttonName(dups, special)
+		return 20 * 3 * len(teams)
+	return run
+
+def benchDuplicates(size):
+	"""
+	Returns a benchmark of players checked per second by setup3.duplicates.
+	@type size: integer
+	@param size: Number of players in the list.
+	@rtype: function
+	@return: The benchmark.
+	"""
+	def bench(rng):
+		strings = setup3.parsePlayers(rosterText(size, rng))
+		def run():
+			setup3.duplicates(strings)
+			return size
+		return run
+	bench.__doc__ = "Players checked per second by setup3.duplicates, {} players.".format(size)
+	return bench
+
+def benchRosterBuild(rng):
+	"""Players per second made into a rosterStore.Roster from a player list."""
+	txt = rosterText(rosterSize, rng)
+	def run():
+		return len(Roster.fromText(txt))
+	return run
+
+def benchRosterOpen(rng):
+	"""Saved rosterStore.Roster files opened per second, each with a lookup by rank."""
+	path = os.path.join(tempfile.gettempdir(), 'benchmark.roster')
+	Roster.fromText(rosterText(rosterSize, rng)).save(path)
+	def run():
+		for i in range(100):
+			roster = Roster.open(path)
+			roster.record(roster.ids(rosterSize // 2)[0])
+		return 100
+	return run
+
+def benchRosterUpdate(rng):
+	"""
+	Players per second brought up to date by rosterStore.applyChanges, for a new week's list:
+	a new player near the top, moving everyone below down one.
+	"""
+	oldTxt = rosterText(rosterSize, rng)
+	lines = oldTxt.split(b'\n')
+	lines.insert(10, b'11\tJohnson, Steve (USA)')
+	for i in range(11, len(lines)):
+		lines[i] = str(i + 1).encode('ascii') + b'\t' + lines[i].partition(b'\t')[2]
+	newTxt = b'\n'.join(lines)
+	roster = Roster.fromText(oldTxt)
+	def run():
+		return len(applyChanges(roster, oldTxt, newTxt)[0])
+	return run
+
+def benchRosterPlayer(rng):
+	"""Players per second made from roster ids by rosterStore.Roster.player, as for a match."""
+	roster = Roster.fromText(rosterText(rosterSize, rng))
+	def run():
+		for id in range(len(roster)):
+			roster.player(id)
+		return len(roster)
+	return run
+
+def benchPlayerIndexBuild(rng):
+	"""Players indexed per second by playerSearch.PlayerIndex (first name search)."""
+	roster = Roster.fromText(rosterText(searchRoster, rng))
+	def run():
+		PlayerIndex(roster).search('a')
+		return len(roster)
+	return run
+
+def benchPlayerSearch(rng):
+	"""Queries answered per second by playerSearch.PlayerIndex.searchIds, as typed into a player picker."""
+	index = PlayerIndex(Roster.fromText(rosterText(searchRoster, rng)))
+	index.search('a') # Built before timing
+	def run():
+		for i in range(20):
+			for query in searchQueries:
+				index.searchIds(query, setup3.pickerRows)
+		return 20 * len(searchQueries)
+	return run
+
+def benchAssetHit(rng):
+	"""Flags per second read from a warm assetCache.AssetCache, as when a scoreboard is made again."""
+	cache = AssetCache(os.path.join(tempfile.gettempdir(), 'benchmark.assets'))
+	urls = ['http://flags.invalid/{}.gif'.format(i) for i in range(8)]
+	for url in urls:
+		cache._store(url, flagGif(), None, None)
+	def run():
+		for i in range(assetLookups):
+			cache.get(urls[i % len(urls)])
+		return assetLookups
+	return run
+
+def benchFlagDecode(rng):
+	"""Flag GIF images decoded per second by util.gifImage. Needs a display."""
+	try:
+		root = util.tk.Tk()
+	except util.tk.TclError:
+		return None # No display
+	root.withdraw()
+	data = flagGif()
+	def run():
+		for i in range(flagDecodes):
+			util.gifImage(data)
+		return flagDecodes
+	return run
+
+# (name, unit, benchmark). A benchmark takes a random stream for its inputs, and returns the
+# function to time (which returns the amount of work done), or None if it can not run here.
+benchmarks = ([
+	('incrementGameScore', 'points/s', benchIncrementGameScore),
+	('matchReplay', 'matches/s', benchMatchReplay),
+	('engineReplay', 'points/s', benchEngineReplay)] +
+	[('observableDispatch{}'.format(n), 'callbacks/s', benchObservableDispatch(n)) for n in subscriberCounts] +
+	[('observableDispatchTimed10', 'callbacks/s', benchObservableDispatch(10, True))] +
+	[('parsePlayers', 'players/s', benchParsePlayers),
+	('parsePlayerString', 'players/s', benchParsePlayerString),
+	('playerBuild', 'players/s', benchPlayerBuild),
+	('teamNames', 'names/s', benchTeamNames)] +
+	[('duplicates{}'.format(n), 'players/s', benchDuplicates(n)) for n in duplicateSizes] +
+	[('rosterBuild', 'players/s', benchRosterBuild),
+	('rosterOpen', 'opens/s', benchRosterOpen),
+	('rosterPlayer', 'players/s', benchRosterPlayer),
+	('rosterUpdate', 'players/s', benchRosterUpdate),
+	('playerIndexBuild', 'players/s', benchPlayerIndexBuild),
+	('playerSearch', 'queries/s', benchPlayerSearch)] +
+	[('assetHit', 'flags/s', benchAssetHit),
+	('flagDecode', 'images/s', benchFlagDecode)])
+
+def runBenchmarks(names=None, repeat=defaultRepeat, report=None):
+	"""
+	Runs benchmarks, and returns their rates.
+	@type names: list of strings
+	@param names: The benchmarks to run. If None (or empty), all of them.
+	@type repeat: integer
+	@param repeat: Runs per benchmark, the best is kept.
+	@type report: function
+	@param report: Called with (name, rate, unit) after each benchmark (rate None if skipped), or None.
+	@rtype: dictionary
+	@return: Name to {'rate': work per second, 'unit': unit}, for each benchmark that ran.
+	"""
+	results = {}
+	for (name, unit, bench) in benchmarks:
+		if names and name not in names:
+			continue
+		run = bench(random.Random(seed)) # Same inputs every time
+		if run is None:
+			if report is not None:
+				report(name, None, unit)
+			continue
+		best = None
+		for i in range(repeat):
+			start = timer()
+			work = run()
+			elapsed = timer() - start
+			if best is None or elapsed < best:
+				best = elapsed
+		rate = work / best if best > 0 else float('inf')
+		results[name] = {'rate': rate, 'unit': unit}
+		if report is not None:
+			report(name, rate, unit)
+	return results
+
+def compare(results, baseline, threshold=defaultThreshold):
+	"""
+	Compares rates with a baseline, and returns the regressions. Benchmarks missing from either are ignored.
+	@type results: dictionary
+	@param results: The rates, as returned by runBenchmarks.
+	@type baseline: dictionary
+	@param baseline: The baseline rates, in the same form.
+	@type threshold: float
+	@param threshold: Fraction below the baseline rate that counts as a regression.
+	@rtype: list of tuples
+	@return: (name, rate, baseline rate) for each regression.
+	"""
+	regressions = []
+	for (name, result) in sorted(results.items()):
+		base = baseline.get(name)
+		if base is not None and result['rate'] < base['rate'] * (1.0 - threshold):
+			regressions.append((name, result['rate'], base['rate']))
+	return regressions
+
+def environment():
+	"""
+	@rtype: dictionary
+	@return: The Python version and platform, stored with a baseline.
+	"""
+	return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+		'platform': platform.platform()}
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Benchmark the tennis scoreboard hot paths.")
+	parser.add_argument('names', nargs='*', help="benchmarks to run (default all)")
+	parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+	parser.add_argument('--baseline', default=defaultBaseline, help="baseline JSON file")
+	parser.add_argument('--threshold', type=float, default=defaultThreshold, help="regression threshold (fraction)")
+	parser.add_argument('--repeat', type=int, default=defaultRepeat, help="runs per benchmark")
+	args = parser.parse_args()
+	unknown = set(args.names) - set(name for (name, unit, bench) in benchmarks)
+	if unknown:
+		print("Unknown benchmarks: {}".format(', '.join(sorted(unknown))))
+		sys.exit(2)
+
+	baseline = {}
+	if os.path.exists(args.baseline) and not args.save:
+		with open(args.baseline) as f:
+			stored = json.load(f)
+		baseline = stored['results']
+		if stored.get('environment') != environment():
+			print("Note: baseline is from a different environment: {}".format(stored.get('environment')))
+
+	def report(name, rate, unit):
+		if rate is None:
+			print("{:<22} skipped (needs a display)".format(name))
+			return
+		line = "{:<22} {:>14,.0f} {:<12}".format(name, rate, unit)
+		if name in baseline:
+			line += " {:+7.1%} vs baseline".format(rate / baseline[name]['rate'] - 1.0)
+		print(line)
+	results = runBenchmarks(args.names, args.repeat, report)
+
+	if args.save:
+		if args.names and os.path.exists(args.baseline): # Update only the benchmarks run
+			with open(args.baseline) as f:
+				stored = json.load(f)['results']
+			stored.update(results)
+			results = stored
+		with open(args.baseline, 'w') as f:
+			json.dump({'environment': environment(), 'results': results}, f, indent=1, sort_keys=True)
+			f.write('\n')
+		print("Baseline saved to {}".format(args.baseline))
+	elif baseline:
+		regressions = compare(results, baseline, args.threshold)
+		for (name, rate, base) in regressions:
+			print("REGRESSION {}: {:,.0f} vs baseline {:,.0f} ({:+.1%})".format(name, rate, base, rate / base - 1.0))
+		if regressions:
+			sys.exit(1)
+		print("No regressions (threshold {:.0%})".format(args.threshold))
+	else:
+		print("No baseline at {}; run with --save to store one.".format(args.baseline))
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+"""
+bulkReplay.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Bulk replay of point-by-point archives for tennis scoreboard based on MVC architecture.
+
+Reads matches in the CSV layout of Jeff Sackmann's tennis_pointbypoint data (columns
+pbp_id, server1, server2, winner, pbp, ...), replays each one through tennisModel.Model,
+and writes one CSV row of statistics per match. In the pbp string, S / A is a point won
+by the server, R / D a point won by the receiver; ';' ends a game, '.' a set, and '/'
+marks a tiebreak change of server. Player 1 (server1) serves first.
+
+Input is read lazily and handed to a process pool in chunks, with only a few chunks in
+flight at a time, and output rows are written as each chunk comes back, in input order.
+Memory stays flat however large the archive is.
+
+Usage: python bulkReplay.py input.csv output.csv [processes]
+
+Exported functions:
+
+setWinners -- Returns the winner of each set of a pbp string.
+matchFormat -- Works out the match format from a pbp string.
+replayMatch -- Replays one match, and returns its statistics.
+replayFile -- Replays every match in a CSV file, writing statistics to another.
+"""
+
+import csv
+import sys
+import itertools
+import multiprocessing
+from collections import deque
+
+from tennisModel import Model
+from matchFormat import MatchFormat
+import player
+
+chunkSize = 200 # Matches per task
+serverWon = {'S': True, 'A': True, 'R': False, 'D': False}
+
+# Per player statistics, taken from matchStats.Counts (whole match), then from matchStats.MatchStats
+countColumns = ('servePoints', 'servePointsWon', 'breakPointsFaced', 'breakPointsSaved', 'serviceGames',
+	'serviceGamesWon', 'setPoints', 'matchPoints', 'tiebreaksWon')
+runColumns = ('longestPointRun', 'longestGameRun')
+
+statColumns = (('pbp_id', 'winner', 'score', 'points', 'deuces', 'tiebreaks') +
+	tuple(name + str(team + 1) for name in countColumns + runColumns for team in (0, 1)) + ('consistent',))
+
+def setWinners(sets):
+	"""
+	Returns the winner of each set, from the last point of the set and who served it.
+	Games alternate serve from player 1, a tiebreak counting as one game; within a tiebreak,
+	serve changes after the first point and then every two points.
+	@type sets: list of strings
+	@param sets: The pbp string of each set.
+	@rtype: list of integers
+	@return: The winning player (0 or 1) of each set.
+	"""
+	winners = []
+	game = 0 # Games played before the current one
+	for s in sets:
+		games = s.split(';')
+		game += len(games) - 1
+		last = games[-1]
+		points = [c for c in last if c in serverWon]
+		server = game % 2
+		if '/' in last: # Tiebreak
+			server = (server + len(points) // 2) % 2
+		winners.append(server if serverWon[points[-1]] else 1 - server)
+		game += 1
+	return winners
+
+def matchFormat(pbp):
+	"""
+	Works out the match format from a pbp string.
+	A final set of more than 12 games with no tiebreak ('/') was an advantage deciding set, so the
+	number of sets played is the match length. Otherwise four or five sets is best of five, two is
+	best of three, and three is best of five only if one player won all three. (A deciding set that
+	never reached six all plays the same under either final set rule.)
+	@type pbp: string
+	@param pbp: The point-by-point string.
+	@rtype: matchFormat.MatchFormat
+	@return: The format.
+	"""
+	sets = pbp.rstrip('.').split('.')
+	finalSet = sets[-1]
+	if '/' not in finalSet and finalSet.count(';') + 1 > 12:
+		return MatchFormat(len(sets) // 2 + 1, finalTiebreakAt=0)
+	if len(sets) > 3 or (len(sets) == 3 and len(set(setWinners(sets))) == 1):
+		return MatchFormat(3)
+	return MatchFormat(2)
+
+def replayMatch(pbpId, pbp, winner=None):
+	"""
+	Replays one match, and returns its statistics.
+	@type pbpId: string
+	@param pbpId: The match identifier.
+	@type pbp: string
+	@param pbp: The point-by-point string.
+	@type winner: string
+	@param winner: The winner given in the archive ('1' or '2'), to check the replay against, or None.
+	@rtype: list
+	@return: One value per column in statColumns, see matchStats for the per player statistics.
+	"""
+	m = Model()
+	m.setFormat(matchFormat(pbp))
+	m.setTeams([player.Team(player.Player(1, '', 'Player 1', '')), player.Team(player.Player(2, '', 'Player 2', ''))])
+	m.server.set(0)
+	m.keepHistory = False # No undo here
+	points = 0
+	deuces = 0
+	consistent = True
+	for c in pbp:
+		if c not in serverWon:
+			continue
+		if m.matchOver:
+			consistent = False # Points left over after the match was won
+			break
+		server = m.server.get()
+		m.incrementGameScore(server if serverWon[c] else 1 - server)
+		points += 1
+		if not m.tiebreak.get() and m.gameScore.get() == (3, 3):
+			deuces += 1
+	w = m.winner.get()
+	if w < 0 or (winner is not None and str(w + 1) != winner.strip()):
+		consistent = False
+	setScores = m.setScore.get()[:m.currentSet.get() + 1]
+	score = ' '.join('{}-{}'.format(s[0], s[1]) for s in setScores if s != (0, 0))
+	row = [pbpId, w + 1 if w >= 0 else '', score, points, deuces, m.stats.total.tiebreaks()]
+	for name in countColumns:
+		row.extend(getattr(m.stats.total, name))
+	for name in runColumns:
+		row.extend(getattr(m.stats, name))
+	row.append(int(consistent))
+	return row
+
+def _replayChunk(matches):
+	"""
+	Replays a chunk of matches. Module level, so it can run in a worker process.
+	@type matches: list of tuples
+	@param matches: (pbp_id, pbp, winner) for each match.
+	@rtype: list of lists
+	@return: Statistics rows, see replayMatch.
+	"""
+	return [replayMatch(*match) for match in matches]
+
+def _openCsv(path, mode):
+	"""
+	Opens a file for the csv module: binary on Python 2, text without newline translation on
+	Python 3. Otherwise Windows writes each line ending with a doubled carriage return.
+	@type path: string
+	@param path: The file.
+	@type mode: string
+	@param mode: 'r' or 'w'.
+	@rtype: file object
+	@return: The open file.
+	"""
+	if sys.version_info[0] < 3:
+		return open(path, mode + 'b')
+	return open(path, mode, newline='')
+
+def readMatches(f):
+	"""
+	Yields the matches in a CSV file, one at a time.
+	@type f: file object
+	@param f: The open CSV file, with a header row.
+	@rtype: generator of tuples
+	@return: (pbp_id, pbp, winner) for each match.
+	"""
+	for row in csv.DictReader(f):
+		yield (row['pbp_id'], row['pbp'], row.get('winner'))
+
+def chunks(iterable, n):
+	"""
+	Yields lists of up to n items from an iterable, reading it lazily.
+	@type iterable: iterable
+	@param iterable: The items.
+	@type n: integer
+	@param n: The number of items per list.
+	@rtype: generator of lists
+	@return: The lists of items.
+	"""
+	it = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(it, n))
+		if not chunk:
+			return
+		yield chunk
+
+def replayFile(inPath, outPath, processes=None):
+	"""
+	Replays every match in a CSV file, writing statistics to another.
+	@type inPath: string
+	@param inPath: The point-by-point CSV file.
+	@type outPath: string
+	@param outPath: The statistics CSV file to write, one row per match, in input order.
+	@type processes: integer
+	@param processes: Number of worker processes. If None, one per core. 1 runs in this process.
+	@rtype: integer
+	@return: The number of matches replayed.
+	"""
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	count = 0
+	with _openCsv(inPath, 'r') as fin, _openCsv(outPath, 'w') as fout:
+		out = csv.writer(fout, lineterminator='\n')
+		out.writerow(statColumns)
+		work = chunks(readMatches(fin), chunkSize)
+		if processes <= 1:
+			for chunk in work:
+				rows = _replayChunk(chunk)
+				out.writerows(rows)
+				count += len(rows)
+			return count
+		pool = multiprocessing.Pool(processes)
+		try:
+			# Keep a few chunks per process in flight. Pool.imap would read the whole input ahead.
+			pending = deque()
+			for chunk in work:
+				pending.append(pool.apply_async(_replayChunk, (chunk,)))
+				if len(pending) >= 2 * processes:
+					rows = pending.popleft().get()
+					out.writerows(rows)
+					count += len(rows)
+			while pending:
+				rows = pending.popleft().get()
+				out.writerows(rows)
+				count += len(rows)
+		finally:
+			pool.close()
+			pool.join()
+	return count
+
+if __name__ == '__main__':
+	import time
+	if len(sys.argv) not in (3, 4):
+		print("\nUsage: python bulkReplay.py input.csv output.csv [processes]\n")
+		sys.exit(1)
+	start = time.time()
+	n = replayFile(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) == 4 else None)
+	elapsed = time.time() - start
+	print("Replayed {} matches in {:.1f} s ({:.0f} matches/s)".format(n, elapsed, n / elapsed if elapsed > 0 else 0))
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+"""
+matchEngine.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Headless match engine for tennis scoreboard based on MVC architecture.
+
+Applies whole point sequences using the same scoring rules as tennisModel.Model,
+but without Tk, Observable callbacks, debug output, or message generation.
+Intended for bulk replay of archived matches. States are matchState.MatchState values.
+
+Exported classes:
+
+MatchEngine -- Advances a tennis match from a sequence of point winners.
+"""
+
+from matchState import MatchState, maxSets, gameShift, gameBits, pointBits, pointMask, matchShift, setBits, \
+	currentSetShift, serverShift, tiebreakShift, tiebreakToWinShift, winnerShift
+from scoringTables import tiebreakKey, setKey, rulesFor, pack, unpack, \
+	GAME_WON, SET_WON, ENTER_TIEBREAK, SERVER_CHANGE, MATCH_WON, MATCH_TIEBREAK
+import matchFormat
+
+class MatchEngine:
+	"""Advances a tennis match from a sequence of point winners."""
+	def __init__(self, numberOfSets=3, doublesMatch=False, noEndingTiebreak=False, winSets=None, server=0, format=None):
+		"""
+		@type numberOfSets: integer
+		@param numberOfSets: Number of sets in the match (2 for doubles with final 10-point tiebreak, 3, or 5).
+		@type doublesMatch: boolean
+		@param doublesMatch: Flag, True if this is a doubles match.
+		@type noEndingTiebreak: boolean
+		@param noEndingTiebreak: Flag, True if final set can NOT end with a tiebreak.
+		@type winSets: integer
+		@param winSets: Number of sets needed to win. If None, derived from numberOfSets as in tennisScore.Controller.startMatch.
+		@type server: integer
+		@param server: The team serving first.
+		@type format: matchFormat.MatchFormat
+		@param format: The match format. If None, worked out from the other arguments, as by tennisModel.Model.
+		"""
+		if format is None:
+			format = matchFormat.fromLegacy(numberOfSets, doublesMatch, noEndingTiebreak, winSets)
+		self.format = format
+		self.rules = rulesFor(format)
+		self.reset(server)
+
+	@classmethod
+	def fromModel(cls, model):
+		"""
+		Creates an engine holding the configuration and current state of a Model.
+		@type model: tennisModel.Model
+		@param model: The Model to copy.
+		@rtype: MatchEngine
+		@return: An engine positioned at the Model's current score.
+		"""
+		engine = cls(format=model.getFormat())
+		engine.setState(MatchState.fromModel(model))
+		return engine
+
+	def reset(self, server=0):
+		"""
+		Resets the engine to the start of a match.
+		@type server: integer
+		@param server: The team serving first.
+		"""
+		self.gameScore = [0,0]
+		self.games = [0,0] * maxSets # Flattened set score, games for set i are at [2*i] and [2*i+1]
+		self.currentSet = 0
+		self.matchScore = [0,0]
+		self.server = server
+		self.tiebreak = False
+		self.tiebreakToWin = self.rules.tiebreakTargets[0]
+		self.winner = -1
+		self.pointsPlayed = 0
+
+	def matchOver(self):
+		"""
+		Returns whether the match has been won.
+		@rtype: boolean
+		@return: Flag, True if the match has been won.
+		"""
+		return self.winner >= 0
+
+	def getState(self):
+		"""
+		Returns the current match position.
+		@rtype: MatchState
+		@return: The current match position.
+		"""
+		g = self.games
+		return MatchState.fromFields(self.gameScore, [(g[i],g[i+1]) for i in range(0, 2*maxSets, 2)],
+			self.currentSet, self.matchScore, self.server, self.tiebreak, self.tiebreakToWin, self.winner)
+
+	def setState(self, state):
+		"""
+		Positions the engine at the given match position.
+		@type state: MatchState
+		@param state: The match position.
+		"""
+		self.gameScore = list(state.gameScore)
+		self.games = [g for s in state.setScore for g in s]
+		self.currentSet = state.currentSet
+		self.matchScore = list(state.matchScore)
+		self.server = state.server
+		self.tiebreak = state.tiebreak
+		self.tiebreakToWin = state.tiebreakToWin
+		self.winner = state.winner
+
+	def applyPoint(self, team):
+		"""
+		Applies a single point.
+		@type team: integer
+		@param team: The team that won the point.
+		"""
+		self.applyPoints((team,))
+
+	def applyPoints(self, points, snapshots=False):
+		"""
+		Applies a sequence of points. Points after the end of the match are ignored.
+		@type points: iterable of integers
+		@param points: Winner (0 or 1) of each point, in order.
+		@type snapshots: boolean
+		@param snapshots: Flag, True to also return the state after every point.
+		@rtype: tuple
+		@return: (final state, list of per-point states or None). Per-point states are packed
+			integers; wrap them in MatchState to read the fields.
+		"""
+		# Point application is table lookups in scoringTables.
+		# Everything is held in locals for speed and written back once at the end.
+		gs = pack(self.gameScore[0], self.gameScore[1]) # Game score packed as in MatchState
+		games = self.games
+		cur = self.currentSet
+		m0, m1 = self.matchScore
+		server = self.server
+		tb = self.tiebreak
+		tbWin = self.tiebreakToWin
+		winner = self.winner
+		rules = self.rules
+		gameNext = rules.gameNext
+		# The current set's tables. The final set's rule is just a different table in the last slot.
+		setTab = rules.setTables[cur]
+		setLimit = rules.setLimits[cur]
+		tbTab = rules.tiebreakTables[cur]
+		tbTarget = rules.tiebreakTargets[cur]
+		tbLimit = pack(0, tbTarget - 1) # Below this, the receiving side of the packed score is not close to winning
+		matchTab = rules.matchTable
+		inc = (1, 1 << pointBits)
+		snaps = [] if snapshots else None
+		if snapshots:
+			# Set games, packed as in MatchState. Kept up to date as games are won.
+			packedGames = 0
+			for i in range(2*maxSets):
+				packedGames |= games[i] << (gameShift + i*gameBits)
+		n = 0
+		for team in points:
+			if winner >= 0:
+				break
+			n += 1
+			setWon = False
+			if not tb:
+				gs = gameNext[team][gs]
+				if gs < 0:
+					gs = 0
+					# Game won, increment the set score
+					k = 2*cur
+					e = setTab[(setKey(games[k], games[k+1], setLimit) << 1) | team]
+					games[k+team] += 1
+					if snapshots:
+						packedGames += 1 << (gameShift + (k+team)*gameBits)
+					if e & SET_WON:
+						setWon = True
+					elif e & ENTER_TIEBREAK:
+						tb = True
+						tbWin = tbTarget
+					if e & SERVER_CHANGE:
+						server = 1 if server == 0 else 0
+			else:
+				if gs < tbLimit: # Second team is short of game point, so the score is within the table
+					e = tbTab[(gs << 1) | team]
+				else:
+					e = tbTab[(tiebreakKey(gs & pointMask, gs >> pointBits, tbTarget) << 1) | team]
+				if e & SERVER_CHANGE:
+					server = 1 if server == 0 else 0
+				if e & GAME_WON:
+					# Tiebreak won, which also wins the set
+					gs = 0
+					games[2*cur+team] += 1
+					if snapshots:
+						packedGames += 1 << (gameShift + (2*cur+team)*gameBits)
+					tb = False
+					setWon = True
+				else:
+					gs += inc[team]
+			if setWon:
+				e = matchTab[((m0 | (m1 << pointBits)) << 1) | team]
+				if team:
+					m1 += 1
+				else:
+					m0 += 1
+				if e & MATCH_WON:
+					# The set winning team has won the match
+					winner = team
+					server = -1
+				else:
+					cur += 1
+					setTab = rules.setTables[cur]
+					setLimit = rules.setLimits[cur]
+					tbTab = rules.tiebreakTables[cur]
+					tbTarget = rules.tiebreakTargets[cur]
+					tbLimit = pack(0, tbTarget - 1)
+					if e & MATCH_TIEBREAK:
+						# Sets are level, so now it is the match tiebreak
+						tb = True
+						tbWin = tbTarget
+			if snapshots:
+				snaps.append(gs | packedGames | (m0 << matchShift) | (m1 << (matchShift + setBits)) |
+					(cur << currentSetShift) | ((server + 1) << serverShift) | (tb << tiebreakShift) |
+					(tbWin << tiebreakToWinShift) | ((winner + 1) << winnerShift))
+		self.gameScore = unpack(gs)
+		self.currentSet = cur
+		self.matchScore = [m0,m1]
+		self.server = server
+		self.tiebreak = tb
+		self.tiebreakToWin = tbWin
+		self.winner = winner
+		self.pointsPlayed += n
+		return (self.getState(), snaps)
+
+	def toModel(self, model):
+		"""
+		Writes the engine's current state into a Model, as one batch of Observable changes.
+		Message text and point counters are left unchanged.
+		@type model: tennisModel.Model
+		@param model: The Model to update.
+		"""
+		self.getState().toModel(model)
+
+if __name__ == '__main__':
+	import time
+	import random
+	engine = MatchEngine(numberOfSets=5)
+	print(repr(engine.applyPoints([0]*72)[0]))
+	rng = random.Random(1)
+	points = [rng.randrange(2) for i in range(1000000)]
+	count = 0
+	start = time.time()
+	i = 0
+	while i < len(points):
+		engine.reset()
+		engine.applyPoints(points[i:i+400])
+		count += engine.pointsPlayed
+		i += engine.pointsPlayed
+	elapsed = time.time() - start
+	print("{} points in {:.3f} s, {:.0f} points/s".format(count, elapsed, count/elapsed))
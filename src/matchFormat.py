@@ -0,0 +1,174 @@
+#!/usr/bin/python
+"""
+matchFormat.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Declarative match formats for tennis scoreboard based on MVC architecture.
+
+A MatchFormat says how a match is scored: sets to win, games per set, advantage or
+no-ad games, when a set goes to a tiebreak and how long the tiebreak is, and the rule
+for the final set (same as the others, played out on advantage, a different tiebreak,
+or replaced by a match tiebreak). Formats are plain immutable values; compile one with
+scoringTables.rulesFor to get the tables the Model, MatchEngine, simulator and
+WinProbability run on.
+
+Exported classes:
+
+MatchFormat -- How a match is scored.
+
+Exported functions:
+
+fromLegacy -- Returns the format given by the original setup fields.
+preset -- Returns a named format.
+"""
+
+from collections import namedtuple
+
+from matchState import maxSets, gameMask, tiebreakToWinMask
+
+_fields = ('winSets', 'gamesPerSet', 'advantage', 'tiebreakAt', 'tiebreakTarget', 'tiebreakMargin',
+	'finalTiebreakAt', 'finalTiebreakTarget', 'matchTiebreak')
+
+class MatchFormat(namedtuple('MatchFormat', _fields)):
+	"""How a match is scored. Immutable and hashable, so compiled rules can be cached by format."""
+	__slots__ = ()
+
+	def __new__(cls, winSets=2, gamesPerSet=6, advantage=True, tiebreakAt=6, tiebreakTarget=7, tiebreakMargin=2,
+			finalTiebreakAt=None, finalTiebreakTarget=None, matchTiebreak=0):
+		"""
+		@type winSets: integer
+		@param winSets: Number of sets needed to win (1 to 3).
+		@type gamesPerSet: integer
+		@param gamesPerSet: Games needed to win a set, by two clear unless it goes to a tiebreak.
+		@type advantage: boolean
+		@param advantage: Flag, True for advantage games, False for no-ad (a deciding point at deuce).
+		@type tiebreakAt: integer
+		@param tiebreakAt: Games all at which a set goes to a tiebreak, or 0 for advantage sets.
+		@type tiebreakTarget: integer
+		@param tiebreakTarget: Points needed to win a tiebreak.
+		@type tiebreakMargin: integer
+		@param tiebreakMargin: Lead needed to win a tiebreak: 2, or 1 for a deciding point at one short of the target all.
+		@type finalTiebreakAt: integer
+		@param finalTiebreakAt: As tiebreakAt, for the final set. If None, the same as the other sets.
+		@type finalTiebreakTarget: integer
+		@param finalTiebreakTarget: As tiebreakTarget, for the final set's tiebreak. If None, the same as the other sets.
+		@type matchTiebreak: integer
+		@param matchTiebreak: If not 0, the final set is replaced by a tiebreak to this many points (by two clear).
+		@raise ValueError: If the format can not be scored (or held in a matchState.MatchState).
+		"""
+		if finalTiebreakAt is None:
+			finalTiebreakAt = tiebreakAt
+		if finalTiebreakTarget is None:
+			finalTiebreakTarget = tiebreakTarget
+		self = super(MatchFormat, cls).__new__(cls, winSets, gamesPerSet, bool(advantage), tiebreakAt,
+			tiebreakTarget, tiebreakMargin, finalTiebreakAt, finalTiebreakTarget, matchTiebreak)
+		if not 1 <= winSets or 2*winSets - 1 > maxSets:
+			raise ValueError("Sets to win must be 1 to {}: {}".format((maxSets + 1) // 2, winSets))
+		if not 1 <= gamesPerSet < gameMask - 1:
+			raise ValueError("Games per set out of range: {}".format(gamesPerSet))
+		for at in (tiebreakAt, finalTiebreakAt):
+			if not 0 <= at < gameMask - 1:
+				raise ValueError("Tiebreak games out of range: {}".format(at))
+		for target in (tiebreakTarget, finalTiebreakTarget, matchTiebreak or 1):
+			if not 1 <= target <= tiebreakToWinMask:
+				raise ValueError("Tiebreak points out of range: {}".format(target))
+		if tiebreakMargin not in (1, 2):
+			raise ValueError("Tiebreak margin must be 1 or 2: {}".format(tiebreakMargin))
+		return self
+
+	def maxSets(self):
+		"""
+		@rtype: integer
+		@return: The most sets that can be played, counting a match tiebreak as a set.
+		"""
+		return 2*self.winSets - 1
+
+	def numberOfSets(self):
+		"""
+		@rtype: integer
+		@return: The most full sets that can be played (e.g. 2 for two sets and a match tiebreak).
+		"""
+		return self.maxSets() - 1 if self.matchTiebreak else self.maxSets()
+
+	def replace(self, **fields):
+		"""
+		Returns a copy with some fields changed.
+		@rtype: MatchFormat
+		@return: The new format.
+		"""
+		return self._replace(**fields)
+
+	def toDict(self):
+		"""
+		@rtype: dictionary
+		@return: The fields, as plain (JSON serializable) values. MatchFormat(**d) recreates the format.
+		"""
+		return dict(zip(self._fields, self))
+
+	def __repr__(self):
+		"""
+		Provides detailed representation of a MatchFormat object.
+		@rtype: string
+		@return: Detailed representation of a MatchFormat object.
+		"""
+		return "MatchFormat({})".format(", ".join("{}={!r}".format(k, v) for (k, v) in zip(self._fields, self)))
+
+def fromLegacy(numberOfSets, doublesMatch=False, noEndingTiebreak=False, winSets=None):
+	"""
+	Returns the format given by the original setup fields of tennisModel.Model.
+	@type numberOfSets: integer
+	@param numberOfSets: Number of sets in the match (2 for doubles with final 10-point tiebreak, 3, or 5).
+	@type doublesMatch: boolean
+	@param doublesMatch: Flag, True if this is a doubles match.
+	@type noEndingTiebreak: boolean
+	@param noEndingTiebreak: Flag, True if the final set of a singles match can NOT end with a tiebreak.
+	@type winSets: integer
+	@param winSets: Number of sets needed to win. If None (or 0), derived from numberOfSets.
+	@rtype: MatchFormat
+	@return: The format.
+	"""
+	if not winSets:
+		winSets = 2 if doublesMatch or numberOfSets == 3 else 3
+	return MatchFormat(winSets,
+		finalTiebreakAt=0 if noEndingTiebreak and not doublesMatch else None,
+		matchTiebreak=10 if doublesMatch and numberOfSets == 2 else 0)
+
+# Named formats, in the order offered by the setup dialog
+presets = (
+	("Three sets", MatchFormat(2)),
+	("Five sets", MatchFormat(3)),
+	("Three sets, final set tiebreak to 10", MatchFormat(2, finalTiebreakTarget=10)),
+	("Five sets, final set tiebreak to 10", MatchFormat(3, finalTiebreakTarget=10)),
+	("Five sets, final set tiebreak at 12 all", MatchFormat(3, finalTiebreakAt=12)),
+	("Three sets, final set advantage", MatchFormat(2, finalTiebreakAt=0)),
+	("Five sets, final set advantage", MatchFormat(3, finalTiebreakAt=0)),
+	("Two sets + tiebreak", MatchFormat(2, matchTiebreak=10)),
+	("No-ad, two sets + tiebreak", MatchFormat(2, advantage=False, matchTiebreak=10)),
+	("Short sets", MatchFormat(2, gamesPerSet=4, tiebreakAt=4, matchTiebreak=10)),
+	("Fast4", MatchFormat(3, gamesPerSet=4, advantage=False, tiebreakAt=3, tiebreakTarget=5, tiebreakMargin=1)))
+
+def preset(name):
+	"""
+	Returns a named format.
+	@type name: string
+	@param name: The name, as in presets.
+	@rtype: MatchFormat
+	@return: The format.
+	@raise KeyError: If there is no such format.
+	"""
+	for (n, f) in presets:
+		if n == name:
+			return f
+	raise KeyError(name)
+
+if __name__ == '__main__':
+	for (name, f) in presets:
+		print("{}: {}".format(name, repr(f)))
+	print(repr(fromLegacy(5, noEndingTiebreak=True)))
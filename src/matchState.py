@@ -0,0 +1,207 @@
+#!/usr/bin/python
+"""
+matchState.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Compact, immutable match position for tennis scoreboard based on MVC architecture.
+
+The whole position held by tennisModel.Model (game score, games in each set, sets,
+current set, server, tiebreak flag, tiebreak target, winner) is packed into a single
+integer. States are hashable, so they can key memo tables, and a per-point snapshot
+costs one integer.
+
+Exported classes:
+
+MatchState -- A match position packed into an integer.
+
+Exported functions:
+
+encode -- Packs match position fields into an integer.
+"""
+
+try:
+	_int = long # Python 2: a packed state can need more than a machine word
+except NameError:
+	_int = int # Python 3
+
+maxSets = 5 # Most set entries held by tennisModel.Model.setScore (best of five)
+
+# Field widths (bits). Game points allow long tiebreaks, set games allow long final sets without a tiebreak.
+pointBits = 7
+gameBits = 7
+setBits = 2
+currentSetBits = 3
+serverBits = 2
+tiebreakBits = 1
+tiebreakToWinBits = 5
+winnerBits = 2
+
+# Field offsets, least significant first
+pointShift = 0
+gameShift = pointShift + 2*pointBits
+matchShift = gameShift + 2*maxSets*gameBits
+currentSetShift = matchShift + 2*setBits
+serverShift = currentSetShift + currentSetBits
+tiebreakShift = serverShift + serverBits
+tiebreakToWinShift = tiebreakShift + tiebreakBits
+winnerShift = tiebreakToWinShift + tiebreakToWinBits
+
+pointMask = (1 << pointBits) - 1
+gameMask = (1 << gameBits) - 1
+setMask = (1 << setBits) - 1
+currentSetMask = (1 << currentSetBits) - 1
+serverMask = (1 << serverBits) - 1
+tiebreakToWinMask = (1 << tiebreakToWinBits) - 1
+winnerMask = (1 << winnerBits) - 1
+
+def encode(gameScore, setScore, currentSet, matchScore, server, tiebreak, tiebreakToWin, winner):
+	"""
+	Packs match position fields into an integer.
+	@type gameScore: sequence of two integers
+	@param gameScore: The current game score (points).
+	@type setScore: sequence of up to five pairs of integers
+	@param setScore: Games won by each team in each set.
+	@type currentSet: integer
+	@param currentSet: The current set (0 = first set).
+	@type matchScore: sequence of two integers
+	@param matchScore: Sets won by each team.
+	@type server: integer
+	@param server: The team serving, or -1 if none.
+	@type tiebreak: boolean
+	@param tiebreak: Flag, True if currently in a tiebreak.
+	@type tiebreakToWin: integer
+	@param tiebreakToWin: Points needed to win the current (or next) tiebreak.
+	@type winner: integer
+	@param winner: The winning team, or -1 if no winner yet.
+	@rtype: integer
+	@return: The packed position.
+	"""
+	if max(gameScore) > pointMask or max(max(s) for s in setScore) > gameMask:
+		raise ValueError("Score too large to encode: {} {}".format(gameScore, setScore))
+	code = gameScore[0] | (gameScore[1] << pointBits)
+	shift = gameShift
+	for s in setScore:
+		code |= (s[0] << shift) | (s[1] << (shift + gameBits))
+		shift += 2*gameBits
+	return (code | (matchScore[0] << matchShift) | (matchScore[1] << (matchShift + setBits)) |
+		(currentSet << currentSetShift) | ((server + 1) << serverShift) | (int(bool(tiebreak)) << tiebreakShift) |
+		(tiebreakToWin << tiebreakToWinShift) | ((winner + 1) << winnerShift))
+
+class MatchState(_int):
+	"""A match position packed into an integer."""
+	__slots__ = ()
+
+	@classmethod
+	def fromFields(cls, gameScore=(0,0), setScore=((0,0),)*maxSets, currentSet=0, matchScore=(0,0),
+			server=-1, tiebreak=False, tiebreakToWin=7, winner=-1):
+		"""
+		Creates a state from individual fields. Defaults are the start of a match.
+		@rtype: MatchState
+		@return: The packed state. See encode for the fields.
+		"""
+		return cls(encode(gameScore, setScore, currentSet, matchScore, server, tiebreak, tiebreakToWin, winner))
+
+	@classmethod
+	def fromModel(cls, model):
+		"""
+		Creates a state from the current position of a Model.
+		@type model: tennisModel.Model
+		@param model: The Model to encode.
+		@rtype: MatchState
+		@return: The packed state.
+		"""
+		return cls(encode(model.gameScore.get(), model.setScore.get(), model.currentSet.get(),
+			model.matchScore.get(), model.server.get(), model.tiebreak.get(), model.tiebreakToWin,
+			model.winner.get()))
+
+	def toModel(self, model):
+		"""
+		Writes this position into a Model, as one batch of Observable changes.
+		Message text and point counters are left unchanged.
+		@type model: tennisModel.Model
+		@param model: The Model to update.
+		"""
+		model.tiebreakToWin = self.tiebreakToWin
+		model.matchOver = self.winner >= 0
+		model.situation = None # Classified for another position
+		with model.batch():
+			model.tiebreak.set(self.tiebreak)
+			model.matchScore.set(list(self.matchScore))
+			model.currentSet.set(self.currentSet)
+			model.setScore.set([list(s) for s in self.setScore[:len(model.setScore.get())]]) # The Model's format sets the length
+			model.gameScore.set(list(self.gameScore))
+			model.server.set(self.server)
+			model.winner.set(self.winner)
+
+	def decode(self):
+		"""
+		Returns all fields of the state.
+		@rtype: tuple
+		@return: (gameScore, setScore, currentSet, matchScore, server, tiebreak, tiebreakToWin, winner),
+			with the scores as tuples.
+		"""
+		return (self.gameScore, self.setScore, self.currentSet, self.matchScore, self.server,
+			self.tiebreak, self.tiebreakToWin, self.winner)
+
+	@property
+	def gameScore(self):
+		"""The current game score (points), as a tuple."""
+		return (self & pointMask, (self >> pointBits) & pointMask)
+
+	@property
+	def setScore(self):
+		"""Games won by each team in each set, as a tuple of tuples."""
+		return tuple(((self >> s) & gameMask, (self >> (s + gameBits)) & gameMask)
+			for s in range(gameShift, matchShift, 2*gameBits))
+
+	@property
+	def currentSet(self):
+		"""The current set (0 = first set)."""
+		return (self >> currentSetShift) & currentSetMask
+
+	@property
+	def matchScore(self):
+		"""Sets won by each team, as a tuple."""
+		return ((self >> matchShift) & setMask, (self >> (matchShift + setBits)) & setMask)
+
+	@property
+	def server(self):
+		"""The team serving, or -1 if none."""
+		return ((self >> serverShift) & serverMask) - 1
+
+	@property
+	def tiebreak(self):
+		"""Flag, True if currently in a tiebreak."""
+		return bool((self >> tiebreakShift) & 1)
+
+	@property
+	def tiebreakToWin(self):
+		"""Points needed to win the current (or next) tiebreak."""
+		return (self >> tiebreakToWinShift) & tiebreakToWinMask
+
+	@property
+	def winner(self):
+		"""The winning team, or -1 if no winner yet."""
+		return ((self >> winnerShift) & winnerMask) - 1
+
+	def __repr__(self):
+		"""
+		Provides detailed representation of a MatchState object.
+		@rtype: string
+		@return: Detailed representation of a MatchState object.
+		"""
+		return ("MatchState(gameScore={}, setScore={}, currentSet={}, matchScore={}, server={}, "
+			"tiebreak={}, tiebreakToWin={}, winner={})").format(*self.decode())
+
+if __name__ == '__main__':
+	s = MatchState.fromFields((3,2), ((6,4),(5,6),(0,0),(0,0),(0,0)), 1, (1,0), 0, False, 7, -1)
+	print(repr(s))
+	print("Packed: {} ({} bits)".format(int(s), s.bit_length()))
+	print("Hashable, equal to copy: {}".format({s: 1}[MatchState(int(s))]))
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+"""
+matchStats.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Match statistics for tennis scoreboard based on MVC architecture.
+
+Running totals for a match, for the whole match and for each set: points won on serve
+and on return, break points faced, saved and converted, service games held and broken,
+set and match point chances, tiebreaks, and the longest runs of points and of games.
+Each point and each game updates a fixed number of counters, so the statistics can be
+read at any time without going back over the points played. The changes are logged, so
+undo and redo step the counters back and forth (see mark and seek) instead of copying them.
+
+Exported classes:
+
+Counts -- Totals for a match or one set.
+MatchStats -- Statistics for a match, updated point by point.
+"""
+
+from pointSituation import BREAK_POINT, SET_POINT, MATCH_POINT
+
+class Counts:
+	"""Totals for a match or one set. Each list holds one count per team."""
+	fields = ('points', 'servePoints', 'servePointsWon', 'breakPointsFaced', 'breakPointsSaved',
+		'setPoints', 'matchPoints', 'games', 'serviceGames', 'serviceGamesWon', 'tiebreaksWon')
+
+	def __init__(self):
+		self.points = [0,0] # Points won
+		self.servePoints = [0,0] # Points served
+		self.servePointsWon = [0,0] # Points won on serve
+		self.breakPointsFaced = [0,0] # Break points faced on serve
+		self.breakPointsSaved = [0,0]
+		self.setPoints = [0,0] # Set point chances, including match points
+		self.matchPoints = [0,0] # Match point chances
+		self.games = [0,0] # Games won, including tiebreaks
+		self.serviceGames = [0,0] # Service games played
+		self.serviceGamesWon = [0,0] # Service games held
+		self.tiebreaksWon = [0,0]
+
+	def copy(self):
+		"""
+		@rtype: Counts
+		@return: An independent copy.
+		"""
+		c = Counts.__new__(Counts)
+		for name in Counts.fields:
+			setattr(c, name, list(getattr(self, name)))
+		return c
+
+	def returnPoints(self, team):
+		"""
+		@type team: integer
+		@param team: The team.
+		@rtype: integer
+		@return: Points the team played on return.
+		"""
+		return self.servePoints[1 - team]
+
+	def returnPointsWon(self, team):
+		"""
+		@type team: integer
+		@param team: The team.
+		@rtype: integer
+		@return: Points the team won on return.
+		"""
+		return self.servePoints[1 - team] - self.servePointsWon[1 - team]
+
+	def breakPoints(self, team):
+		"""
+		@type team: integer
+		@param team: The team.
+		@rtype: integer
+		@return: Break point chances the team had on return.
+		"""
+		return self.breakPointsFaced[1 - team]
+
+	def breakPointsConverted(self, team):
+		"""
+		@type team: integer
+		@param team: The team.
+		@rtype: integer
+		@return: Break points the team won on return.
+		"""
+		return self.breakPointsFaced[1 - team] - self.breakPointsSaved[1 - team]
+
+	def breaks(self, team):
+		"""
+		@type team: integer
+		@param team: The team.
+		@rtype: integer
+		@return: Return games the team won.
+		"""
+		return self.serviceGames[1 - team] - self.serviceGamesWon[1 - team]
+
+	def tiebreaks(self):
+		"""
+		@rtype: integer
+		@return: Tiebreaks played to the end.
+		"""
+		return self.tiebreaksWon[0] + self.tiebreaksWon[1]
+
+	def report(self):
+		"""
+		Returns the totals, with the return and break figures worked out.
+		@rtype: dictionary
+		@return: Name to [team 1 value, team 2 value], plus tiebreaks (a single number).
+		"""
+		r = dict((name, list(getattr(self, name))) for name in Counts.fields)
+		for name in ('returnPoints', 'returnPointsWon', 'breakPoints', 'breakPointsConverted', 'breaks'):
+			f = getattr(self, name)
+			r[name] = [f(0), f(1)]
+		r['tiebreaks'] = self.tiebreaks()
+		return r
+
+class MatchStats:
+	"""Statistics for a match, updated point by point."""
+	def __init__(self):
+		self.total = Counts() # Whole match
+		self.sets = [] # Counts for each set played so far
+		self.longestPointRun = [0,0] # Most points won in a row
+		self.longestGameRun = [0,0] # Most games won in a row
+		self.pointRun = [-1, 0] # Current run: [team, points]
+		self.gameRun = [-1, 0] # Current run: [team, games]
+		self.keepLog = True # False skips the change log, e.g. for bulk replays
+		self.log = [] # Changes: (list, index, old value, new value); old is None for a set started
+		self.position = 0 # Changes in the log that are applied, see mark and seek
+
+	def copy(self):
+		"""
+		@rtype: MatchStats
+		@return: An independent copy of the counters, without the change log.
+		"""
+		s = MatchStats()
+		s.total = self.total.copy()
+		s.sets = [c.copy() for c in self.sets]
+		s.longestPointRun = list(self.longestPointRun)
+		s.longestGameRun = list(self.longestGameRun)
+		s.pointRun = list(self.pointRun)
+		s.gameRun = list(self.gameRun)
+		return s
+
+	def mark(self):
+		"""
+		Returns the current position in the change log, for seek, e.g. in an undo snapshot.
+		@rtype: integer
+		@return: The number of changes applied.
+		"""
+		return self.position
+
+	def seek(self, position):
+		"""
+		Takes back or reapplies logged changes until the statistics are as they were at a mark.
+		Changes taken back stay in the log until a new point is recorded, so they can be redone.
+		@type position: integer
+		@param position: A position returned by mark.
+		"""
+		log = self.log
+		while self.position > position:
+			self.position -= 1
+			(values, index, old, new) = log[self.position]
+			if old is None:
+				values.pop()
+			else:
+				values[index] = old
+		while self.position < position:
+			(values, index, old, new) = log[self.position]
+			if old is None:
+				values.append(new)
+			else:
+				values[index] = new
+			self.position += 1
+
+	def _set(self, values, index, value):
+		"""
+		Sets a counter (or starts a set's counts, when index is the length of the list), logging the change.
+		@type values: list
+		@param values: The counters.
+		@type index: integer
+		@param index: The counter to set.
+		@param value: The new value.
+		"""
+		if index == len(values):
+			old = None
+			values.append(value)
+		else:
+			old = values[index]
+			values[index] = value
+		if self.keepLog:
+			if self.position < len(self.log):
+				del self.log[self.position:] # Undone changes can no longer be redone
+			self.log.append((values, index, old, value))
+			self.position += 1
+
+	def _add(self, values, index):
+		"""
+		Adds one to a counter, logging the change.
+		@type values: list
+		@param values: The counters.
+		@type index: integer
+		@param index: The counter to increment.
+		"""
+		self._set(values, index, values[index] + 1)
+
+	def setCounts(self, index):
+		"""
+		Returns the counts for a set, starting them if it is the first point of the set.
+		@type index: integer
+		@param index: The set (0 for the first).
+		@rtype: Counts
+		@return: The counts for the set.
+		"""
+		while len(self.sets) <= index:
+			self._set(self.sets, len(self.sets), Counts())
+		return self.sets[index]
+
+	def point(self, team, server, situations, setIndex):
+		"""
+		Records a point. Call before the point is applied to the score.
+		@type team: integer
+		@param team: The team that won the point.
+		@type server: integer
+		@param server: The team that served the point, or -1 if not known.
+		@type situations: tuple of integers
+		@param situations: Each team's point situation flags before the point, see pointSituation.classify.
+		@type setIndex: integer
+		@param setIndex: The set being played.
+		"""
+		add = self._add
+		for c in (self.total, self.setCounts(setIndex)):
+			add(c.points, team)
+			if server >= 0:
+				add(c.servePoints, server)
+				if team == server:
+					add(c.servePointsWon, server)
+			for (holder, flags) in enumerate(situations):
+				if flags:
+					if flags & BREAK_POINT:
+						add(c.breakPointsFaced, server)
+						if team == server:
+							add(c.breakPointsSaved, server)
+					if flags & SET_POINT:
+						add(c.setPoints, holder)
+					if flags & MATCH_POINT:
+						add(c.matchPoints, holder)
+		self._run(self.pointRun, self.longestPointRun, team)
+
+	def game(self, team, server, tiebreak, setIndex):
+		"""
+		Records a game won. Call after the point that won it.
+		@type team: integer
+		@param team: The team that won the game.
+		@type server: integer
+		@param server: The team that served the game (ignored for a tiebreak), or -1 if not known.
+		@type tiebreak: boolean
+		@param tiebreak: Flag, True if the game was a tiebreak.
+		@type setIndex: integer
+		@param setIndex: The set being played.
+		"""
+		add = self._add
+		for c in (self.total, self.setCounts(setIndex)):
+			add(c.games, team)
+			if tiebreak:
+				add(c.tiebreaksWon, team)
+			elif server >= 0:
+				add(c.serviceGames, server)
+				if team == server:
+					add(c.serviceGamesWon, server)
+		self._run(self.gameRun, self.longestGameRun, team)
+
+	def _run(self, run, longest, team):
+		"""
+		Extends the current run of points or games, or starts a new one.
+		@type run: list
+		@param run: The current run, [team, length].
+		@type longest: list
+		@param longest: The longest run for each team.
+		@type team: integer
+		@param team: The team that won the point or game.
+		"""
+		if run[0] == team:
+			self._add(run, 1)
+		else:
+			self._set(run, 0, team)
+			self._set(run, 1, 1)
+		if run[1] > longest[team]:
+			self._set(longest, team, run[1])
+
+	def report(self):
+		"""
+		Returns all statistics, e.g. for on-screen graphics or a feed.
+		@rtype: dictionary
+		@return: The match totals (see Counts.report), plus longestPointRun, longestGameRun,
+			pointRun and gameRun ([team, length] of the current runs), and sets (a report per set).
+		"""
+		r = self.total.report()
+		r['longestPointRun'] = list(self.longestPointRun)
+		r['longestGameRun'] = list(self.longestGameRun)
+		r['pointRun'] = list(self.pointRun)
+		r['gameRun'] = list(self.gameRun)
+		r['sets'] = [c.report() for c in self.sets]
+		return r
+
+if __name__ == '__main__':
+	import sys
+	import random
+	sys.path.append('../lib')
+	from tennisModel import Model
+	import player
+	m = Model()
+	m.setMensMatch(1)
+	m.setTeams([player.Team(player.Player(1, 'Novak', 'Djokovic', 'SRB')), player.Team(player.Player(2, 'Rafael', 'Nadal', 'ESP'))])
+	m.server.set(0)
+	rng = random.Random(1)
+	while not m.matchOver:
+		server = m.server.get()
+		m.incrementGameScore(server if rng.random() < 0.62 else 1 - server)
+	s = m.stats.total
+	print("{} {}".format(m.setScore.get(), m.message.get()))
+	for team in (0, 1):
+		print("{}: serve {}/{}, return {}/{}, break points {}/{} (saved {}/{}), holds {}/{}, "
+			"tiebreaks {}, longest runs {} points, {} games".format(m.team[team],
+			s.servePointsWon[team], s.servePoints[team], s.returnPointsWon(team), s.returnPoints(team),
+			s.breakPointsConverted(team), s.breakPoints(team), s.breakPointsSaved[team], s.breakPointsFaced[team],
+			s.serviceGamesWon[team], s.serviceGames[team], s.tiebreaksWon[team],
+			m.stats.longestPointRun[team], m.stats.longestGameRun[team]))
+	for (i, c) in enumerate(m.stats.sets):
+		print("Set {}: points {}, breaks {}".format(i + 1, c.points, [c.breaks(0), c.breaks(1)]))
@@ -12,15 +12,46 @@ See LICENSE.txt for license information.
 
 The player and team classes for tennis scoreboard based on MVC architecture.
 
+Players and teams are compact (slotted, no per-object dictionary), and share one
+string per country code, so a whole ranking list of them stays small. Names worked
+out from the other fields (initials, photo name, a team's scoreboard and button
+names) are made on first use and kept.
+
+A player's scoreboard name is the shortest that tells them apart from the rest of
+the roster: the last name, or with first initial(s) if the last name is shared
+("S. Williams"), or with two letters if the first initial is shared too
+("Ka. Pliskova"). A NameIndex works out which names need which, in one pass over
+a roster.
+
 Exported classes:
 
 Player -- Represents an indivudiual tennis player.
 
 Team -- Represents a group of players (1 or 2).
+
+NameIndex -- Which players of a roster need initials to tell them apart.
+
+Exported functions:
+
+fancyFirstInits -- Breaks a first name into initials.
+parsePlayerString -- Parses a player list string (as made by setup3.readPlayers) into elements of a Player object.
 """
 
-class Player():
+_countries = {} # Country code -> the one string used for it by every Player
+
+def _country(code):
+	"""
+	@type code: string
+	@param code: IOC three letter country code.
+	@rtype: string
+	@return: The shared string for the code.
+	"""
+	return _countries.setdefault(code, code)
+
+class Player(object):
 	"""Represents an indivudiual tennis player."""
+	__slots__ = ('rank', 'firstName', 'lastName', 'countryCode', '_inits', '_photoName')
+
 	def __init__(self, rank, first, last, country):
 		"""
 		@type rank: string
@@ -35,7 +66,9 @@ class Player():
 		self.rank = int(rank)
 		self.firstName = first
 		self.lastName = last
-		self.countryCode = country # IOC three letter country code
+		self.countryCode = _country(country) # IOC three letter country code
+		self._inits = None # First initials, made on first use
+		self._photoName = None # Photo file name, made on first use
 
 	def __repr__(self):
 		"""
@@ -77,7 +110,10 @@ class Player():
 		@rtype: boolean
 		@return: True if current Player = other Player.
 		"""
-		return self.__dict__ == other.__dict__
+		if not isinstance(other, Player):
+			return False
+		return (self.rank == other.rank and self.lastName == other.lastName and
+			self.firstName == other.firstName and self.countryCode == other.countryCode)
 
 	def __ne__(self,other):
 		"""
@@ -103,10 +139,9 @@ class Player():
 		@rtype: boolean
 		@return: True if current Player rank is less than other Player rank, or provided rank. (rank = 1) is less than (rank = 2).
 		"""
-		if hasattr(other,'rank'):
+		if isinstance(other, Player):
 			return self.rank < other.rank
-		else:
-			return self.rank < other
+		return self.rank < other
 
 	def __gt__(self,other):
 		"""
@@ -116,10 +151,9 @@ class Player():
 		@rtype: boolean
 		@return: True if current Player rank is greater than other Player rank, or provided rank. (rank = 2) is greater than (rank = 2).
 		"""
-		if hasattr(other,'rank'):
+		if isinstance(other, Player):
 			return self.rank > other.rank
-		else:
-			return self.rank > other
+		return self.rank > other
 
 	def __le__(self,other):
 		"""
@@ -129,7 +163,7 @@ class Player():
 		@rtype: boolean
 		@return: True if current Player rank is less than or equal to other Player rank, or provided rank. (rank = 1) is less than or equal to (rank = 2)
 		"""
-		return self.__eq__(other) or self.__lt__(other)
+		return self.rank <= (other.rank if isinstance(other, Player) else other)
 
 	def __ge__(self,other):
 		"""
@@ -139,31 +173,29 @@ class Player():
 		@rtype: boolean
 		@return: True if current Player rank is greater than or equal to other Player rank, or provided rank.  (rank = 2) is greater than or equal to (rank = 2).
 		"""
-		return self.__eq__(other) or self.__gt__(other)
+		return self.rank >= (other.rank if isinstance(other, Player) else other)
 		
 	def scoreName(self, dups=set([]), special = []):
 		"""
 		Provides the scoreboard name for a Player.
 		@type dups: list of strings
 		@param dups: List of last names that appear for multiple players.
-		@type special: list of strings
-		@param special: List of last names that appear for multiple players, and have same first initial.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
 		@rtype: string
 		@return: The scoreboard name for the Player.
 		"""
 		if self.lastName not in dups:
 			return self.lastName
-		else:
-			inits = self.getFirstInits(special)
-			return inits + " " + self.lastName
+		return self.getFirstInits(special) + " " + self.lastName
 
 	def buttonName(self, dups=set([]), special = []):
 		"""
 		Provides the scoring button name for a Player.
 		@type dups: list of strings
 		@param dups: List of last names that appear for multiple players.
-		@type special: list of strings
-		@param special: List of last names that appear for multiple players, and have same first initial.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
 		@rtype: string
 		@return: The scoring button name for the Player.
 		"""
@@ -196,14 +228,17 @@ class Player():
 	def getFirstInits(self, special = []):
 		"""
 		Returns the Player's first initial(s). One for most players, two inits for special cases.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
 		@rtype: string
 		@return: The Player's first initial(s).
 		"""
-		for case in special: # Special names have same last name and first initial, e.g. Karolina and Kristyna Pliskova
-			if self.lastName == case[0]:
-				if self.firstName[0] == case[1]:
-					return self.firstName[0:2]+"."
-		return fancyFirstInits(self.firstName) # Not a special case, just use normal initial(s).
+		# Special names have same last name and first initial, e.g. Karolina and Kristyna Pliskova
+		if (self.lastName, self.firstName[0:1]) in special:
+			return self.firstName[0:2]+"."
+		if self._inits is None: # Not a special case, just use normal initial(s).
+			self._inits = fancyFirstInits(self.firstName)
+		return self._inits
 
 	def getCountryCode(self):
 		"""
@@ -219,11 +254,15 @@ class Player():
 		@rtype: string
 		@return: The photo file name for the Player.
 		"""
-		# Sample photo name: "an_ivanovic.jpg" for Ana Ivanovic
-		return self.firstName[0:2] + "_" + self.lastName + ".jpg"
+		# Sample photo name: "an_ivanovic.jpg" for Ana Ivanovic. Spaces in the last name become "_".
+		if self._photoName is None:
+			self._photoName = (self.firstName[0:2] + "_" + self.lastName.replace(" ", "_") + ".jpg").lower()
+		return self._photoName
 
-class Team():
+class Team(object):
 	"""Represents a group of players (1 or 2)."""
+	__slots__ = ('playerA', 'playerB', '_names')
+
 	def __init__(self, playerA, playerB=None):
 		"""
 		@type playerA: Player
@@ -233,6 +272,29 @@ class Team():
 		"""
 		self.playerA = playerA
 		self.playerB = playerB # None if singles match
+		self._names = None # (dups, special, score name, button name), for the last dups and special asked for
+
+	def _getNames(self, dups, special):
+		"""
+		Returns the scoreboard and button names, made once for each dups and special.
+		dups and special are not expected to change once given (the Model sets them once per match).
+		@type dups: list of strings
+		@param dups: List of last names that appear for multiple players.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
+		@rtype: tuple of strings
+		@return: (score name, button name).
+		"""
+		names = self._names
+		if names is None or names[0] is not dups or names[1] is not special:
+			a = self.playerA.scoreName(dups, special)
+			if self.playerB is None: # Singles match
+				names = (dups, special, a, a)
+			else: # Doubles match
+				b = self.playerB.scoreName(dups, special)
+				names = (dups, special, a + " / " + b, a + " /\n" + b)
+			self._names = names
+		return names[2:]
 
 	def __repr__(self):
 		"""
@@ -258,30 +320,24 @@ class Team():
 		Provides the scoreboard name for a Team.
 		@type dups: list of strings
 		@param dups: List of last names that appear for multiple players.
-		@type special: list of strings
-		@param special: List of last names that appear for multiple players, and have same first initial.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
 		@rtype: string
 		@return: The scoreboard name for the Team.
 		"""
-		if self.playerB is None: # Singles match
-			return self.playerA.scoreName(dups, special)
-		else: # Doubles match
-			return self.playerA.scoreName(dups, special) + " / " + self.playerB.scoreName(dups, special)
+		return self._getNames(dups, special)[0]
 
 	def buttonName(self, dups=set([]), special = []):
 		"""
 		Provides the scoring button name for a Team.
 		@type dups: list of strings
 		@param dups: List of last names that appear for multiple players.
-		@type special: list of strings
-		@param special: List of last names that appear for multiple players, and have same first initial.
+		@type special: collection of tuples
+		@param special: (last name, first initial) shared by multiple players.
 		@rtype: string
 		@return: The scoring button name for the Team.
 		"""
-		if self.playerB is None: # Singles match
-			return self.playerA.buttonName(dups, special)
-		else: # Doubles match
-			return self.playerA.buttonName(dups, special) + " /\n" + self.playerB.buttonName(dups, special)
+		return self._getNames(dups, special)[1]
 
 	def getRank(self):
 		"""
@@ -327,6 +383,73 @@ class Team():
 		else: # Doubles match
 			return (self.playerA.getCountryCode(), self.playerB.getCountryCode())
 
+class NameIndex(object):
+	"""Which players of a roster need initials to tell them apart."""
+	def __init__(self, records=()):
+		"""
+		@type records: list of tuples
+		@param records: (rank, first name, last name, country code) for each player, e.g. from parsePlayerString.
+		"""
+		self.initials = {} # (last name, first initial) -> number of players
+		self.lastNames = {} # Last name -> number of players
+		self.dups = set() # Last names of more than one player: these get first initial(s)
+		self.special = set() # (last name, first initial) of more than one player: these get two letters
+		self.add(records)
+
+	def add(self, records):
+		"""
+		Adds players, e.g. as a roster arrives. Each is looked at once.
+		@type records: list of tuples
+		@param records: (rank, first name, last name, country code) for each player.
+		"""
+		for (rank, first, last, country) in records:
+			self._count(last, first[0:1], 1)
+
+	def _count(self, last, initial, n):
+		"""
+		Counts players with a name.
+		@type last: string
+		@param last: Their last name.
+		@type initial: string
+		@param initial: The first letter of their first name.
+		@type n: integer
+		@param n: Number of players.
+		"""
+		key = (last, initial)
+		count = self.initials[key] = self.initials.get(key, 0) + n
+		if count > 1:
+			self.special.add(key)
+		count = self.lastNames[last] = self.lastNames.get(last, 0) + n
+		if count > 1:
+			self.dups.add(last)
+
+	@classmethod
+	def union(cls, indexes):
+		"""
+		Combines the indexes of several rosters, e.g. the women's and men's lists of a mixed doubles match.
+		@type indexes: list of NameIndex
+		@param indexes: The indexes.
+		@rtype: NameIndex
+		@return: The index of all their players. The index itself if there is only one.
+		"""
+		if len(indexes) == 1:
+			return indexes[0]
+		combined = cls()
+		for index in indexes:
+			for ((last, initial), n) in index.initials.items():
+				combined._count(last, initial, n)
+		return combined
+
+	def scoreName(self, player):
+		"""
+		Provides the shortest scoreboard name that tells a player apart from the rest of the roster.
+		@type player: Player
+		@param player: The player.
+		@rtype: string
+		@return: The scoreboard name, e.g. "Nadal", "S. Williams" or "Ka. Pliskova".
+		"""
+		return player.scoreName(self.dups, self.special)
+
 def fancyFirstInits(firstName):
 	"""
 	Breaks a first name into initials. Handles hyphenated names.
@@ -348,9 +471,28 @@ def fancyFirstInits(firstName):
 			inits += word[0]+"."
 	return inits
 
+def parsePlayerString(s):
+	"""
+	Parses a string representing a player (as made by setup3.readPlayers) into elements of a Player object.
+	@type s: string
+	@param s: String representing a player.
+	@rtype: tuple
+	@return: Elements of a Player object.
+	"""
+	l1 = s.split('.')
+	rank = l1[0]
+	l2 = l1[1].split(',')
+	lastName = l2[0].strip()
+	l3 = l2[1].split('(')
+	firstName = l3[0].strip()
+	country = l3[1][0:3] # Three-letter IOC code for country.
+	return (rank, firstName, lastName, country)
+
 if __name__ == '__main__':
-	dups = set(['Williams', 'Pliskova', 'Bryan']) # There may be others, or less, depending on retirements.
-	special = [('Pliskova', 'K')]
+	names = NameIndex(parsePlayerString(s) for s in ['1. Williams, Serena (USA)', '11. Williams, Venus (USA)', '48. Pliskova, Karolina (CZE)',
+		'94. Pliskova, Kristyna (CZE)', '1. Bryan, Bob (USA)', '1. Bryan, Mike (USA)', '3. Halep, Simona (ROU)'])
+	dups = names.dups # Williams, Pliskova, Bryan
+	special = names.special # Pliskova, K
 	serena = Player("1","Serena","Williams","USA")
 	li = Player("2","Na","Li","CHN")
 	halep = Player("3","Simona","Halep","ROU")
@@ -386,8 +528,7 @@ if __name__ == '__main__':
 	print("Team 1 score name: {}".format(team1.scoreName()))
 	myList = [radwanska, li, serena, kvitova, halep, li]
 	print("Type of myList is: {}".format(type(myList)))
-	print("Dict of halep is:")
-	print(halep.__dict__)
+	print("Photo name of halep is: {}".format(halep.getPhotoName()))
 	mySet = set(myList)
 	print("Type of mySet is: {}".format(type(mySet)))
 	if len(set(myList)) == len(myList):
@@ -418,4 +559,11 @@ if __name__ == '__main__':
 	print("Scorename: " + js.scoreName(dups=dups,special=special))
 	jhyphenboy = Player("24", "Juan-Thomas-Yglesias Sebastian-Joeseph Joe-Bob-At-The-Drivein", "Cabal", "COL")
 	print(jhyphenboy)
-	print("Scorename: " + jhyphenboy.scoreName(dups=dups,special=special))
\ No newline at end of file
+	print("Scorename: " + jhyphenboy.scoreName(dups=dups,special=special))
+	print("Shortest names: {}".format([names.scoreName(p) for p in (serena, halep, kapliskova, krpliskova)]))
+	import time
+	roster = ['{}. {}, {} (USA)'.format(rank, 'Last{}'.format(rank % 1500), 'ABCDEFGH'[rank % 8] + 'x') for rank in range(1, 5001)]
+	start = time.time()
+	names = NameIndex(parsePlayerString(s) for s in roster)
+	print("Name index of {} players in {:.1f} ms: {} shared last names, {} shared initials".format(len(roster),
+		1000 * (time.time() - start), len(names.dups), len(names.special)))
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+"""
+playerSearch.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Incremental player search for tennis scoreboard based on MVC architecture.
+
+A PlayerIndex answers "best k players for what the operator has typed so far",
+fast enough to run on every keystroke with full ranking lists. Names are matched
+by word prefix (last name first), falling back to trigrams so a misspelling or a
+piece from the middle of a name still finds the player. Matching ignores case and
+accents. Results can be limited to a country and a rank range, and come back in
+rank order within each kind of match.
+
+An index searches a rosterStore.Roster, and answers with roster ids. The name index
+is built the first time a name is searched for, and catches up with players added
+to the roster since (e.g. as a ranking list arrives).
+
+Query text: words match names; "@SRB" keeps players from that country; "1-100"
+(or "#1-100") keeps players ranked in that range.
+
+Exported classes:
+
+PlayerIndex -- Searchable index of players.
+
+Exported functions:
+
+normalize -- Returns text lower case, without accents, for matching.
+parseQuery -- Splits query text into name words and filters.
+"""
+
+import bisect
+import heapq
+import unicodedata
+
+
+# Kinds of match, best first
+LAST_PREFIX = 0 # Every word starts the last name, or a later word of it
+NAME_PREFIX = 1 # Every word starts some word of the name
+TRIGRAM = 2 # Close in spelling
+
+minTrigramShare = 0.5 # Part of a word's trigrams a name must have, to match by trigram
+
+def normalize(text):
+	"""
+	Returns text lower case, without accents, for matching.
+	@type text: string
+	@param text: The text.
+	@rtype: string
+	@return: The normalized text, e.g. "muller" for "Muller" written with an umlaut.
+	"""
+	text = unicodedata.normalize('NFKD', u'{}'.format(text))
+	return u''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+def _words(text):
+	"""
+	@type text: string
+	@param text: Normalized text.
+	@rtype: list of strings
+	@return: The words, split at spaces and hyphens.
+	"""
+	return text.replace('-', ' ').split()
+
+def _trigrams(word):
+	"""
+	@type word: string
+	@param word: A normalized word.
+	@rtype: set of strings
+	@return: Its trigrams, with the word start marked so prefixes weigh more.
+	"""
+	padded = u'  ' + word
+	return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+def parseQuery(text):
+	"""
+	Splits query text into name words and filters.
+	@type text: string
+	@param text: What the operator typed.
+	@rtype: tuple
+	@return: (words (normalized), country (or None), ranks ((low, high), or None)).
+	"""
+	words = []
+	country = None
+	ranks = None
+	for token in text.split():
+		if token.startswith('@') and len(token) > 1:
+			country = token[1:].upper()
+			continue
+		bare = token.lstrip('#')
+		(low, sep, high) = bare.partition('-')
+		if low.isdigit() and (not sep or high.isdigit()):
+			ranks = (int(low), int(high) if sep else int(low))
+			continue
+		words.extend(_words(normalize(token)))
+	return (words, country, ranks)
+
+class PlayerIndex:
+	"""Searchable index of players."""
+	def __init__(self, roster):
+		"""
+		@type roster: rosterStore.Roster
+		@param roster: The players. Players added to it later are indexed on the next search.
+		"""
+		self.roster = roster
+		self.keys = [] # Sorted (word, id, kind) for prefix search
+		self.trigrams = {} # Trigram -> list of ids
+		self.built = 0 # Players indexed by name so far
+		self.byRank = [] # Ids in rank order
+		self.ranked = 0 # Players in byRank
+
+	def __len__(self):
+		"""
+		@rtype: integer
+		@return: The number of players.
+		"""
+		return len(self.roster)
+
+	def _rankOrder(self):
+		"""
+		@rtype: list of integers
+		@return: Ids in rank order, including players added since the last search.
+		"""
+		if self.ranked != len(self.roster):
+			self.byRank = sorted(range(len(self.roster)), key=self.roster.rank)
+			self.ranked = len(self.roster)
+		return self.byRank
+
+	def _build(self):
+		"""Indexes the names of the players added since the last search by name."""
+		roster = self.roster
+		if self.built == len(roster):
+			return
+		keys = self.keys
+		trigrams = self.trigrams
+		for i in range(self.built, len(roster)):
+			lastWords = _words(normalize(roster.lastName(i)))
+			firstWords = _words(normalize(roster.firstName(i)))
+			seen = set()
+			for (words, kind) in ((lastWords, LAST_PREFIX), (firstWords, NAME_PREFIX)):
+				for w in words:
+					keys.append((w, i, kind))
+					for t in _trigrams(w):
+						if t not in seen:
+							seen.add(t)
+							trigrams.setdefault(t, []).append(i)
+			if len(lastWords) > 1: # "zahlavova strycova" as a whole, so "zahlavova s" finds it
+				keys.append((u' '.join(lastWords), i, LAST_PREFIX))
+		keys.sort()
+		self.built = len(roster)
+
+	def _prefixMatches(self, word):
+		"""
+		@type word: string
+		@param word: A normalized query word.
+		@rtype: dictionary
+		@return: Id to best kind of match, for names with a word starting with this one.
+		"""
+		keys = self.keys
+		matches = {}
+		i = bisect.bisect_left(keys, (word,))
+		while i < len(keys) and keys[i][0].startswith(word):
+			(w, id, kind) = keys[i]
+			if matches.get(id, NAME_PREFIX + 1) > kind:
+				matches[id] = kind
+			i += 1
+		return matches
+
+	def _trigramMatches(self, word):
+		"""
+		@type word: string
+		@param word: A normalized query word.
+		@rtype: dictionary
+		@return: Id to share of the word's trigrams found in the name, for names over minTrigramShare.
+		"""
+		grams = _trigrams(word)
+		counts = {}
+		for t in grams:
+			for id in self.trigrams.get(t, ()):
+				counts[id] = counts.get(id, 0) + 1
+		n = float(len(grams))
+		return dict((id, c / n) for (id, c) in counts.items() if c / n >= minTrigramShare)
+
+	def _accepts(self, id, country, ranks):
+		"""
+		@type country: integer
+		@param country: Country number in the roster, or None for any.
+		@rtype: boolean
+		@return: True if the player passes the country and rank filters.
+		"""
+		return ((country is None or self.roster.countries[id] == country) and
+			(ranks is None or ranks[0] <= self.roster.ranks[id] <= ranks[1]))
+
+	def search(self, text=u'', k=10, country=None, ranks=None):
+		"""
+		Returns the best matches for query text, e.g. as the operator types it.
+		@type text: string
+		@param text: The query, see parseQuery. Empty for the top ranked players.
+		@type k: integer
+		@param k: Most players to return.
+		@type country: string
+		@param country: Keep only players from this country (IOC code), or None. The query may also give one.
+		@type ranks: tuple of integers
+		@param ranks: Keep only players ranked from low to high (inclusive), or None. The query may also give one.
+		@rtype: list of strings
+		@return: The matching players, best first: last name matches, then other name matches, then
+			spelling matches, in rank order within each.
+		"""
+		return [self.roster.string(id) for id in self.searchIds(text, k, country, ranks)]
+
+	def searchIds(self, text=u'', k=10, country=None, ranks=None):
+		"""
+		As search, returning player ids (positions in the order added) instead of player strings.
+		@rtype: list of integers
+		@return: The ids of the matching players, best first.
+		"""
+		(words, qCountry, qRanks) = parseQuery(text)
+		country = qCountry or country
+		ranks = qRanks or ranks
+		if country is not None:
+			country = self.roster.countryNumber(country)
+			if country is None: # No one from there
+				return []
+		ranked = self.roster.ranks
+		if not words: # Filters only: top ranked players
+			result = []
+			for id in self._rankOrder():
+				if self._accepts(id, country, ranks):
+					result.append(id)
+					if len(result) == k:
+						break
+			return result
+		self._build()
+		# Every word must match: the kind of match is the worst of the words
+		found = None
+		for w in words:
+			m = self._prefixMatches(w)
+			if found is None:
+				found = m
+			else:
+				found = dict((id, max(kind, m[id])) for (id, kind) in found.items() if id in m)
+			if not found:
+				break
+		scored = [(kind, ranked[id], id) for (id, kind) in found.items() if self._accepts(id, country, ranks)]
+		if len(scored) < k and all(len(w) >= 3 for w in words):
+			# Not enough by prefix: add players whose names are spelled about the same
+			close = None
+			for w in words:
+				m = self._trigramMatches(w)
+				if close is None:
+					close = m
+				else:
+					close = dict((id, share + m[id]) for (id, share) in close.items() if id in m)
+			for (id, share) in close.items():
+				if id not in found and self._accepts(id, country, ranks):
+					scored.append((TRIGRAM, -share, ranked[id], id))
+		return [s[-1] for s in heapq.nsmallest(k, scored)]
+
+if __name__ == '__main__':
+	import random
+	import time
+	from rosterStore import Roster
+	from player import parsePlayerString
+	players = ['1. Djokovic, Novak (SRB)', '2. Federer, Roger (SUI)', '3. Nadal, Rafael (ESP)',
+		'4. Wawrinka, Stan (SUI)', '5. Nishikori, Kei (JPN)', '6. Murray, Andy (GBR)',
+		'7. Zahlavova Strycova, Barbora (CZE)', '8. Pliskova, Karolina (CZE)', '9. Pliskova, Kristyna (CZE)',
+		'10. Del Potro, Juan Martin (ARG)', u'11. M\u00fcller, Gilles (LUX)']
+	rng = random.Random(1)
+	syllables = ('ka', 'ro', 'li', 'na', 'vic', 'ova', 'ber', 'ti', 'sch', 'do', 'ez', 'an')
+	for rank in range(12, 2001):
+		last = ''.join(rng.choice(syllables) for i in range(rng.randint(2, 4))).capitalize()
+		first = ''.join(rng.choice(syllables) for i in range(2)).capitalize()
+		players.append('{}. {}, {} ({})'.format(rank, last, first, rng.choice(('USA', 'FRA', 'ESP', 'CZE'))))
+	roster = Roster()
+	for s in players:
+		(rank, first, last, country) = parsePlayerString(s)
+		roster.append(int(rank), first, last, country)
+	index = PlayerIndex(roster)
+	start = time.time()
+	index.search('x')
+	print("Index of {} players built in {:.1f} ms".format(len(index), 1000 * (time.time() - start)))
+	for query in ('', 'd', 'djo', 'novak', 'pl', 'pliskova kr', 'strycova', 'zahlavova s', 'federr', 'ovic',
+			'muller', 'del p', '@CZE', 'ka @ESP 1-100'):
+		print("{!r}: {}".format(query, index.search(query, 4)))
+	typed = ['n', 'na', 'nad', 'nada', 'nadal', 'k', 'ka', 'kar', 'karo', 'zz', 'vicka', '@FRA', 'ro 100-500']
+	slowest = 0.0
+	start = time.time()
+	for i in range(100):
+		for query in typed:
+			t = time.time()
+			index.search(query, 10)
+			slowest = max(slowest, time.time() - t)
+	elapsed = time.time() - start
+	print("{:.3f} ms per query, slowest {:.3f} ms".format(1000 * elapsed / (100 * len(typed)), 1000 * slowest))
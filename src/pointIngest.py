@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""
+pointIngest.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Ingest of point-by-point feeds for tennis scoreboard based on MVC architecture.
+
+Reads point events for many simultaneous matches from TCP connections, pipes and
+files, and drives one Model per match. All sources are read concurrently by one
+asyncio event loop, and each line is applied as soon as it is read. Needs Python 3.
+
+Feed lines (UTF-8), one event each:
+
+	<matchId> start <configuration JSON, as pointJournal.matchConfig>
+	<matchId> 0|1		point won by team 1 / team 2
+	<matchId> u|r		undo / redo
+
+The event codes are the same as in a point journal.
+
+Exported classes:
+
+Ingest -- Drives one Model per match from point event feeds.
+"""
+
+import asyncio
+import json
+import time
+
+from tennisModel import Model
+import pointJournal
+from pointJournal import POINT_TEAM1, POINT_TEAM2, UNDO, REDO
+
+readLines = 1 << 16 # Bytes of lines read from a file at a time
+
+class Ingest:
+	"""Drives one Model per match from point event feeds."""
+	def __init__(self, listener=None):
+		"""
+		@type listener: function
+		@param listener: Called with (matchId, change set) after each event that changes a Model, or None.
+		"""
+		self.listener = listener
+		self.models = {} # matchId -> Model
+		self.events = 0
+		self.errors = 0
+		self.sources = 0 # Sources being read
+		self.maxLatency = 0.0 # Longest time to apply one event (seconds)
+		self.startTime = None # Time of the first event
+
+	def handle(self, line):
+		"""
+		Applies one feed line.
+		@type line: string or bytes
+		@param line: The feed line. Bytes are decoded as UTF-8.
+		@rtype: boolean
+		@return: False if the line was not understood (counted in errors).
+		"""
+		start = time.time()
+		if self.startTime is None:
+			self.startTime = start
+		if isinstance(line, bytes):
+			try:
+				line = line.decode('utf-8')
+			except UnicodeDecodeError:
+				self.errors += 1
+				return False
+		parts = line.split(None, 2)
+		if len(parts) < 2:
+			if parts: # Blank lines are ignored
+				self.errors += 1
+			return not parts
+		(matchId, event) = (parts[0], parts[1])
+		if event == 'start':
+			try:
+				self.start(matchId, json.loads(parts[2]))
+			except (IndexError, ValueError, KeyError, TypeError):
+				self.errors += 1
+				return False
+		else:
+			model = self.models.get(matchId)
+			if model is None:
+				self.errors += 1
+				return False
+			if event == POINT_TEAM1:
+				model.incrementGameScore(0)
+			elif event == POINT_TEAM2:
+				model.incrementGameScore(1)
+			elif event == UNDO:
+				model.undo()
+			elif event == REDO:
+				model.redo()
+			else:
+				self.errors += 1
+				return False
+		self.events += 1
+		latency = time.time() - start
+		if latency > self.maxLatency:
+			self.maxLatency = latency
+		return True
+
+	def start(self, matchId, config):
+		"""
+		Starts (or restarts) a match.
+		@type matchId: string
+		@param matchId: The match identifier used in the feed.
+		@type config: dictionary
+		@param config: The match configuration, see pointJournal.matchConfig.
+		@rtype: tennisModel.Model
+		@return: The Model for the match.
+		"""
+		model = Model()
+		pointJournal.configure(model, config)
+		if self.listener is not None:
+			model.transaction.addCallback(lambda changes: self.listener(matchId, changes))
+		self.models[matchId] = model
+		return model
+
+	async def readStream(self, reader):
+		"""
+		Reads and applies lines from a stream until it ends.
+		@type reader: asyncio.StreamReader
+		@param reader: The stream.
+		"""
+		self.sources += 1
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				self.handle(line)
+		finally:
+			self.sources -= 1
+
+	async def serve(self, host='127.0.0.1', port=0):
+		"""
+		Accepts feed connections. Each connection may carry events for any number of matches.
+		@type host: string
+		@param host: Address to listen on.
+		@type port: integer
+		@param port: Port to listen on. 0 picks a free port.
+		@rtype: asyncio.AbstractServer
+		@return: The server (see its sockets for the port).
+		"""
+		async def connected(reader, writer):
+			try:
+				await self.readStream(reader)
+			finally:
+				writer.close()
+		return await asyncio.start_server(connected, host, port)
+
+	async def readPipe(self, pipe):
+		"""
+		Reads and applies lines from a pipe (or socket, or terminal) until it ends.
+		@type pipe: file object
+		@param pipe: The pipe, e.g. sys.stdin or an opened FIFO.
+		"""
+		loop = asyncio.get_event_loop()
+		reader = asyncio.StreamReader()
+		await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+		await self.readStream(reader)
+
+	async def readFile(self, path):
+		"""
+		Reads and applies lines from a regular file. Reads are done in a worker thread, a block
+		of lines at a time, so other sources keep being served.
+		@type path: string
+		@param path: The file.
+		"""
+		loop = asyncio.get_event_loop()
+		self.sources += 1
+		try:
+			with open(path, 'rb') as f:
+				while True:
+					lines = await loop.run_in_executor(None, f.readlines, readLines)
+					if not lines:
+						break
+					for line in lines:
+						self.handle(line)
+		finally:
+			self.sources -= 1
+
+	def report(self):
+		"""
+		Returns the totals so far.
+		@rtype: dictionary
+		@return: matches, events, errors, sources, seconds (since the first event),
+			eventsPerSecond, and maxLatency (seconds to apply the slowest event).
+		"""
+		seconds = time.time() - self.startTime if self.startTime is not None else 0.0
+		return {'matches': len(self.models), 'events': self.events, 'errors': self.errors,
+			'sources': self.sources, 'seconds': seconds,
+			'eventsPerSecond': self.events / seconds if seconds > 0 else 0.0, 'maxLatency': self.maxLatency}
+
+if __name__ == '__main__':
+	import os
+	import random
+	import tempfile
+	import threading
+
+	courts = 16
+	points = 2000 # Per court
+	def config(court):
+		return json.dumps({'doublesMatch': False, 'mensMatch': 1, 'noEndingTiebreak': False, 'matchType': 'Court {}'.format(court),
+			'numberOfSets': 5, 'winSets': 3, 'server': 0,
+			'team': [[[2*court + 1, 'First', 'Player{}'.format(2*court + 1), 'USA']],
+				[[2*court + 2, 'First', 'Player{}'.format(2*court + 2), 'FRA']]]})
+	def feed(court, rng):
+		# One match per court, started then played point by point
+		lines = ['c{} start {}\n'.format(court, config(court))]
+		lines.extend('c{} {}\n'.format(court, rng.randrange(2)) for i in range(points))
+		return lines
+
+	async def main():
+		rng = random.Random(1)
+		changes = [0]
+		ingest = Ingest(lambda matchId, c: changes.__setitem__(0, changes[0] + 1))
+		server = await ingest.serve()
+		port = server.sockets[0].getsockname()[1]
+		# Courts 0-13 over TCP, court 14 from a file, court 15 from a pipe
+		async def sendCourt(court):
+			(reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+			for line in feed(court, rng):
+				writer.write(line.encode('utf-8'))
+				await writer.drain()
+			writer.close()
+		path = os.path.join(tempfile.gettempdir(), 'pointIngestDemo.feed')
+		with open(path, 'w') as f:
+			f.writelines(feed(courts - 2, rng))
+		(r, w) = os.pipe()
+		pipeLines = feed(courts - 1, rng)
+		def writePipe():
+			with os.fdopen(w, 'w') as f:
+				f.writelines(pipeLines)
+		threading.Thread(target=writePipe).start()
+		await asyncio.gather(*([sendCourt(c) for c in range(courts - 2)] +
+			[ingest.readFile(path), ingest.readPipe(os.fdopen(r, 'rb'))]))
+		while ingest.events < courts * (points + 1) and ingest.errors == 0:
+			await asyncio.sleep(0.01)
+		server.close()
+		os.remove(path)
+		report = ingest.report()
+		print("{matches} matches, {events} events, {errors} errors in {seconds:.3f} s: "
+			"{eventsPerSecond:.0f} events/s, slowest event {maxLatency:.6f} s".format(**report))
+		print("{} change sets published".format(changes[0]))
+		m = ingest.models['c0']
+		print("c0: {} {}".format(m.setScore.get(), m.message.get()))
+	asyncio.new_event_loop().run_until_complete(main())
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+"""
+pointJournal.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Durable point journal for tennis scoreboard based on MVC architecture.
+
+A journal holds the match configuration (first line, JSON), then one byte per
+scoring event: '0' or '1' for the team that won a point, 'u' for undo, 'r' for redo.
+Recording an event only appends to a list in memory. A writer thread does the file
+writes, gathering the events of each flush interval into one write and one fsync
+(group commit), so the scoring buttons never wait for the disk.
+
+If the program dies mid-match, replaying the journal rebuilds the Model, including
+message, point counters and undo history. A torn final write loses at most the
+events of the last flush interval.
+
+Exported classes:
+
+PointJournal -- Appends scoring events to a journal file, with batched fsync.
+
+Exported functions:
+
+matchConfig -- Returns the configuration of the match held by a Model.
+configure -- Sets up a new Model from a match configuration.
+readJournal -- Reads the configuration and events from a journal file.
+replay -- Rebuilds a Model from a journal file.
+"""
+
+import os
+import json
+import threading
+
+import player
+from matchFormat import MatchFormat
+
+POINT_TEAM1 = '0'
+POINT_TEAM2 = '1'
+UNDO = 'u'
+REDO = 'r'
+
+flushInterval = 0.2 # Seconds of events gathered into each write and fsync
+
+def _replace(source, target):
+	"""
+	Renames a file over another, in one step where the platform allows.
+	@type source: string
+	@param source: The file to rename.
+	@type target: string
+	@param target: Its new name, replaced if it exists.
+	"""
+	if hasattr(os, 'replace'):
+		os.replace(source, target)
+		return
+	try:
+		os.rename(source, target)
+	except OSError: # Python 2 on Windows: rename does not replace
+		os.remove(target)
+		os.rename(source, target)
+
+class PointJournal:
+	"""Appends scoring events to a journal file, with batched fsync."""
+	def __init__(self, path, interval=flushInterval):
+		"""
+		Opens an existing journal for appending. Use create() to start a new match.
+		@type path: string
+		@param path: The journal file.
+		@type interval: float
+		@param interval: Seconds of events gathered into each write and fsync.
+		"""
+		self.path = path
+		self.interval = interval
+		self.file = open(path, 'ab')
+		self.pending = [] # Events not yet handed to the writer thread
+		self.recorded = 0 # Events recorded
+		self.written = 0 # Events written and synced
+		self.flushing = False # True if a flush() is waiting, so skip the gathering interval
+		self.closing = False
+		self.condition = threading.Condition()
+		self.writer = threading.Thread(target=self._write, name='pointJournal')
+		self.writer.daemon = True
+		self.writer.start()
+
+	@classmethod
+	def create(cls, path, model, interval=flushInterval):
+		"""
+		Starts a new journal (replacing any old one) for the match held by a Model.
+		The configuration is written and synced before returning.
+		@type path: string
+		@param path: The journal file.
+		@type model: tennisModel.Model
+		@param model: The Model, set up and with the starting server chosen, before any point.
+		@type interval: float
+		@param interval: Seconds of events gathered into each write and fsync.
+		@rtype: PointJournal
+		@return: The journal, open for appending.
+		"""
+		config = matchConfig(model)
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			f.write((json.dumps(config) + '\n').encode('utf-8'))
+			f.flush()
+			os.fsync(f.fileno())
+		_replace(tmp, path) # Atomic (but on Python 2 on Windows), so a crash leaves either the old journal or the new one
+		return cls(path, interval)
+
+	def point(self, team):
+		"""
+		Records a point.
+		@type team: integer
+		@param team: The team that won the point.
+		"""
+		self.record(POINT_TEAM2 if team else POINT_TEAM1)
+
+	def undo(self):
+		"""Records an undo."""
+		self.record(UNDO)
+
+	def redo(self):
+		"""Records a redo."""
+		self.record(REDO)
+
+	def record(self, event):
+		"""
+		Records an event. Returns at once; the writer thread writes it within the flush interval.
+		@type event: string
+		@param event: One event character.
+		"""
+		with self.condition:
+			self.pending.append(event)
+			self.recorded += 1
+			if len(self.pending) == 1:
+				self.condition.notify_all() # Wake the writer; later events join the same group
+
+	def flush(self):
+		"""Waits until all recorded events are written and synced."""
+		with self.condition:
+			target = self.recorded
+			self.flushing = True
+			self.condition.notify_all()
+			while self.written < target and self.writer.is_alive():
+				self.condition.wait(self.interval)
+
+	def close(self):
+		"""Writes any remaining events, and closes the journal."""
+		with self.condition:
+			self.closing = True
+			self.condition.notify_all()
+		self.writer.join()
+		self.file.close()
+
+	def _write(self):
+		"""Writer thread: waits for events, gathers them for one interval, writes and syncs them."""
+		while True:
+			with self.condition:
+				while not self.pending and not self.closing:
+					self.condition.wait()
+				if self.pending and not self.closing and not self.flushing:
+					self.condition.wait(self.interval) # Gather the events of this interval
+				events = self.pending
+				self.pending = []
+				self.flushing = False
+				done = self.closing
+			if events:
+				self.file.write(''.join(events).encode('ascii'))
+				self.file.flush()
+				os.fsync(self.file.fileno())
+				with self.condition:
+					self.written += len(events)
+					self.condition.notify_all()
+			if done:
+				return
+
+def playerFields(p):
+	"""
+	Returns the fields needed to recreate a Player.
+	@type p: player.Player
+	@param p: The player.
+	@rtype: list
+	@return: [rank, first name, last name, country code].
+	"""
+	return [p.rank, p.firstName, p.lastName, p.countryCode]
+
+def matchConfig(model):
+	"""
+	Returns the configuration of the match held by a Model: format, teams and starting server.
+	@type model: tennisModel.Model
+	@param model: The Model, set up and with the starting server chosen.
+	@rtype: dictionary
+	@return: The configuration, as plain (JSON serializable) values.
+	"""
+	return {
+		'doublesMatch': model.doublesMatch.get(),
+		'mensMatch': model.mensMatch.get(),
+		'noEndingTiebreak': model.noEndingTiebreak.get(),
+		'matchType': model.matchType.get(),
+		'numberOfSets': model.numberOfSets.get(),
+		'winSets': model.winSets.get(),
+		'format': model.getFormat().toDict(),
+		'server': model.server.get(),
+		'team': [[playerFields(p) for p in (t.playerA, t.playerB) if p is not None] for t in model.team],
+		'duplicateLastName': sorted(model.duplicateLastName),
+		'specialCaseNames': [list(s) for s in sorted(model.specialCaseNames)]}
+
+def configure(model, config):
+	"""
+	Sets up a new Model from a match configuration, see matchConfig.
+	@type model: tennisModel.Model
+	@param model: A new Model.
+	@type config: dictionary
+	@param config: The configuration. Missing names and name lists default to empty. Without a format,
+		the format is worked out from the other fields.
+	"""
+	with model.batch():
+		model.doublesMatch.set(config['doublesMatch'])
+		model.mensMatch.set(config['mensMatch'])
+		model.noEndingTiebreak.set(config['noEndingTiebreak'])
+		model.matchType.set(config['matchType'])
+		model.numberOfSets.set(config['numberOfSets'])
+		model.winSets.set(config['winSets'])
+		if 'format' in config:
+			model.setFormat(MatchFormat(**config['format']))
+		model.setTeams(player.Team(*[player.Player(*p) for p in t]) for t in config['team'])
+		model.duplicateLastName = set(config.get('duplicateLastName', []))
+		model.specialCaseNames = set(tuple(s) for s in config.get('specialCaseNames', []))
+		model.server.set(config['server'])
+
+def readJournal(path):
+	"""
+	Reads the configuration and events from a journal file.
+	@type path: string
+	@param path: The journal file.
+	@rtype: tuple
+	@return: (configuration dictionary, string of event characters).
+		Any incomplete final write is ignored.
+	"""
+	with open(path, 'rb') as f:
+		config = json.loads(f.readline().decode('utf-8'))
+		events = f.read().decode('ascii', 'ignore')
+	return (config, events)
+
+def replay(path, model):
+	"""
+	Rebuilds a Model from a journal file: configuration, then every event, as one batch.
+	Callbacks attached to the Model get one notification per changed field.
+	@type path: string
+	@param path: The journal file.
+	@type model: tennisModel.Model
+	@param model: A new Model to rebuild the match into.
+	@rtype: tennisModel.Model
+	@return: The Model.
+	"""
+	(config, events) = readJournal(path)
+	with model.batch():
+		configure(model, config)
+		for e in events:
+			if e == POINT_TEAM1:
+				model.incrementGameScore(0)
+			elif e == POINT_TEAM2:
+				model.incrementGameScore(1)
+			elif e == UNDO:
+				model.undo()
+			elif e == REDO:
+				model.redo()
+	return model
+
+if __name__ == '__main__':
+	import sys
+	import time
+	import random
+	import tempfile
+	sys.path.append('../lib')
+	from tennisModel import Model
+	m = Model()
+	m.setMensMatch(1)
+	m.matchType.set("Final")
+	m.setTeams([player.Team(player.Player(1, 'Novak', 'Djokovic', 'SRB')), player.Team(player.Player(2, 'Rafael', 'Nadal', 'ESP'))])
+	m.server.set(0)
+	path = os.path.join(tempfile.gettempdir(), 'pointJournalDemo.journal')
+	journal = PointJournal.create(path, m)
+	rng = random.Random(1)
+	start = time.time()
+	while not m.matchOver:
+		team = 0 if rng.random() < 0.5 else 1
+		m.incrementGameScore(team)
+		journal.point(team)
+	elapsed = time.time() - start
+	journal.close()
+	print("Recorded {} points in {:.4f} s: {} {}".format(len(readJournal(path)[1]), elapsed, m.setScore.get(), m.message.get()))
+	start = time.time()
+	r = replay(path, Model())
+	print("Replayed in {:.4f} s: {} {}".format(time.time() - start, r.setScore.get(), r.message.get()))
+	os.remove(path)
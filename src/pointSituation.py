@@ -0,0 +1,158 @@
+#!/usr/bin/python
+"""
+pointSituation.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Point situation classifier for tennis scoreboard based on MVC architecture.
+
+Works out, in one pass, whether the coming point is game, break, set and / or match
+point, for which team, and by how many points that team leads. Everything is read from
+the match format's compiled scoringTables.ScoringRules: regular game scores from a
+table compiled when the module is imported, tiebreak, set and match from the format's
+own tables. Flags are kept for each team: a deciding point (no-ad at 3-3, or a tiebreak
+won by one point at target - 1 all) is game point for both teams, a break point for the
+receiving team, and set or match point for whichever teams it would win the set or match.
+
+Exported functions:
+
+classify -- Returns the point situation for a match position.
+"""
+
+from scoringTables import pack, gameTables, tiebreakKey, GAME_WON, SET_WON, MATCH_WON
+
+# Situation flags. More than one may apply, e.g. a break point can also be set point.
+GAME_POINT = 1
+BREAK_POINT = 2		# Game point for the receiving team (never in a tiebreak)
+SET_POINT = 4
+MATCH_POINT = 8
+
+maxGamePoints = 4 # Regular game scores never go past advantage (4), see scoringTables.gameTables
+
+def _wins(table, key, team):
+	"""
+	Returns whether a point wins the game (or tiebreak).
+	@type table: list of integers
+	@param table: A game or tiebreak table.
+	@type key: integer
+	@param key: The packed score before the point.
+	@type team: integer
+	@param team: The team that wins the point.
+	@rtype: boolean
+	@return: Whether the team wins the game with the point.
+	"""
+	entry = table[(key << 1) | team]
+	return entry >= 0 and bool(entry & GAME_WON)
+
+def _gameSituation(table, key, a, b, server, tiebreak):
+	"""
+	Works out the game level situation: game point and break point.
+	@type table: list of integers
+	@param table: The game or tiebreak table.
+	@type key: integer
+	@param key: The table key for the score.
+	@type a: integer
+	@param a: First team's points in the game.
+	@type b: integer
+	@param b: Second team's points in the game.
+	@type server: integer
+	@param server: The team serving.
+	@type tiebreak: boolean
+	@param tiebreak: Flag, True if in a tiebreak.
+	@rtype: tuple
+	@return: (flags for either team, leading team or -1 if level, lead in points, (team 1 flags, team 2 flags)).
+	"""
+	teams = [0, 0]
+	for team in (0, 1):
+		if _wins(table, key, team):
+			teams[team] = GAME_POINT
+			if not tiebreak and server >= 0 and team != server:
+				teams[team] |= BREAK_POINT
+	if teams[0] and teams[1]:
+		# Deciding point. In a regular game the receiver, who has break point, is given as the leader.
+		leader = -1 if tiebreak or server < 0 else 1 - server
+		return (teams[0] | teams[1], leader, 0, tuple(teams))
+	if a == b:
+		return (0, -1, 0, (0, 0))
+	leader = 0 if a > b else 1
+	return (teams[leader], leader, abs(a - b), tuple(teams))
+
+def _compileGame(table):
+	"""
+	Compiles the game level situation for every regular game score and server.
+	@type table: list of integers
+	@param table: A regular game table, see scoringTables.gameTables.
+	@rtype: list of tuples
+	@return: Table indexed by (packed score << 1) | server, see _gameSituation.
+	"""
+	situations = [None] * ((pack(maxGamePoints, maxGamePoints) + 1) << 1)
+	for a in range(maxGamePoints + 1):
+		for b in range(maxGamePoints + 1):
+			for server in (0, 1):
+				situations[(pack(a, b) << 1) | server] = _gameSituation(table, pack(a, b), a, b, server, False)
+	return situations
+
+gameSituationTables = dict((advantage, _compileGame(table)) for (advantage, table) in gameTables.items())
+
+def classify(score, tiebreak, server, setGames, matchSets, rules, setIndex):
+	"""
+	Returns the point situation for a match position.
+	@type score: sequence of two integers
+	@param score: The current game score (points).
+	@type tiebreak: boolean
+	@param tiebreak: Flag, True if in a tiebreak.
+	@type server: integer
+	@param server: The team serving, or -1 if none.
+	@type setGames: sequence of two integers
+	@param setGames: Games won by each team in the current set.
+	@type matchSets: sequence of two integers
+	@param matchSets: Sets won by each team.
+	@type rules: scoringTables.ScoringRules
+	@param rules: The compiled rules of the match format.
+	@type setIndex: integer
+	@param setIndex: The current set (0 = first set).
+	@rtype: tuple
+	@return: (flags for either team, leading team or -1 if level, lead in points, (team 1 flags, team 2 flags)).
+		At a deciding point both teams have flags; the leader is then the receiver in a regular game, -1 in a tiebreak.
+	"""
+	(a, b) = score
+	if tiebreak:
+		(flags, leader, lead, teams) = _gameSituation(rules.tiebreakTables[setIndex],
+			tiebreakKey(a, b, rules.tiebreakTargets[setIndex]), a, b, server, True)
+	elif server < 0 or a > maxGamePoints or b > maxGamePoints:
+		(flags, leader, lead, teams) = _gameSituation(rules.gameTable, pack(a, b), a, b, server, False)
+	else:
+		(flags, leader, lead, teams) = gameSituationTables[rules.matchFormat.advantage][(pack(a, b) << 1) | server]
+	if flags:
+		# Set point: any tiebreak game point, or winning this game wins the set. Checked for each team with game point.
+		teams = list(teams)
+		for team in (0, 1):
+			if teams[team] and (tiebreak or rules.setEvents(setGames, team, setIndex) & SET_WON):
+				teams[team] |= SET_POINT
+				if rules.matchEvents(matchSets, team) & MATCH_WON:
+					teams[team] |= MATCH_POINT
+		flags = teams[0] | teams[1]
+		teams = tuple(teams)
+	return (flags, leader, lead, teams)
+
+if __name__ == '__main__':
+	from scoringTables import rulesFor
+	from matchFormat import preset
+	names = ((GAME_POINT, "game"), (BREAK_POINT, "break"), (SET_POINT, "set"), (MATCH_POINT, "match"))
+	fiveSets = rulesFor(preset("Five sets"))
+	fast4 = rulesFor(preset("Fast4"))
+	noAd = rulesFor(preset("No-ad, two sets + tiebreak"))
+	for (score, tiebreak, server, setGames, matchSets, rules, setIndex) in (
+			((3,1), False, 0, (2,2), (0,0), fiveSets, 0), ((1,3), False, 0, (4,5), (1,0), fiveSets, 1),
+			((6,4), True, 1, (6,6), (2,2), fiveSets, 4), ((4,3), False, 1, (5,4), (2,1), fiveSets, 3),
+			((3,3), False, 0, (2,3), (2,2), fast4, 4), ((3,3), False, 0, (5,4), (0,0), noAd, 0),
+			((3,3), False, 0, (3,2), (2,2), fast4, 4), ((4,4), True, 0, (3,3), (2,2), fast4, 4)):
+		(flags, leader, lead, teams) = classify(score, tiebreak, server, setGames, matchSets, rules, setIndex)
+		print("{} -> team {} leads by {}: {}".format(score, leader, lead, "; ".join("team {} {}".format(team,
+			", ".join(name for (flag, name) in names if teams[team] & flag)) for team in (0, 1) if teams[team]) or "-"))
@@ -0,0 +1,417 @@
+#!/usr/bin/python
+"""
+rosterLoader.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Background loading of player lists for tennis scoreboard based on MVC architecture.
+
+A RosterLoader fetches and parses the four ranking lists (men's and women's singles
+and doubles) at the same time, in worker threads, as soon as the program starts, so
+they are ready by the time the operator reaches the player dialog. Each list is
+read a block at a time into a rosterStore.Roster, and the ids of the players parsed
+so far are handed on as they arrive, so a player picker fills in progressively. The
+loader also keeps a player.NameIndex of each list, built as it arrives, for the
+scoreboard names. Subscribers are only ever called on the thread that calls poll
+(with a Tk root, the main loop), so they may update widgets; nothing on that thread
+waits for the network.
+
+Each complete list is also saved as a roster file. On the next run the saved list
+is opened (memory mapped) and delivered at once, without waiting for the network,
+and then checked with the server by a conditional request (see refresh). If the
+list has changed, only the changed players are parsed (see rosterStore.applyChanges),
+the saved list is updated, and the new version is delivered in place of the old one.
+If the server can not be reached, the saved list is used. The text is kept as the
+current version only once its roster file is saved, and a saved list that does not
+match the kept text (its save failed) is made again from the text.
+
+Exported classes:
+
+RosterLoader -- Loads the player lists in the background.
+"""
+
+import sys
+import os
+import time
+import threading
+try:
+	import Queue as queue
+except ImportError:
+	import queue # Python 3
+
+import setup3
+from player import NameIndex
+from rosterStore import Roster, parseRecords, applyChanges, digest
+
+sys.path.append('../lib')
+import refresh
+import tracing
+
+# The lists, by kind
+rosterUrls = (('menSingles', setup3.mensSinglesUrl), ('womenSingles', setup3.womensSinglesUrl),
+	('menDoubles', setup3.mensDoublesUrl), ('womenDoubles', setup3.womensDoublesUrl))
+
+pollInterval = 50 # Milliseconds between checks for new players, with a Tk root
+storeDir = 'rosters' # Where complete lists are saved, as roster files
+closeWait = 10 # Seconds a worker waits for poll to close the saved list it replaces, before saving anyway
+
+tr = tracing.getTracer('rosterLoader')
+
+class RosterLoader:
+	"""Loads the player lists in the background."""
+	def __init__(self, urls=rosterUrls, refresher=None, workers=4, store=storeDir):
+		"""
+		@type urls: sequence of tuples
+		@param urls: (kind, URL) of each list.
+		@type refresher: refresh.Refresher
+		@param refresher: Fetches the lists when they have changed. If None, the shared one (refresh.getRefresher).
+		@type workers: integer
+		@param workers: Number of worker threads.
+		@type store: string
+		@param store: Directory for the saved lists, or None to always fetch and never save.
+		"""
+		self.urls = list(urls)
+		self.refresher = refresher if refresher is not None else refresh.getRefresher()
+		self.workers = workers
+		self.store = store
+		self.rosters = dict((kind, Roster()) for (kind, url) in self.urls) # Players delivered so far, by kind
+		self.done = dict((kind, False) for (kind, url) in self.urls) # True when a list is complete (or failed)
+		self.errors = {} # Kind -> error message, for lists that could not be loaded
+		self.names = dict((kind, NameIndex()) for (kind, url) in self.urls) # Which players need initials, by kind
+		self.subscribers = dict((kind, []) for (kind, url) in self.urls)
+		self.results = queue.Queue() # (kind, records or a whole Roster, done, error) from the workers
+		self.finished = 0 # Lists the workers are through with (delivered, and checked with the server)
+		self.closing = {} # Kind -> (saved roster being replaced, Event set by poll once it is closed)
+		self.root = None
+		self.started = False
+
+	def start(self, root=None):
+		"""
+		Starts loading every list. Returns at once.
+		@type root: Tk widget
+		@param root: If given, poll is called from its main loop until everything is delivered.
+			Otherwise, the caller calls poll.
+		"""
+		if self.started:
+			return
+		self.started = True
+		self.root = root
+		self._startWorkers(self.urls)
+
+	def retry(self, kinds):
+		"""
+		Loads lists again, e.g. after they failed. Returns at once. Call from the thread that calls poll.
+		@type kinds: sequence of strings
+		@param kinds: Which lists.
+		"""
+		idle = self.finished == len(self.urls) # Polling from the Tk main loop has stopped
+		urls = [(kind, url) for (kind, url) in self.urls if kind in kinds]
+		for (kind, url) in urls:
+			self.rosters[kind] = Roster()
+			self.names[kind] = NameIndex()
+			self.done[kind] = False
+			self.errors.pop(kind, None)
+			self.finished -= 1
+		self._startWorkers(urls, idle)
+
+	def _startWorkers(self, urls, schedule=True):
+		"""
+		Starts worker threads to load lists.
+		@type urls: sequence of tuples
+		@param urls: (kind, URL) of each list to load.
+		@type schedule: boolean
+		@param schedule: Flag, True to start polling from the Tk main loop, if there is a root.
+		"""
+		tasks = queue.Queue()
+		for (kind, url) in urls:
+			tasks.put((kind, url))
+		for i in range(min(self.workers, len(urls))):
+			t = threading.Thread(target=self._work, args=(tasks,))
+			t.daemon = True # Never holds up exit, e.g. waiting on a slow server
+			t.start()
+		if self.root is not None and schedule:
+			self.root.after(pollInterval, self._schedule)
+
+	def _work(self, tasks):
+		"""
+		Worker thread: loads lists until there are none left.
+		@type tasks: Queue
+		@param tasks: (kind, URL) of the lists to load.
+		"""
+		while True:
+			try:
+				(kind, url) = tasks.get_nowait()
+			except queue.Empty:
+				return
+			try:
+				self._load(kind, url)
+			except Exception as e: # Not foreseen by _load: the list still ends, with the error
+				self.results.put((kind, [], True, "Couldn't load {}: {!r}".format(url, e)))
+			finally:
+				self.results.put((kind, None, True, None)) # Finished with this list
+
+	def storePath(self, kind):
+		"""
+		@type kind: string
+		@param kind: Which list.
+		@rtype: string
+		@return: The file the list is saved in, or None if lists are not saved.
+		"""
+		if self.store is None:
+			return None
+		return os.path.join(self.store, kind + '.roster')
+
+	def _load(self, kind, url):
+		"""
+		Loads one list. A saved list is delivered at once, then checked with the server; with none, the list is
+		fetched, and the players of each block of complete lines passed on as it arrives.
+		@type kind: string
+		@param kind: Which list.
+		@type url: string
+		@param url: Where it is.
+		"""
+		path = self.storePath(kind)
+		saved = None
+		if path is not None and os.path.exists(path):
+			try:
+				saved = Roster.open(path)
+			except (IOError, ValueError) as e:
+				print("Couldn't open {}, fetching instead: {}".format(path, e))
+		if saved is not None:
+			self.results.put((kind, saved, True, None)) # Whatever the network does
+		try:
+			download = self.refresher.fetch(url, conditional=saved is not None)
+			if download is None: # Not modified: the kept text is current
+				current = self.refresher.cached(url)
+				if current is None or saved.source == digest(current):
+					return # And so is the saved list
+				(roster, changed) = applyChanges(saved, None, current) # Its last save failed
+			elif saved is None:
+				roster = self._receive(kind, download)
+			else:
+				(roster, changed) = applyChanges(saved, self.refresher.cached(url), download.body())
+			if saved is not None:
+				if tr.info:
+					tr.event('listChanged', list=kind, parsed=changed, players=len(roster))
+				if roster is not saved:
+					self._replace(kind, saved, roster)
+		except (IOError, ValueError, IndexError) as e:
+			if saved is None:
+				self.results.put((kind, [], True, "Couldn't load {}: {}".format(url, e)))
+			elif tr.info:
+				tr.event('usingSaved', list=kind, error=str(e))
+			return
+		if (roster is saved or self._save(path, roster)) and download is not None:
+			download.save() # After the roster, so the kept text is never newer than it
+
+	def _replace(self, kind, saved, roster):
+		"""
+		Delivers a new version of a saved list, and waits for poll to close the saved one, so its file can be replaced.
+		@type kind: string
+		@param kind: Which list.
+		@type saved: rosterStore.Roster
+		@param saved: The saved list, delivered earlier.
+		@type roster: rosterStore.Roster
+		@param roster: The new version.
+		"""
+		closed = threading.Event()
+		self.closing[kind] = (saved, closed)
+		self.results.put((kind, roster, True, None))
+		closed.wait(closeWait)
+
+	def _receive(self, kind, download):
+		"""
+		Reads a list as it arrives, passing on the players of each block of complete lines.
+		@type kind: string
+		@param kind: Which list.
+		@type download: refresh.Download
+		@param download: The list.
+		@rtype: rosterStore.Roster
+		@return: The whole list, to save.
+		@raise IOError: If the connection fails part way.
+		@raise ValueError: If a line can not be parsed.
+		"""
+		rest = b''
+		records = []
+		for block in download:
+			lines = rest + block
+			end = lines.rfind(b'\n') + 1
+			(lines, rest) = (lines[:end], lines[end:])
+			if lines:
+				got = parseRecords(lines)
+				records.extend(got)
+				self.results.put((kind, got, False, None))
+		got = parseRecords(rest)
+		records.extend(got)
+		self.results.put((kind, got, True, None))
+		roster = Roster()
+		roster.extend(records)
+		roster.source = digest(download.body())
+		return roster
+
+	def _save(self, path, roster):
+		"""
+		Saves a complete list as a roster file, in a worker thread.
+		@type path: string
+		@param path: The file, or None if lists are not saved.
+		@type roster: rosterStore.Roster
+		@param roster: The list.
+		@rtype: boolean
+		@return: True if it was saved.
+		"""
+		if path is None:
+			return False
+		try:
+			if not os.path.isdir(self.store):
+				os.makedirs(self.store)
+			roster.save(path)
+		except (IOError, OSError) as e:
+			print("Couldn't save {}: {}".format(path, e))
+			return False
+		return True
+
+	def _schedule(self):
+		"""Polls from the Tk main loop, until every list is delivered and checked with the server."""
+		if not self.poll():
+			self.root.after(pollInterval, self._schedule)
+
+	def poll(self):
+		"""
+		Hands on the players that have arrived to the subscribers. Call from the thread that owns the subscribers
+		(with a Tk root, this is done for you).
+		@rtype: boolean
+		@return: True if the workers are through: every list is complete, and checked with the server.
+		"""
+		while True:
+			try:
+				(kind, records, done, error) = self.results.get_nowait()
+			except queue.Empty:
+				break
+			if records is None:
+				self.finished += 1
+				continue
+			old = None
+			if isinstance(records, Roster): # A saved list, or a new version of it, all at once
+				old = self.rosters[kind]
+				roster = self.rosters[kind] = records
+				self.names[kind] = NameIndex(roster.record(id) for id in range(len(roster)))
+				ids = range(len(roster))
+			else:
+				roster = self.rosters[kind]
+				start = len(roster)
+				roster.extend(records)
+				self.names[kind].add(records)
+				ids = range(start, len(roster))
+			if error is not None and self.done[kind]: # The saved list was delivered: keep using it
+				if tr.info:
+					tr.event('usingSaved', list=kind, error=error)
+				error = None
+			self.done[kind] = done
+			if error is not None:
+				self.errors[kind] = error
+				print(error)
+			for func in self.subscribers[kind]:
+				func(ids, done, error)
+			closing = self.closing.get(kind)
+			if closing is not None and closing[0] is old: # The subscribers are through with the saved list
+				del self.closing[kind]
+				old.close()
+				closing[1].set()
+		return self.finished == len(self.urls)
+
+	def subscribe(self, kind, func):
+		"""
+		Asks to be told of a list's players as they arrive. The players delivered so far are given at once.
+		The players are in rosters[kind]. It is replaced when a saved list is opened, and again if a newer
+		version arrives: the ids are then of every player in the new roster.
+		@type kind: string
+		@param kind: Which list, e.g. 'menSingles'.
+		@type func: function
+		@param func: Called with (ids of the new players, done flag, error message or None) for each delivery.
+		"""
+		self.subscribers[kind].append(func)
+		if len(self.rosters[kind]) or self.done[kind]:
+			func(range(len(self.rosters[kind])), self.done[kind], self.errors.get(kind))
+
+	def unsubscribe(self, kind, func):
+		"""
+		Stops giving a list's players to a subscriber.
+		@type kind: string
+		@param kind: Which list.
+		@type func: function
+		@param func: The subscriber.
+		"""
+		if func in self.subscribers[kind]:
+			self.subscribers[kind].remove(func)
+
+	def get(self, kind):
+		"""
+		Returns a list, if it is complete. Never waits.
+		@type kind: string
+		@param kind: Which list.
+		@rtype: rosterStore.Roster
+		@return: The players, or None if the list is still loading.
+		"""
+		return self.rosters[kind] if self.done[kind] else None
+
+if __name__ == '__main__':
+	import random
+	import shutil
+	import tempfile
+	from benchmark import rosterText
+	# Stand in for the server, serving the lists from memory
+	files = dict(('/{}.txt'.format(kind), rosterText(2000, random.Random(i))) for (i, (kind, url)) in enumerate(rosterUrls))
+	(server, base) = refresh.standInServer(files)
+	urls = [(kind, '{}/{}.txt'.format(base, kind)) for (kind, url) in rosterUrls]
+	store = tempfile.mkdtemp()
+	cache = tempfile.mkdtemp()
+	def menSingles(edit):
+		"""Edits the men's singles list on the server: edit is called with its lines, and changes them."""
+		lines = files['/menSingles.txt'].split(b'\n')
+		edit(lines)
+		files['/menSingles.txt'] = b'\n'.join(lines)
+	def newFourth(lines):
+		"""Puts a new player in 4th place; everyone below moves down one."""
+		lines.insert(3, b'4\tJohnson, Steve (USA)')
+		for i in range(4, len(lines)):
+			(rank, tab, rest) = lines[i].partition(b'\t')
+			lines[i] = str(i + 1).encode('ascii') + tab + rest
+	runs = (('Fetched', None),
+		('Unchanged', None),
+		('New 4th player', newFourth),
+		('Server gone', 'stop'))
+	for (run, change) in runs:
+		if change == 'stop':
+			server.shutdown()
+			server.server_close()
+		elif change is not None:
+			menSingles(change)
+		loader = RosterLoader(urls, refresh.Refresher(cache), store=store) # A new refresher each time, as on a new run
+		deliveries = []
+		for (kind, url) in urls:
+			loader.subscribe(kind, lambda ids, done, error, kind=kind: deliveries.append((kind, len(ids), done)))
+		start = time.time()
+		loader.start()
+		while not all(loader.done.values()):
+			loader.poll()
+			time.sleep(0.001)
+		ready = time.time() - start
+		while not loader.poll():
+			time.sleep(0.001)
+		print("{}: {} deliveries, every list ready in {:.3f} s, checked in {:.3f} s".format(run, len(deliveries),
+			ready, time.time() - start))
+		roster = loader.get('menSingles')
+		print(u"  menSingles: {} players, 4th {}, {} shared last names".format(len(roster), roster.string(3),
+			len(loader.names['menSingles'].dups)))
+		for e in tracing.events():
+			if e[1] == 'rosterLoader':
+				print('  ' + tracing.formatEvent(e))
+		tracing.clear()
+	shutil.rmtree(store)
+	shutil.rmtree(cache)
@@ -0,0 +1,556 @@
+#!/usr/bin/python
+"""
+rosterStore.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Structured player lists for tennis scoreboard based on MVC architecture.
+
+A Roster holds a ranking list as typed columns: ranks, country codes (each code
+stored once), and the names in one UTF-8 block with their offsets. A player is an
+id, the position in the roster, and everything about them is found from it in
+constant time, with no text parsing. The player pickers and the Controller hand
+ids around, and make a player.Player only for the players of a match.
+
+A roster is built from the tennischannel text (rank<tab>Last, First (CTY) lines)
+as it arrives, and can be saved to a binary file of the same columns. Opening
+that file maps it into memory: nothing is read or decoded until a player is
+looked at, so a saved list is ready at once, however long. Ids follow the lines of
+the text, and a roster remembers a digest of the text it was made from, so when a
+new version of the list arrives only the lines that changed are parsed (see
+applyChanges).
+
+File layout (little-endian): a header (magic, number of players, number of
+countries, size of the names block, number of rank slots, digest of the source
+text), then the columns, each starting on a four byte boundary: ranks (int32),
+country numbers (uint16), name offsets (uint32, first and last name of each
+player, then the end), the ids in rank order (uint32), where each rank starts in
+that order (uint32, so the players of a rank are found without searching), the
+country codes (three bytes each), and the names.
+
+Usage: python rosterStore.py list.txt list.roster -- makes a roster file from a list.
+
+Exported classes:
+
+Roster -- A player list, as typed columns.
+
+Exported functions:
+
+parseRecords -- Parses a player list into records.
+
+applyChanges -- Brings a roster up to date with a new version of its list.
+"""
+
+import sys
+import os
+import mmap
+import struct
+import hashlib
+import itertools
+from array import array
+
+import player
+
+sys.path.append('../lib')
+from refresh import writeFile
+
+magic = b'TSR2'
+header = struct.Struct('<4sIIII20s') # Magic, players, countries, names size, rank slots, source digest
+countrySize = 3 # Bytes per IOC country code
+noSource = b'\0' * 20 # Digest of a roster not made from one whole text
+
+_cast = hasattr(memoryview, 'cast') # Python 3: columns are read in place from the file
+
+def _pad(n):
+	"""
+	@type n: integer
+	@param n: A size in bytes.
+	@rtype: integer
+	@return: n rounded up to a multiple of four.
+	"""
+	return (n + 3) & ~3
+
+def _column(data, start, typecode, count):
+	"""
+	Reads a column of numbers from roster file contents.
+	@type data: buffer
+	@param data: The file contents (e.g. a memory map).
+	@type start: integer
+	@param start: Where the column starts.
+	@type typecode: string
+	@param typecode: array type code of its numbers.
+	@type count: integer
+	@param count: How many numbers.
+	@rtype: tuple
+	@return: (the column, where the next column starts). The column is a view of data where possible.
+	"""
+	end = start + array(typecode).itemsize * count
+	if _cast and sys.byteorder == 'little':
+		column = memoryview(data)[start:end].cast(typecode)
+	else:
+		column = array(typecode)
+		if hasattr(column, 'frombytes'):
+			column.frombytes(bytes(data[start:end]))
+		else:
+			column.fromstring(bytes(data[start:end])) # Python 2
+		if sys.byteorder == 'big':
+			column.byteswap()
+	return (column, _pad(end))
+
+def _toBytes(column):
+	"""
+	@type column: array
+	@param column: A column of numbers.
+	@rtype: bytes
+	@return: The column in file form (little-endian), padded to a four byte boundary.
+	"""
+	if sys.byteorder == 'big':
+		column = array(column.typecode, column)
+		column.byteswap()
+	data = column.tobytes() if hasattr(column, 'tobytes') else column.tostring() # Python 2
+	return data + b'\0' * (_pad(len(data)) - len(data))
+
+def _lines(txt):
+	"""
+	@type txt: bytes
+	@param txt: A player list.
+	@rtype: list of bytes
+	@return: Its lines with a player on, one per roster id.
+	"""
+	return [line for line in txt.splitlines() if line.strip()]
+
+def digest(txt):
+	"""
+	@type txt: bytes
+	@param txt: A player list.
+	@rtype: bytes
+	@return: Its digest, as kept by a roster made from it.
+	"""
+	return hashlib.sha1(txt).digest()
+
+def parseRecords(txt):
+	"""
+	Parses a player list into records.
+	@type txt: bytes
+	@param txt: The player list, one "rank<tab>Last, First (CTY)" line per player, UTF-8 encoded.
+	@rtype: list of tuples
+	@return: (rank, first name, last name, country code) for each player.
+	"""
+	records = []
+	for line in _lines(txt):
+		(rank, name) = line.decode('utf-8').split('\t')[0:2]
+		(lastName, rest) = name.split(',', 1)
+		(firstName, country) = rest.split('(', 1)
+		records.append((int(rank), firstName.strip(), lastName.strip(), country[0:3]))
+	return records
+
+class Roster(object):
+	"""A player list, as typed columns."""
+	def __init__(self):
+		"""Makes an empty roster, to add players to (see append and extend)."""
+		self.ranks = array('i') # Rank of each player
+		self.countries = array('H') # Country number of each player, see codes
+		self.offsets = array('I', [0]) # Start of each first and last name in names, then the end
+		self.names = bytearray() # The names, UTF-8
+		self.codes = [] # Country codes, by country number
+		self.codeNumbers = {} # Country code -> country number
+		self.byRank = {} # Rank -> ids, while adding players
+		self.rankOrder = None # Ids in rank order, for a roster from a file
+		self.rankStart = None # Where each rank starts in rankOrder, for a roster from a file
+		self.source = noSource # Digest of the text the roster was made from, see digest
+		self.data = None # The memory map, for a roster opened from a file, see close
+
+	def __len__(self):
+		"""
+		@rtype: integer
+		@return: The number of players.
+		"""
+		return len(self.ranks)
+
+	def append(self, rank, first, last, country):
+		"""
+		Adds a player. Its id is the number of players before it.
+		@type rank: integer
+		@param rank: Player's current rank.
+		@type first: string
+		@param first: Player's first name.
+		@type last: string
+		@param last: Player's last name.
+		@type country: string
+		@param country: Player's country (IOC three letter country code).
+		@raise TypeError: If the roster is from a file (they can not be added to).
+		"""
+		self._add(rank, country, first.encode('utf-8'), last.encode('utf-8'))
+
+	def _add(self, rank, country, first, last):
+		"""
+		Adds a player, names already encoded.
+		@raise TypeError: If the roster is from a file.
+		"""
+		if self.rankStart is not None:
+			raise TypeError("A roster from a file can not be added to")
+		number = self.codeNumbers.get(country)
+		if number is None:
+			number = self.codeNumbers[country] = len(self.codes)
+			self.codes.append(country)
+		self.byRank.setdefault(rank, []).append(len(self.ranks))
+		self.ranks.append(rank)
+		self.countries.append(number)
+		self.names.extend(first)
+		self.offsets.append(len(self.names))
+		self.names.extend(last)
+		self.offsets.append(len(self.names))
+		self.source = noSource
+
+	def copy(self, other, start, ranks):
+		"""
+		Adds players from another roster, a run of ids at a time: the names are copied without decoding.
+		@type other: Roster
+		@param other: The other roster.
+		@type start: integer
+		@param start: The id of the first player in the other roster.
+		@type ranks: list of integers
+		@param ranks: The new rank of each player, from start on.
+		@raise TypeError: If this roster is from a file.
+		"""
+		if self.rankStart is not None:
+			raise TypeError("A roster from a file can not be added to")
+		numbers = []
+		for country in other.codes:
+			number = self.codeNumbers.get(country)
+			if number is None:
+				number = self.codeNumbers[country] = len(self.codes)
+				self.codes.append(country)
+			numbers.append(number)
+		stop = start + len(ranks)
+		o = other.offsets
+		shift = len(self.names) - o[2 * start]
+		byRank = self.byRank
+		for (id, rank) in enumerate(ranks, len(self.ranks)):
+			byRank.setdefault(rank, []).append(id)
+		self.ranks.extend(ranks)
+		self.countries.extend([numbers[n] for n in other.countries[start:stop]])
+		self.names.extend(other.names[o[2 * start]:o[2 * stop]])
+		self.offsets.extend([n + shift for n in o[2 * start + 1:2 * stop + 1]])
+		self.source = noSource
+
+	def extend(self, records):
+		"""
+		Adds players.
+		@type records: list of tuples
+		@param records: (rank, first name, last name, country code) for each player, as made by parseRecords.
+		"""
+		for (rank, first, last, country) in records:
+			self.append(rank, first, last, country)
+
+	def rank(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: integer
+		@return: Their rank.
+		"""
+		return self.ranks[id]
+
+	def firstName(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: string
+		@return: Their first name.
+		"""
+		return bytes(self.names[self.offsets[2 * id]:self.offsets[2 * id + 1]]).decode('utf-8')
+
+	def lastName(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: string
+		@return: Their last name.
+		"""
+		return bytes(self.names[self.offsets[2 * id + 1]:self.offsets[2 * id + 2]]).decode('utf-8')
+
+	def countryCode(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: string
+		@return: Their IOC three letter country code.
+		"""
+		return self.codes[self.countries[id]]
+
+	def countryNumber(self, country):
+		"""
+		@type country: string
+		@param country: IOC three letter country code.
+		@rtype: integer
+		@return: Its number in this roster (see countries), or None if no player is from there.
+		"""
+		return self.codeNumbers.get(country)
+
+	def record(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: tuple
+		@return: (rank, first name, last name, country code).
+		"""
+		return (self.ranks[id], self.firstName(id), self.lastName(id), self.countryCode(id))
+
+	def player(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: player.Player
+		@return: The player, as a Player object.
+		"""
+		return player.Player(*self.record(id))
+
+	def string(self, id):
+		"""
+		@type id: integer
+		@param id: The player.
+		@rtype: string
+		@return: The player for display, e.g. "2. Federer, Roger (SUI)" (the form made by setup3.readPlayers).
+		"""
+		return u'{}. {}, {} ({})'.format(self.ranks[id], self.lastName(id), self.firstName(id), self.countryCode(id))
+
+	def ids(self, rank):
+		"""
+		@type rank: integer
+		@param rank: A rank.
+		@rtype: sequence of integers
+		@return: The players with that rank (doubles players share ranks), empty if none.
+		"""
+		if self.rankStart is None:
+			return self.byRank.get(rank, [])
+		if not 0 <= rank < len(self.rankStart) - 1:
+			return []
+		return list(self.rankOrder[self.rankStart[rank]:self.rankStart[rank + 1]])
+
+	def find(self, first, last, country, rank=None):
+		"""
+		Finds a player by name, e.g. one chosen from an older version of the list.
+		@type first: string
+		@param first: First name.
+		@type last: string
+		@param last: Last name.
+		@type country: string
+		@param country: Country code.
+		@type rank: integer
+		@param rank: Where the player was ranked, looked at first, or None.
+		@rtype: integer
+		@return: The player's id, or None if not in the roster.
+		"""
+		number = self.countryNumber(country)
+		if number is None:
+			return None
+		likely = self.ids(rank) if rank is not None else []
+		for id in itertools.chain(likely, range(len(self))):
+			if (self.countries[id] == number and self.lastName(id) == last and
+					self.firstName(id) == first):
+				return id
+		return None
+
+	def toBytes(self):
+		"""
+		@rtype: bytes
+		@return: The roster in file form.
+		"""
+		ranks = array('i', self.ranks)
+		order = array('I', sorted(range(len(ranks)), key=ranks.__getitem__)) # Stable: ties keep their order
+		slots = (ranks[order[-1]] + 2) if ranks else 1
+		rankStart = array('I')
+		i = 0
+		for rank in range(slots):
+			while i < len(order) and ranks[order[i]] < rank:
+				i += 1
+			rankStart.append(i)
+		codes = b''.join(code.encode('ascii')[0:countrySize].ljust(countrySize) for code in self.codes)
+		return b''.join([header.pack(magic, len(ranks), len(self.codes), len(self.names), slots, self.source),
+			_toBytes(ranks), _toBytes(array('H', self.countries)), _toBytes(array('I', self.offsets)),
+			_toBytes(order), _toBytes(rankStart), codes + b'\0' * (_pad(len(codes)) - len(codes)), bytes(self.names)])
+
+	def save(self, path):
+		"""
+		Saves the roster to a file. The file is replaced in one step, so a reader never sees part of it.
+		@type path: string
+		@param path: The file.
+		"""
+		writeFile(path, self.toBytes())
+
+	@classmethod
+	def fromBytes(cls, data):
+		"""
+		Makes a roster from file contents. The columns are read in place where possible.
+		@type data: buffer
+		@param data: The contents (bytes, or a memory map).
+		@rtype: Roster
+		@return: The roster. It can not be added to.
+		@raise ValueError: If data is not a roster.
+		"""
+		if len(data) < header.size:
+			raise ValueError("Not a roster: too short")
+		(mark, count, countries, namesSize, slots, source) = header.unpack(bytes(data[0:header.size]))
+		if mark != magic:
+			raise ValueError("Not a roster: bad magic {!r}".format(mark))
+		roster = cls()
+		(roster.ranks, start) = _column(data, header.size, 'i', count)
+		(roster.countries, start) = _column(data, start, 'H', count)
+		(roster.offsets, start) = _column(data, start, 'I', 2 * count + 1)
+		(roster.rankOrder, start) = _column(data, start, 'I', count)
+		(roster.rankStart, start) = _column(data, start, 'I', slots)
+		codes = bytes(data[start:start + countrySize * countries]).decode('ascii')
+		roster.codes = [codes[i:i + countrySize] for i in range(0, len(codes), countrySize)]
+		roster.codeNumbers = dict((code, i) for (i, code) in enumerate(roster.codes))
+		start = _pad(start + countrySize * countries)
+		if start + namesSize > len(data):
+			raise ValueError("Not a roster: truncated")
+		roster.names = memoryview(data)[start:start + namesSize] if _cast else bytes(data[start:start + namesSize])
+		roster.byRank = None
+		roster.source = source
+		return roster
+
+	@classmethod
+	def open(cls, path):
+		"""
+		Opens a roster file, by mapping it into memory.
+		@type path: string
+		@param path: The file, as made by save.
+		@rtype: Roster
+		@return: The roster. It can not be added to.
+		@raise IOError: If the file can not be read.
+		@raise ValueError: If it is not a roster.
+		"""
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				raise ValueError("Not a roster: empty")
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # Stays mapped after the file is closed
+		try:
+			roster = cls.fromBytes(data)
+		except ValueError:
+			data.close()
+			raise
+		roster.data = data
+		return roster
+
+	def close(self):
+		"""
+		Unmaps the file of a roster made by open, so the file can be replaced (Windows can not replace a
+		mapped file). The roster can not be read afterwards. Does nothing for other rosters.
+		"""
+		if self.data is None:
+			return
+		for column in (self.ranks, self.countries, self.offsets, self.rankOrder, self.rankStart, self.names):
+			if isinstance(column, memoryview):
+				column.release()
+		try:
+			self.data.close()
+		except BufferError:
+			pass # A view of it is still held elsewhere: unmapped when that goes
+		self.data = None
+
+	@classmethod
+	def fromText(cls, txt):
+		"""
+		Makes a roster from a player list.
+		@type txt: bytes
+		@param txt: The player list, see parseRecords.
+		@rtype: Roster
+		@return: The roster.
+		"""
+		roster = cls()
+		roster.extend(parseRecords(txt))
+		roster.source = digest(txt)
+		return roster
+
+def applyChanges(roster, oldTxt, newTxt):
+	"""
+	Brings a roster up to date with a new version of its list. Only players that are new, or whose names
+	or country changed, are parsed; the rest are copied from the roster, with their new rank.
+	@type roster: Roster
+	@param roster: The roster, as made from oldTxt (if it was made from something else, every line is parsed).
+	@type oldTxt: bytes
+	@param oldTxt: The list the roster was made from, or None if not known.
+	@type newTxt: bytes
+	@param newTxt: The new version of the list.
+	@rtype: tuple
+	@return: (the up to date roster, number of lines parsed). The roster itself if nothing changed.
+	@raise ValueError: If a line can not be parsed.
+	"""
+	old = {} # Line without the rank -> id
+	if oldTxt is not None and roster.source == digest(oldTxt):
+		if newTxt == oldTxt:
+			return (roster, 0)
+		for (id, line) in enumerate(_lines(oldTxt)):
+			old.setdefault(line.partition(b'\t')[2], id)
+	updated = Roster()
+	changed = 0
+	start = None # First id of the run of players being copied
+	ranks = [] # Their new ranks
+	for line in _lines(newTxt):
+		(rank, tab, rest) = line.partition(b'\t')
+		id = old.get(rest)
+		if ranks and id != start + len(ranks): # The run ends
+			updated.copy(roster, start, ranks)
+			ranks = []
+		if id is None:
+			updated.extend(parseRecords(line))
+			changed += 1
+		else:
+			if not ranks:
+				start = id
+			ranks.append(int(rank))
+	if ranks:
+		updated.copy(roster, start, ranks)
+	updated.source = digest(newTxt)
+	return (updated, changed)
+
+if __name__ == '__main__':
+	if len(sys.argv) == 3:
+		with open(sys.argv[1], 'rb') as f:
+			roster = Roster.fromText(f.read())
+		roster.save(sys.argv[2])
+		print("Saved {} players to {}".format(len(roster), sys.argv[2]))
+		sys.exit(0)
+	import time
+	import random
+	import tempfile
+	from benchmark import rosterText
+	txt = rosterText(2000, random.Random(1))
+	start = time.time()
+	built = Roster.fromText(txt)
+	print("Built {} players from {} bytes of text in {:.1f} ms".format(len(built), len(txt), 1000 * (time.time() - start)))
+	path = os.path.join(tempfile.gettempdir(), 'rosterStoreDemo.roster')
+	built.save(path)
+	start = time.time()
+	roster = Roster.open(path)
+	print("Opened {} ({} bytes) in {:.3f} ms".format(path, os.path.getsize(path), 1000 * (time.time() - start)))
+	for id in (0, 1, 999, len(roster) - 1):
+		print(u"{}: {} {!r}".format(id, roster.string(id), roster.player(id)))
+	print(u"Rank 500: {}".format([roster.string(id) for id in roster.ids(500)]))
+	assert all(roster.record(id) == built.record(id) for id in range(len(built)))
+	# A week later: the players ranked 11 and 12 change places, the one ranked 500 drops out, and a new one comes in
+	lines = txt.splitlines()
+	(rank11, player11) = lines[10].split(b'\t')
+	(rank12, player12) = lines[11].split(b'\t')
+	newTxt = b'\n'.join(lines[0:10] + [rank11 + b'\t' + player12, rank12 + b'\t' + player11] +
+		lines[12:499] + [b'\t'.join([str(rank).encode('ascii'), line.split(b'\t')[1]])
+		for (rank, line) in enumerate(lines[500:], 500)] + [b'2000\tNewman, Novak (SRB)'])
+	start = time.time()
+	(updated, changed) = applyChanges(roster, txt, newTxt)
+	print("New version applied in {:.1f} ms: {} lines parsed, {} players".format(1000 * (time.time() - start),
+		changed, len(updated)))
+	assert [updated.record(id) for id in range(len(updated))] == list(Roster.fromText(newTxt).record(id)
+		for id in range(len(updated)))
+	start = time.time()
+	for i in range(100000):
+		roster.rank(i % len(roster))
+		roster.lastName(i % len(roster))
+	print("{:.2f} us per lookup".format(10 * (time.time() - start)))
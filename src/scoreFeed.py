@@ -0,0 +1,332 @@
+#!/usr/bin/python3
+"""
+scoreFeed.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Live score feed server for tennis scoreboard based on MVC architecture.
+
+Publishes the state of a Model to local clients, over plain TCP (one JSON object per
+line) and over WebSocket (one JSON object per text message). A client first gets a
+snapshot of the whole state, then one update per point holding just the fields that
+changed, as coalesced by the Model's transaction.
+
+The server runs an asyncio event loop in its own thread, so it never blocks the Tk
+mainloop. Model callbacks hand each change set over with call_soon_threadsafe. Each
+client has a bounded queue; a client that falls that far behind is dropped rather
+than slowing down the others. Messages go straight to the connection while it keeps up. Needs Python 3 (asyncio).
+
+Exported classes:
+
+ScoreFeed -- Serves a Model's live state to TCP and WebSocket clients.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+
+tcpPort = 8765
+wsPort = 8766
+queueSize = 64 # Messages a client may fall behind before it is dropped
+writeBufferLimit = 65536 # Bytes buffered by a client's connection before messages wait in its queue
+
+wsGuid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11' # Fixed by the WebSocket protocol (RFC 6455)
+
+# Model Observables published in the state
+stateFields = ('gameScore', 'setScore', 'currentSet', 'matchScore', 'tiebreak', 'message', 'server', 'winner',
+	'numberOfSets', 'doublesMatch', 'matchType')
+
+def wsFrame(data):
+	"""
+	Wraps data in an (unmasked, final) WebSocket text frame.
+	@type data: bytes
+	@param data: UTF-8 text.
+	@rtype: bytes
+	@return: The frame.
+	"""
+	n = len(data)
+	if n < 126:
+		return struct.pack('!BB', 0x81, n) + data
+	if n < 65536:
+		return struct.pack('!BBH', 0x81, 126, n) + data
+	return struct.pack('!BBQ', 0x81, 127, n) + data
+
+class _Client:
+	"""One connected client: its stream, queue of pending messages, and sending task."""
+	def __init__(self, writer, websocket, size):
+		self.writer = writer
+		self.websocket = websocket
+		self.queue = asyncio.Queue(size)
+		self.task = None
+
+	def send(self, message):
+		"""
+		Sends a message without waiting: straight to the connection if it is keeping up,
+		otherwise into the queue.
+		@type message: tuple of bytes
+		@param message: (TCP line, WebSocket frame).
+		@rtype: boolean
+		@return: False if the client's queue is full.
+		"""
+		data = message[1] if self.websocket else message[0]
+		if self.queue.empty() and self.writer.transport.get_write_buffer_size() < writeBufferLimit:
+			self.writer.write(data)
+			return True
+		try:
+			self.queue.put_nowait(data)
+			return True
+		except asyncio.QueueFull:
+			return False
+
+	async def pump(self):
+		"""Sends queued messages, waiting for the client to take each one (backpressure)."""
+		while True:
+			data = await self.queue.get()
+			self.writer.write(data)
+			await self.writer.drain()
+
+class ScoreFeed:
+	"""Serves a Model's live state to TCP and WebSocket clients."""
+	def __init__(self, host='127.0.0.1', tcpPort=tcpPort, wsPort=wsPort, queueSize=queueSize):
+		"""
+		@type host: string
+		@param host: Address to listen on. Local only by default.
+		@type tcpPort: integer
+		@param tcpPort: Port for line-JSON clients, or None for none.
+		@type wsPort: integer
+		@param wsPort: Port for WebSocket clients, or None for none.
+		@type queueSize: integer
+		@param queueSize: Messages a client may fall behind before it is dropped.
+		"""
+		self.host = host
+		self.tcpPort = tcpPort
+		self.wsPort = wsPort
+		self.queueSize = queueSize
+		self.loop = None
+		self.thread = None
+		self.servers = []
+		self.started = threading.Event()
+		self.error = None
+		# Owned by the event loop thread
+		self.clients = set()
+		self.state = {}
+		self.seq = 0
+		self.dropped = 0 # Clients dropped for falling behind
+
+	def start(self):
+		"""
+		Starts the server thread, and waits until it is listening.
+		@raise OSError: If a port can not be opened.
+		"""
+		self.thread = threading.Thread(target=self._run, name='scoreFeed')
+		self.thread.daemon = True
+		self.thread.start()
+		self.started.wait()
+		if self.error is not None:
+			raise self.error
+
+	def stop(self):
+		"""Closes all connections and stops the server thread."""
+		if self.thread is not None and self.thread.is_alive():
+			self.loop.call_soon_threadsafe(self.loop.stop)
+			self.thread.join()
+
+	def attach(self, model):
+		"""
+		Publishes a Model: its current state now, then each committed change set.
+		@type model: tennisModel.Model
+		@param model: The Model to publish.
+		"""
+		state = dict((name, getattr(model, name).get()) for name in stateFields)
+		state['team'] = [str(t) for t in model.team]
+		self.loop.call_soon_threadsafe(self._reset, state)
+		model.transaction.addCallback(self.publish)
+
+	def publish(self, changes):
+		"""
+		Hands a change set to the server thread. Safe to call from any thread; returns at once.
+		@type changes: dictionary
+		@param changes: Field name to new value.
+		"""
+		self.loop.call_soon_threadsafe(self._update, changes)
+
+	def _run(self):
+		"""Server thread: opens the ports, then runs the event loop until stopped."""
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		try:
+			for (port, websocket) in ((self.tcpPort, False), (self.wsPort, True)):
+				if port is not None:
+					handler = self._serveWebSocket if websocket else self._serveTcp
+					self.servers.append(self.loop.run_until_complete(asyncio.start_server(handler, self.host, port)))
+		except OSError as e:
+			self.error = e
+		self.started.set()
+		if self.error is None:
+			self.loop.run_forever()
+		for s in self.servers:
+			s.close()
+		for c in list(self.clients):
+			self._drop(c)
+		self.loop.run_until_complete(asyncio.sleep(0))
+		self.loop.close()
+
+	def _message(self, obj):
+		"""
+		Encodes a message once for all clients.
+		@type obj: dictionary
+		@param obj: The message.
+		@rtype: tuple of bytes
+		@return: (TCP line, WebSocket frame).
+		"""
+		data = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+		return (data + b'\n', wsFrame(data))
+
+	def _snapshot(self):
+		"""
+		@rtype: tuple of bytes
+		@return: The whole current state, encoded.
+		"""
+		return self._message({'type': 'snapshot', 'seq': self.seq, 'state': self.state})
+
+	def _reset(self, state):
+		"""Replaces the whole state, and sends it to every client."""
+		self.seq += 1
+		self.state = state
+		self._broadcast(self._snapshot())
+
+	def _update(self, changes):
+		"""Applies a change set, and sends it to every client."""
+		self.seq += 1
+		self.state.update(changes)
+		self._broadcast(self._message({'type': 'update', 'seq': self.seq, 'changes': changes}))
+
+	def _broadcast(self, message):
+		"""Queues a message for every client, dropping those that have fallen too far behind."""
+		for c in list(self.clients):
+			if not c.send(message):
+				self.dropped += 1
+				self._drop(c)
+
+	def _drop(self, client):
+		"""Disconnects a client at once, discarding anything still queued."""
+		self.clients.discard(client)
+		if client.task is not None:
+			client.task.cancel()
+		client.writer.transport.abort()
+
+	async def _serve(self, reader, writer, websocket):
+		"""Serves one client: snapshot, then updates, until either side closes."""
+		client = _Client(writer, websocket, self.queueSize)
+		client.send(self._snapshot())
+		self.clients.add(client)
+		client.task = asyncio.ensure_future(client.pump())
+		watch = asyncio.ensure_future(self._readFrames(reader) if websocket else self._readToEnd(reader))
+		try:
+			await asyncio.wait([client.task, watch], return_when=asyncio.FIRST_COMPLETED)
+		finally:
+			watch.cancel()
+			if client in self.clients:
+				self._drop(client)
+
+	async def _serveTcp(self, reader, writer):
+		"""Serves a line-JSON client."""
+		await self._serve(reader, writer, False)
+
+	async def _serveWebSocket(self, reader, writer):
+		"""Completes the WebSocket handshake, then serves the client."""
+		try:
+			request = await reader.readuntil(b'\r\n\r\n')
+		except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+			writer.close()
+			return
+		key = None
+		for line in request.decode('latin-1').split('\r\n')[1:]:
+			(name, _, value) = line.partition(':')
+			if name.strip().lower() == 'sec-websocket-key':
+				key = value.strip()
+		if key is None:
+			writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+			writer.close()
+			return
+		accept = base64.b64encode(hashlib.sha1((key + wsGuid).encode('ascii')).digest()).decode('ascii')
+		writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+			'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept).encode('ascii'))
+		await self._serve(reader, writer, True)
+
+	async def _readToEnd(self, reader):
+		"""Discards anything a TCP client sends, returning when it disconnects."""
+		while await reader.read(4096):
+			pass
+
+	async def _readFrames(self, reader):
+		"""Discards WebSocket frames from a client, returning on a close frame or disconnect."""
+		try:
+			while True:
+				header = await reader.readexactly(2)
+				n = header[1] & 0x7f
+				if n == 126:
+					n = struct.unpack('!H', await reader.readexactly(2))[0]
+				elif n == 127:
+					n = struct.unpack('!Q', await reader.readexactly(8))[0]
+				await reader.readexactly(n + (4 if header[1] & 0x80 else 0)) # Mask key and payload
+				if header[0] & 0x0f == 0x8: # Close
+					return
+		except (asyncio.IncompleteReadError, ConnectionError):
+			return
+
+if __name__ == '__main__':
+	import sys
+	import socket
+	import time
+	sys.path.append('../lib')
+	from tennisModel import Model
+	import player
+	m = Model()
+	m.setMensMatch(0)
+	m.matchType.set("Final")
+	m.setTeams([player.Team(player.Player(1, 'Serena', 'Williams', 'USA')), player.Team(player.Player(2, 'Maria', 'Sharapova', 'RUS'))])
+	m.server.set(0)
+	feed = ScoreFeed(tcpPort=0, wsPort=None, queueSize=8)
+	feed.start()
+	feed.attach(m)
+	port = feed.servers[0].sockets[0].getsockname()[1]
+	received = []
+	def listen():
+		f = socket.create_connection(('127.0.0.1', port)).makefile('rb')
+		lines = [f.readline() for i in range(6)]
+		if len(received) == 0:
+			for line in lines:
+				print(line.decode('utf-8').strip())
+		n = len(lines)
+		while f.readline():
+			n += 1
+		received.append(n)
+	listeners = [threading.Thread(target=listen) for i in range(20)]
+	for t in listeners:
+		t.start()
+	slow = socket.socket() # Never reads, so is dropped once its queue and socket buffers fill
+	slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+	slow.connect(('127.0.0.1', port))
+	time.sleep(0.5)
+	for team in (0, 0, 1, 0, 0):
+		m.incrementGameScore(team)
+	start = time.time()
+	for i in range(20000):
+		m.incrementGameScore(i % 2) # Long deuce game, floods the slow client
+	while feed.seq < 20006: # Wait for the server thread to take everything
+		time.sleep(0.01)
+	print("20000 updates to {} clients in {:.2f} s, {} dropped".format(len(feed.clients), time.time() - start, feed.dropped))
+	feed.stop()
+	for t in listeners:
+		t.join()
+	print("Messages received per client: {}".format(sorted(set(received))))
@@ -14,7 +14,8 @@ The scoring controls for tennis scoreboard based on MVC architecture.
 
 Exported classes:
 
-Scoring -- A simple window providing scoring buttons for two tennis teams (players)
+Scoring -- A simple window providing scoring buttons for two tennis teams (players), plus undo and redo,
+and confirm for the result
 """
 py = 2
 try:
@@ -34,7 +35,7 @@ horizOffset = 565
 vertOffset = 135
 
 class Scoring(tk.Toplevel):
-	"""A simple window providing scoring buttons for two tennis teams (players)"""
+	"""A simple window providing scoring buttons for two tennis teams (players), plus undo and redo, and confirm for the result"""
 
 	def __init__(self, master,team1,team2,doubles):
 		"""
@@ -58,6 +59,24 @@ class Scoring(tk.Toplevel):
 		self.team2Button = tk.Button(self, text=team2+s, width=25, height = 3)
 		self.team2Button.config(bg=score2Color,fg='white')
 		self.team2Button.pack(side='left')
+		# Take back / replay a mis-tapped point
+		self.undoButton = tk.Button(self, text="Undo", width=6, height = 3)
+		self.undoButton.pack(side='left')
+		self.redoButton = tk.Button(self, text="Redo", width=6, height = 3)
+		self.redoButton.pack(side='left')
+		# Ends the match once it has a winner. Until then, the final point can still be undone.
+		self.confirmButton = tk.Button(self, text="Confirm\nresult", width=8, height = 3, state='disabled')
+		self.confirmButton.pack(side='left')
 		self.title("Scoring") # Won't have any effect, given no decorations
 		(x,y) = util.centerCoords(self)
-		util.positionWindow(self, x-horizOffset, y-vertOffset)
\ No newline at end of file
+		util.positionWindow(self, x-horizOffset, y-vertOffset)
+
+	def setMatchOver(self, over):
+		"""
+		Switches between scoring and confirming the result.
+		@type over: boolean
+		@param over: Flag, True if the match has a winner: the team buttons are disabled, confirm enabled.
+		"""
+		self.team1Button.config(state='disabled' if over else 'normal')
+		self.team2Button.config(state='disabled' if over else 'normal')
+		self.confirmButton.config(state='normal' if over else 'disabled')
\ No newline at end of file
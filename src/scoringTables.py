@@ -0,0 +1,452 @@
+#!/usr/bin/python
+"""
+scoringTables.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Precompiled state-transition tables for tennis scoring.
+
+The rules for a regular game, a tiebreak, a set, and a match are compiled once
+into flat lists. Each list is indexed by (sub-state << 1) | pointWinner, where the
+sub-state is a score packed as in matchState.MatchState (first team in the low bits).
+Entries hold event flags (see below), and for regular games the next packed score.
+
+A matchFormat.MatchFormat compiles into a ScoringRules: the game table, and one set
+table and one tiebreak table per set of the match, so the final set rule is just a
+different table in the last slot. Scoring code indexes these by the current set and
+never tests the format itself. Tables are shared between formats, and the rules for
+the standard formats are built when the module is imported.
+
+Exported classes:
+
+ScoringRules -- The set of tables for one match format.
+
+Exported functions:
+
+tiebreakKey -- Returns the tiebreak table key for a score.
+setKey -- Returns the set table key for a set score.
+tiebreakTable -- Returns the tiebreak table for a target, compiling it on first use.
+setTable -- Returns the set table for a set rule, compiling it on first use.
+rulesFor -- Returns the (cached) ScoringRules for a match format.
+"""
+
+from matchState import pointBits, pointMask
+from matchFormat import presets
+
+# Event flags
+GAME_WON = 1		# Point won the game (or tiebreak)
+SET_WON = 2			# Game won the set
+ENTER_TIEBREAK = 4	# Set score is now level at six games, tiebreak follows
+SERVER_CHANGE = 8	# Server changes after this point / game
+MATCH_WON = 16		# Set won the match
+MATCH_TIEBREAK = 32	# Sets are level, final match tiebreak follows
+
+eventBits = 6 # Regular game entries hold (next score << eventBits) | events
+eventMask = (1 << eventBits) - 1
+
+gameBits = 7 # Games are packed in the same width as points within a set key
+
+def pack(a, b):
+	"""
+	Packs a pair of scores.
+	@type a: integer
+	@param a: First team's score.
+	@type b: integer
+	@param b: Second team's score.
+	@rtype: integer
+	@return: The packed pair, first team in the low bits.
+	"""
+	return a | (b << pointBits)
+
+def unpack(s):
+	"""
+	Unpacks a pair of scores.
+	@type s: integer
+	@param s: The packed pair.
+	@rtype: list of integers
+	@return: The two scores.
+	"""
+	return [s & pointMask, s >> pointBits]
+
+def _winning(score, team, target, margin=2):
+	"""
+	Returns whether a team has won a game-like contest (at least target, ahead by the margin).
+	@type score: list of integers
+	@param score: The score after the point / game.
+	@type team: integer
+	@param team: The team that just scored.
+	@type target: integer
+	@param target: Minimum score needed to win.
+	@type margin: integer
+	@param margin: Lead needed to win.
+	@rtype: boolean
+	@return: Whether the team has won.
+	"""
+	return score[team] >= target and score[team] - score[1-team] >= margin
+
+def _compileGame(advantage=True):
+	"""
+	Compiles a regular game table. The score runs 0-4 (4 = advantage).
+	@type advantage: boolean
+	@param advantage: Flag, True for advantage games, False for no-ad (the point at deuce wins the game).
+	@rtype: list of integers
+	@return: The regular game table. Unreachable entries are -1.
+	"""
+	table = [-1] * ((pack(4,4) + 1) << 1)
+	margin = 2 if advantage else 1
+	for a in range(5):
+		for b in range(5):
+			if (a == 4 and b < 3) or (b == 4 and a < 3) or (a == 4 and b == 4):
+				continue # Not a live game score
+			if not advantage and (a == 4 or b == 4):
+				continue # No advantage in a no-ad game
+			for team in (0,1):
+				s = [a,b]
+				s[team] += 1
+				if s[0] == 4 and s[1] == 4: # Point was Ad, and non-leading player scored, so back to Deuce
+					s = [3,3]
+				if _winning(s, team, 4, margin):
+					entry = GAME_WON
+				else:
+					entry = pack(s[0], s[1]) << eventBits
+				table[(pack(a,b) << 1) | team] = entry
+	return table
+
+def _compileTiebreak(target, margin=2):
+	"""
+	Compiles a tiebreak table. Scores beyond the target are reduced by tiebreakKey.
+	@type target: integer
+	@param target: Points needed to win the tiebreak.
+	@type margin: integer
+	@param margin: Lead needed to win: 2, or 1 (the point at target - 1 all wins).
+	@rtype: list of integers
+	@return: The tiebreak table. Unreachable entries are -1.
+	"""
+	table = [-1] * ((pack(target, target) + 1) << 1)
+	for a in range(target + 1):
+		for b in range(target + 1):
+			if (a >= target or b >= target) and abs(a-b) >= margin:
+				continue # Tiebreak already over
+			for team in (0,1):
+				s = [a,b]
+				s[team] += 1
+				events = 0
+				if _winning(s, team, target, margin):
+					events |= GAME_WON | SET_WON
+					# The team that received the first tiebreak point serves the next game
+					if (s[0] + s[1]) // 2 % 2 == 0:
+						events |= SERVER_CHANGE
+				elif (s[0] + s[1]) % 2 == 1: # It's an odd point, so change server.
+					events |= SERVER_CHANGE
+				table[(pack(a,b) << 1) | team] = events
+	return table
+
+def _setSize(gamesPerSet, tiebreakAt):
+	"""
+	Returns the largest games count held in a set table. Advantage sets beyond it are reduced by setKey.
+	@type gamesPerSet: integer
+	@param gamesPerSet: Games needed to win the set.
+	@type tiebreakAt: integer
+	@param tiebreakAt: Games all at which the set goes to a tiebreak, or 0 for an advantage set.
+	@rtype: integer
+	@return: The largest games count.
+	"""
+	return max(gamesPerSet + 1, tiebreakAt)
+
+def _compileSet(gamesPerSet=6, tiebreakAt=6):
+	"""
+	Compiles a set table, keyed by the games before the game just won.
+	@type gamesPerSet: integer
+	@param gamesPerSet: Games needed to win the set, by two clear.
+	@type tiebreakAt: integer
+	@param tiebreakAt: Games all at which the set goes to a tiebreak, or 0 for an advantage set.
+	@rtype: list of integers
+	@return: The set table. Unreachable entries are -1.
+	"""
+	size = _setSize(gamesPerSet, tiebreakAt)
+	table = [-1] * ((pack(size, size) + 1) << 1)
+	for a in range(size + 1):
+		for b in range(size + 1):
+			if _winning([a,b], 0, gamesPerSet) or _winning([a,b], 1, gamesPerSet) or \
+					(tiebreakAt and max(a,b) > tiebreakAt):
+				continue # Set already over
+			for team in (0,1):
+				s = [a,b]
+				s[team] += 1
+				events = SERVER_CHANGE
+				if _winning(s, team, gamesPerSet):
+					events |= SET_WON
+				elif tiebreakAt and s[0] == tiebreakAt and s[1] == tiebreakAt:
+					events |= ENTER_TIEBREAK
+				table[(pack(a,b) << 1) | team] = events
+	return table
+
+def _compileMatch(winSets, matchTiebreak):
+	"""
+	Compiles a match table, keyed by the sets before the set just won.
+	@type winSets: integer
+	@param winSets: Number of sets needed to win.
+	@type matchTiebreak: boolean
+	@param matchTiebreak: Flag, True if level sets go to a match tiebreak instead of a final set.
+	@rtype: list of integers
+	@return: The match table. Unreachable entries are -1.
+	"""
+	table = [-1] * ((pack(winSets, winSets) + 1) << 1)
+	for a in range(winSets):
+		for b in range(winSets):
+			for team in (0,1):
+				s = [a,b]
+				s[team] += 1
+				events = 0
+				if s[team] == winSets:
+					events |= MATCH_WON
+				elif matchTiebreak and s == [winSets - 1, winSets - 1]:
+					events |= MATCH_TIEBREAK
+				table[(pack(a,b) << 1) | team] = events
+	return table
+
+gameTables = {True: _compileGame(True), False: _compileGame(False)} # By advantage flag
+gameTable = gameTables[True] # Advantage games, as in the standard formats
+tiebreakTables = {} # (target, margin) -> table
+setTables = {} # (gamesPerSet, tiebreakAt) -> table
+
+def tiebreakKey(a, b, target):
+	"""
+	Returns the tiebreak table key for a score, reducing long tiebreaks. The lead and the
+	parity of the total are kept, so the events are unchanged.
+	@type a: integer
+	@param a: First team's points.
+	@type b: integer
+	@param b: Second team's points.
+	@type target: integer
+	@param target: Points needed to win the tiebreak.
+	@rtype: integer
+	@return: The packed, reduced score.
+	"""
+	while a > target or b > target:
+		a -= 2
+		b -= 2
+	return pack(a, b)
+
+def setKey(a, b, limit):
+	"""
+	Returns the set table key for a set score, reducing long advantage sets (the lead is kept).
+	@type a: integer
+	@param a: First team's games.
+	@type b: integer
+	@param b: Second team's games.
+	@type limit: integer
+	@param limit: Games beyond which level games are reduced, see ScoringRules.setLimits.
+	@rtype: integer
+	@return: The packed, reduced set score.
+	"""
+	m = min(a, b)
+	if m > limit:
+		a -= m - limit
+		b -= m - limit
+	return pack(a, b)
+
+def setLimit(gamesPerSet, tiebreakAt):
+	"""
+	Returns the set key limit for a set rule. Tiebreak sets are never reduced, their scores stay within the table.
+	@type gamesPerSet: integer
+	@param gamesPerSet: Games needed to win the set.
+	@type tiebreakAt: integer
+	@param tiebreakAt: Games all at which the set goes to a tiebreak, or 0 for an advantage set.
+	@rtype: integer
+	@return: The limit, see setKey.
+	"""
+	return _setSize(gamesPerSet, tiebreakAt) if tiebreakAt else gamesPerSet - 1
+
+def tiebreakTable(target, margin=2):
+	"""
+	Returns the tiebreak table for a target, compiling it on first use.
+	@type target: integer
+	@param target: Points needed to win the tiebreak.
+	@type margin: integer
+	@param margin: Lead needed to win.
+	@rtype: list of integers
+	@return: The tiebreak table.
+	"""
+	table = tiebreakTables.get((target, margin))
+	if table is None:
+		table = tiebreakTables[(target, margin)] = _compileTiebreak(target, margin)
+	return table
+
+def setTable(gamesPerSet=6, tiebreakAt=6):
+	"""
+	Returns the set table for a set rule, compiling it on first use.
+	@type gamesPerSet: integer
+	@param gamesPerSet: Games needed to win the set.
+	@type tiebreakAt: integer
+	@param tiebreakAt: Games all at which the set goes to a tiebreak, or 0 for an advantage set.
+	@rtype: list of integers
+	@return: The set table.
+	"""
+	table = setTables.get((gamesPerSet, tiebreakAt))
+	if table is None:
+		table = setTables[(gamesPerSet, tiebreakAt)] = _compileSet(gamesPerSet, tiebreakAt)
+	return table
+
+class ScoringRules:
+	"""The set of tables for one match format. Per set lists are indexed by the set (0 = first set)."""
+	def __init__(self, matchFormat):
+		"""
+		@type matchFormat: matchFormat.MatchFormat
+		@param matchFormat: The format to compile.
+		"""
+		f = matchFormat
+		self.matchFormat = f
+		self.maxSets = f.maxSets()
+		self.gameTable = gameTables[f.advantage]
+		# Regular game table split by point winner: next packed score, or -1 if the game is won.
+		self.gameNext = tuple([(e >> eventBits) if e >= 0 and not e & GAME_WON else -1
+			for e in self.gameTable[team::2]] for team in (0,1))
+		self.tiebreakAts = [] # Games all at which each set goes to a tiebreak, 0 for none
+		self.setTables = []
+		self.setLimits = [] # See setKey
+		self.tiebreakTargets = [] # Points to win each set's tiebreak (or the match tiebreak)
+		self.tiebreakMargins = []
+		self.tiebreakTables = []
+		for i in range(self.maxSets):
+			if i < self.maxSets - 1:
+				(at, target, margin) = (f.tiebreakAt, f.tiebreakTarget, f.tiebreakMargin)
+			elif f.matchTiebreak:
+				(at, target, margin) = (f.finalTiebreakAt, f.matchTiebreak, 2) # The set is only a tiebreak
+			else:
+				(at, target, margin) = (f.finalTiebreakAt, f.finalTiebreakTarget, f.tiebreakMargin)
+			self.tiebreakAts.append(at)
+			self.setTables.append(setTable(f.gamesPerSet, at))
+			self.setLimits.append(setLimit(f.gamesPerSet, at))
+			self.tiebreakTargets.append(target)
+			self.tiebreakMargins.append(margin)
+			self.tiebreakTables.append(tiebreakTable(target, margin))
+		self.matchTable = _compileMatch(f.winSets, bool(f.matchTiebreak))
+
+	def gameEvents(self, score, team):
+		"""
+		Next score and events for a point in a regular game.
+		@type score: sequence of two integers
+		@param score: The game score before the point.
+		@type team: integer
+		@param team: The team that won the point.
+		@rtype: tuple
+		@return: (next game score as a list, event flags).
+		"""
+		entry = self.gameTable[(pack(score[0], score[1]) << 1) | team]
+		return (unpack(entry >> eventBits), entry & eventMask)
+
+	def tiebreakEvents(self, score, team, setIndex):
+		"""
+		Events for a point in a tiebreak.
+		@type score: sequence of two integers
+		@param score: The tiebreak score before the point.
+		@type team: integer
+		@param team: The team that won the point.
+		@type setIndex: integer
+		@param setIndex: The set being played.
+		@rtype: integer
+		@return: Event flags.
+		"""
+		return self.tiebreakTables[setIndex][(tiebreakKey(score[0], score[1], self.tiebreakTargets[setIndex]) << 1) | team]
+
+	def setEvents(self, score, team, setIndex):
+		"""
+		Events for a game won in a set.
+		@type score: sequence of two integers
+		@param score: The set score (games) before the game.
+		@type team: integer
+		@param team: The team that won the game.
+		@type setIndex: integer
+		@param setIndex: The set being played.
+		@rtype: integer
+		@return: Event flags.
+		"""
+		return self.setTables[setIndex][(setKey(score[0], score[1], self.setLimits[setIndex]) << 1) | team]
+
+	def matchEvents(self, score, team):
+		"""
+		Events for a set won in a match.
+		@type score: sequence of two integers
+		@param score: The match score (sets) before the set.
+		@type team: integer
+		@param team: The team that won the set.
+		@rtype: integer
+		@return: Event flags.
+		"""
+		return self.matchTable[(pack(score[0], score[1]) << 1) | team]
+
+_rules = {}
+
+def rulesFor(matchFormat):
+	"""
+	Returns the (cached) ScoringRules for a match format.
+	@type matchFormat: matchFormat.MatchFormat
+	@param matchFormat: The format.
+	@rtype: ScoringRules
+	@return: The compiled tables.
+	"""
+	rules = _rules.get(matchFormat)
+	if rules is None:
+		rules = _rules[matchFormat] = ScoringRules(matchFormat)
+	return rules
+
+for (_name, _format) in presets:
+	rulesFor(_format)
+
+if __name__ == '__main__':
+	# Exhaustive check of every table entry against the rules written out directly.
+	count = 0
+	for advantage in (True, False):
+		for a in range(5):
+			for b in range(5):
+				for team in (0,1):
+					entry = gameTables[advantage][(pack(a,b) << 1) | team]
+					if entry < 0:
+						continue
+					s = [a,b]
+					s[team] += 1
+					won = s[team] > 3 and (abs(s[0]-s[1]) > 1 or not advantage)
+					if s == [4,4]:
+						s = [3,3]
+					assert bool(entry & GAME_WON) == won, (advantage, a, b, team)
+					assert won or unpack(entry >> eventBits) == s, (advantage, a, b, team)
+					count += 1
+	for (target, margin) in ((7, 2), (10, 2), (5, 1)):
+		for a in range(3*target):
+			for b in range(3*target):
+				if (a >= target or b >= target) and abs(a-b) >= margin:
+					continue
+				if margin == 1 and (a >= target or b >= target):
+					continue
+				for team in (0,1):
+					s = [a,b]
+					s[team] += 1
+					events = tiebreakTable(target, margin)[(tiebreakKey(a, b, target) << 1) | team]
+					won = s[team] >= target and abs(s[0]-s[1]) >= margin
+					# Server changes after odd points, and after the tiebreak goes to the first point's receiver
+					first = (a + b + 1) // 2 % 2 # 0 if the first tiebreak server served this point
+					changes = (first == 0) if won else ((a + b + 1) % 2 == 1)
+					assert bool(events & SERVER_CHANGE) == changes, (a, b, team)
+					assert bool(events & GAME_WON) == won, (a, b, team)
+					count += 1
+	for (games, at) in ((6, 6), (6, 0), (6, 12), (4, 3), (4, 4)):
+		limit = setLimit(games, at)
+		for a in range(40):
+			for b in range(40):
+				if (max(a,b) >= games and abs(a-b) > 1) or (at and max(a,b) > at):
+					continue
+				for team in (0,1):
+					s = [a,b]
+					s[team] += 1
+					events = setTable(games, at)[(setKey(a, b, limit) << 1) | team]
+					assert bool(events & SET_WON) == (s[team] >= games and abs(s[0]-s[1]) > 1), (games, at, a, b, team)
+					assert bool(events & ENTER_TIEBREAK) == (at > 0 and s == [at,at]), (games, at, a, b, team)
+					count += 1
+	print("Checked {} table entries.".format(count))
@@ -12,10 +12,13 @@ See LICENSE.txt for license information.
 ---------------------------------------------------
 
 Third setup dialog. Gets all remaining setup information, including players.
+The player lists come from a rosterLoader.RosterLoader, and fill the pickers as they arrive.
 
 Exported classes:
 
 Setup3 -- Third setup dialog, get player names.
+
+PlayerPicker -- Searchable player chooser.
 """
 py  = 2
 try:
@@ -24,6 +27,9 @@ except:
 	import tkinter as tk
 	py = 3
 import player
+from player import NameIndex
+import matchFormat
+from playerSearch import PlayerIndex
 
 import sys
 sys.path.append('../lib')
@@ -36,10 +42,20 @@ mensDoublesUrl = baseUrl + 'menDoubles.txt'
 womensDoublesUrl = baseUrl + 'womenDoubles.txt'
 
 menuWidth = 29
+pickerRows = 6 # Matches shown by a player picker
+
+# Format presets (see matchFormat.presets) offered for each kind of match, the first is the default.
+# With no ending tiebreak, the default is the first one whose final set is played out on advantage.
+womensSinglesFormats = ("Three sets", "Three sets, final set tiebreak to 10", "Three sets, final set advantage",
+	"Short sets", "Fast4")
+mensSinglesFormats = ("Three sets", "Five sets", "Three sets, final set tiebreak to 10",
+	"Five sets, final set tiebreak to 10", "Five sets, final set tiebreak at 12 all", "Three sets, final set advantage",
+	"Five sets, final set advantage", "Short sets", "Fast4")
+doublesFormats = ("Two sets + tiebreak", "Three sets", "No-ad, two sets + tiebreak", "Short sets", "Fast4")
 
 class Setup3(tk.Toplevel):
 	"""Third setup dialog, get player names."""
-	def __init__(self, master, mens, doubles):
+	def __init__(self, master, mens, doubles, rosters, noEndingTiebreak=False):
 		"""
 		@type master: Toplevel widget
 		@param master: Main application window.
@@ -47,137 +63,250 @@ class Setup3(tk.Toplevel):
 		@param mens: Flag, 0 - women's match, 1 = men's match, 2 = mixed match.
 		@type doubles: boolean
 		@param doubles: Flag, True if this is a doubles match.
+		@type rosters: rosterLoader.RosterLoader
+		@param rosters: The player lists, loaded (or loading) in the background.
+		@type noEndingTiebreak: boolean
+		@param noEndingTiebreak: Flag, True to offer a singles format whose final set has no tiebreak as the default.
 		"""
 		tk.Toplevel.__init__(self, master)
 		self.overrideredirect(1) # No window decorations, no way to close window
 		self.geometry('+100+100')
-		self.numberOfSets = tk.IntVar()
-		self.numberOfSets.set(3)
+		if doubles:
+			formats = doublesFormats
+		elif mens == 1:
+			formats = mensSinglesFormats
+		else:
+			formats = womensSinglesFormats
+		default = formats[0]
+		if noEndingTiebreak and not doubles:
+			default = [name for name in formats if matchFormat.preset(name).finalTiebreakAt == 0][0]
+		self.formatName = tk.StringVar(self)
+		self.formatName.set(default)
 		self.doubles = doubles
-		self.player1String = tk.StringVar(self) # First player, team 1, string including all object properties in parseable format
-		self.player2String = tk.StringVar(self) # First player, team 2, string including all object properties in parseable format
-		self.player1aString = tk.StringVar(self) # Second player, team 1, string including all object properties in parseable format
-		self.player2aString = tk.StringVar(self) # Second player, team 2, string including all object properties in parseable format
-		self.duplicateLastName = set([])
-
-		if doubles: # Doubles match
-			tk.Radiobutton(self, text="Two sets + tiebreak", padx = 20, variable = self.numberOfSets,
-				value = 2, width = 20, anchor='w').pack()
-			tk.Radiobutton(self, text="Three sets", padx = 20, variable = self.numberOfSets,
-				value = 3, width = 20, anchor='w').pack()
-		elif mens == 1: # Mens singles match
-			tk.Radiobutton(self, text="Three sets", padx = 20, variable = self.numberOfSets,
-				value = 3, width = 20, anchor='w').pack()
-			tk.Radiobutton(self, text="Five sets", padx = 20, variable = self.numberOfSets,
-				value = 5, width = 20, anchor='w').pack()
+		self.names = NameIndex() # Which players need initials on the scoreboard, once the lists are in
 
+		for name in formats:
+			tk.Radiobutton(self, text=name, padx = 20, variable = self.formatName,
+				value = name, width = 36, anchor='w').pack()
+
+		# Player lists load in the background (see rosterLoader), and fill the pickers as they arrive
+		if not doubles: # Singles match
+			kind1 = kind2 = 'womenSingles' if mens == 0 else 'menSingles'
+		elif(mens == 0):  # Womens doubles match
+			kind1 = kind2 = 'womenDoubles'
+		elif(mens == 1): # Mens doubles match
+			kind1 = kind2 = 'menDoubles'
+		else: # Mixed doubles match: women first on each team
+			kind1 = 'womenDoubles'
+			kind2 = 'menDoubles'
+		self.rosters = rosters
+		self.kinds = sorted(set((kind1, kind2)))
+		# Shared by the pickers of each list
+		self.indexes = dict((kind, PlayerIndex(rosters.rosters[kind])) for kind in self.kinds)
+		self.pickers = dict((kind, []) for kind in self.kinds)
 		if not doubles: # Singles match
-			if (mens == 0): # Womens singles match
-				# Get list of womens singles players
-				plist = readPlayers(womensSinglesUrl)
-			else: # Mens singles match
-				# Get list of mens singles players
-				plist = readPlayers(mensSinglesUrl)
-			listToCheck = plist
-			self.player1String.set(plist[0]) # default value
-			self.player2String.set(plist[1]) # default value
-			tk.Label(self,text='Player 1').pack()
-			# Get a formatted dropdown menu for player 1
-			w1 = myDropdown(self,self.player1String,plist)
-			w1.pack()
-			tk.Label(self,text='Player 2').pack()
-			# Get a formatted dropdown menu for player 2
-			w2 = myDropdown(self,self.player2String,plist)
-			w2.pack()
+			self.picker1 = self.addPicker('Player 1', kind1)
+			self.picker2 = self.addPicker('Player 2', kind1)
+			# Default players: the top two
+			defaults = ((self.picker1, 0), (self.picker2, 1))
 		else: # Doubles match
-			if(mens == 0):  # Womens doubles match
-				# Get list of womens doubles players
-				plist1 = plist2 = readPlayers(womensDoublesUrl)
-				listToCheck = plist1[:]
-			elif(mens == 1): # Mens doubles match
-				# Get list of mens doubles players
-				plist1 = plist2 = readPlayers(mensDoublesUrl)
-				listToCheck = plist1[:]
-			else: # Mixed doubles match
-				# Get list of womens doubles players
-				plist1 = readPlayers(womensDoublesUrl)
-				# Get list of mens doubles players
-				plist2 = readPlayers(mensDoublesUrl)
-				listToCheck = plist1[:]
-				listToCheck.extend(plist2)
-			self.player1String.set(plist1[0]) # default value
-			self.player2String.set(plist1[2]) # default value
-			self.player1aString.set(plist2[1]) # default value
-			self.player2aString.set(plist2[3]) # default value
-			tk.Label(self, text='Team 1').pack()
-			# Get a formatted dropdown menu for team 1, player 1
-			w1 = myDropdown(self,self.player1String,plist1)
-			w1.pack()
-			# Get a formatted dropdown menu for team 1, player 2
-			w1a = myDropdown(self,self.player1aString,plist2)
-			w1a.pack()
-			tk.Label(self, text='Team 2').pack()
-			# Get a formatted dropdown menu for team 2, player 1
-			w2 = myDropdown(self,self.player2String,plist1)
-			w2.pack()
-			# Get a formatted dropdown menu for team 2, player 2
-			w2a = myDropdown(self,self.player2aString,plist2)
-			w2a.pack()
-
-		# Find duplicate last names (used to determine need for first initial)
-		self.duplicateLastName = duplicates(listToCheck)
-
-		self.startButton = tk.Button(self, text='Start', width=8)
+			self.picker1 = self.addPicker('Team 1', kind1) # First player, team 1
+			self.picker1a = self.addPicker(None, kind2) # Second player, team 1
+			self.picker2 = self.addPicker('Team 2', kind1) # First player, team 2
+			self.picker2a = self.addPicker(None, kind2) # Second player, team 2
+			defaults = ((self.picker1, 0), (self.picker2, 2), (self.picker1a, 1), (self.picker2a, 3))
+		self.defaults = list(defaults) # (picker, id) for pickers still waiting for their default player
+		self.status = tk.Label(self, text='Loading players...')
+		self.status.pack()
+
+		self.startButton = tk.Button(self, text='Start', width=8, state='disabled') # Enabled once the players are in
 		self.startButton.pack(side='left')
+		# Shown if a list can not be loaded (the dialog has no window decorations to close it by)
+		self.retryButton = tk.Button(self, text='Retry', width=8, command=self.retry)
+		self.quitButton = tk.Button(self, text='Quit', width=8, command=self.master.destroy)
 		self.title("Match Info #3") # Won't have any effect, given no decorations
+		self.subscribers = [] # (kind, subscriber) given to the loader
+		for kind in self.kinds:
+			func = self.playersArrived(kind)
+			self.subscribers.append((kind, func))
+			rosters.subscribe(kind, func)
 		util.center(self)
 
-	def getNumberOfSets(self):
+	def addPicker(self, label, kind):
 		"""
-		Returns number of sets.
-		@rtype: integer
-		@return: Number of sets.
+		Adds a player picker to the dialog.
+		@type label: string
+		@param label: Shown above the picker, or None.
+		@type kind: string
+		@param kind: Which list to choose from, see rosterLoader.rosterUrls.
+		@rtype: PlayerPicker
+		@return: The picker.
 		"""
-		return self.numberOfSets.get()
+		if label is not None:
+			tk.Label(self, text=label).pack()
+		picker = PlayerPicker(self, self.indexes[kind], kind)
+		picker.pack()
+		self.pickers[kind].append(picker)
+		return picker
 
-	def getTeamStrings(self):
+	def playersArrived(self, kind):
 		"""
-		Returns list of strings for the players on each team.
-		@rtype: list of strings
-		@return: List of strings for the players on each team. Each string includes all object properties in parseable format.
+		Returns the subscriber that adds the players of a list, as they arrive, to its pickers.
+		@type kind: string
+		@param kind: Which list, see rosterLoader.rosterUrls.
+		@rtype: function
+		@return: The subscriber, see rosterLoader.RosterLoader.subscribe.
 		"""
-		if not self.doubles: # Singles match
-			return [self.player1String.get(), self.player2String.get()]
-		else: # Doubles match
-			return [[self.player1String.get(), self.player1aString.get()],
-					[self.player2String.get(), self.player2aString.get()]]
+		def arrived(ids, done, error):
+			roster = self.rosters.rosters[kind]
+			old = self.indexes[kind].roster
+			if old is not roster: # A saved list, opened instead of fetched, or a newer version of the list
+				self.indexes[kind] = PlayerIndex(roster)
+				lost = [] # Pickers whose player is not in the new roster
+				for picker in self.pickers[kind]:
+					picker.index = self.indexes[kind]
+					picker.matches = None # Ids in the old roster
+					if picker.chosen is not None: # The same player in the new roster, if still there
+						(rank, first, last, country) = old.record(picker.chosen)
+						picker.setChoice(roster.find(first, last, country, rank))
+						if picker.chosen is None:
+							lost.append(picker)
+				# The top player not already chosen, for those that lost theirs
+				taken = set(picker.chosen for picker in self.pickers[kind])
+				free = (id for id in range(len(roster)) if id not in taken)
+				for (picker, id) in zip(lost, free):
+					picker.setChoice(id)
+			# Default players, once the list is long enough
+			for (picker, id) in self.defaults[:]:
+				if picker.kind == kind and id < len(roster):
+					picker.setChoice(id)
+					self.defaults.remove((picker, id))
+			for picker in self.pickers[kind]:
+				picker.refresh()
+			if error is not None:
+				self.status.config(text=error)
+				self.retryButton.pack(side='left')
+				self.quitButton.pack(side='left')
+				return
+			if all(self.rosters.done[k] for k in self.kinds):
+				if any(k in self.rosters.errors for k in self.kinds):
+					return # Already showing the error
+				if self.defaults:
+					self.status.config(text='Not enough players to choose from.')
+					return
+				# Which names need initials (kept by the loader for each list)
+				self.names = NameIndex.union([self.rosters.names[k] for k in self.kinds])
+				self.status.config(text='')
+				self.startButton.config(state='normal')
+		return arrived
+
+	def retry(self):
+		"""Loads the lists that failed again."""
+		self.retryButton.pack_forget()
+		self.quitButton.pack_forget()
+		self.status.config(text='Loading players...')
+		self.rosters.retry([k for k in self.kinds if k in self.rosters.errors])
 
-	def loadPlayerLists(self):
+	def destroy(self):
+		"""Stops taking players from the loader, and destroys the dialog."""
+		for (kind, func) in self.subscribers:
+			self.rosters.unsubscribe(kind, func)
+		self.subscribers = []
+		tk.Toplevel.destroy(self)
+
+	def getFormat(self):
+		"""
+		Returns the chosen match format.
+		@rtype: matchFormat.MatchFormat
+		@return: The match format.
+		"""
+		return matchFormat.preset(self.formatName.get())
+
+	def getTeamIds(self):
 		"""
-		Loads all four player lists.
-		NOTE: Not used, loading player lists only when needed.
+		Returns the chosen players on each team.
+		@rtype: list
+		@return: (list kind, roster id) of each player, see rosterLoader.RosterLoader.get. For doubles,
+			a list of the two players of each team.
 		"""
-		self.menSinglesPlayers = readPlayers(mensSinglesUrl)
-		self.womenSinglesPlayers = readPlayers(womensSinglesUrl)
-		self.menDoublesPlayers = readPlayers(mensDoublesUrl)
-		self.womenDoublesPlayers = readPlayers(womensDoublesUrl)
+		if not self.doubles: # Singles match
+			return [self.picker1.getChoice(), self.picker2.getChoice()]
+		else: # Doubles match
+			return [[self.picker1.getChoice(), self.picker1a.getChoice()],
+					[self.picker2.getChoice(), self.picker2a.getChoice()]]
 
-def myDropdown(master, var, optList):
+class PlayerPicker(tk.Frame):
 	"""
-	Provides a stylized option menu / dropdown list.
-	@type master: Toplevel widget
-	@param master: Window to host the menu.
-	@type var: Tkinter variable
-	@param var: The variable to be set by the option menu.
-	@type optList: list of strings
-	@param optList: List of strings for the option menu.
-	@rtype: OptionMenu
-	@return: The constructed option menu / dropdown list.
+	Searchable player chooser. Shows the chosen player, a box to type part of a name in,
+	and the best matches so far (see playerSearch.parseQuery for country and rank filters).
+	Clicking a match, or Return for the first one, chooses it.
 	"""
-	w = tk.OptionMenu(master, var, *optList)
-	w.config(bg='black',fg='white', width=menuWidth)
-	w['menu'].config(bg='black',fg='white')
-	return w
+	def __init__(self, master, index, kind):
+		"""
+		@type master: Toplevel widget
+		@param master: Window to host the picker.
+		@type index: playerSearch.PlayerIndex
+		@param index: The players to choose from.
+		@type kind: string
+		@param kind: Which list they are, see rosterLoader.rosterUrls.
+		"""
+		tk.Frame.__init__(self, master, bg='black')
+		self.index = index
+		self.kind = kind
+		self.chosen = None # Roster id of the chosen player
+		self.shown = tk.StringVar(self) # The chosen player, for display
+		self.matches = [] # Roster ids of the players shown in the list
+		self.query = tk.StringVar(self)
+		tk.Label(self, textvariable=self.shown, width=menuWidth, bg='black', fg='white', anchor='w').pack()
+		self.entry = tk.Entry(self, textvariable=self.query, width=menuWidth)
+		self.entry.pack()
+		self.listbox = tk.Listbox(self, height=pickerRows, width=menuWidth, bg='black', fg='white',
+			exportselection=False)
+		self.listbox.pack()
+		self.entry.bind('<KeyRelease>', lambda event: self.refresh())
+		self.entry.bind('<Return>', lambda event: self.choose(0))
+		self.listbox.bind('<<ListboxSelect>>', lambda event: self.choose(self.listbox.curselection()))
+		self.refresh()
+
+	def refresh(self):
+		"""Shows the best matches for the text typed so far."""
+		matches = self.index.searchIds(self.query.get(), pickerRows)
+		if matches == self.matches:
+			return
+		self.matches = matches
+		self.listbox.delete(0, 'end')
+		for id in matches:
+			self.listbox.insert('end', self.index.roster.string(id))
+
+	def choose(self, selection):
+		"""
+		Chooses a player from the list.
+		@type selection: integer, or tuple of integers
+		@param selection: Position in the list, or the Listbox selection.
+		"""
+		if isinstance(selection, tuple):
+			if not selection:
+				return
+			selection = int(selection[0])
+		if selection < len(self.matches):
+			self.setChoice(self.matches[selection])
+
+	def setChoice(self, id):
+		"""
+		Chooses a player.
+		@type id: integer
+		@param id: The player's roster id, or None for no player.
+		"""
+		self.chosen = id
+		self.shown.set(self.index.roster.string(id) if id is not None else u'')
+
+	def getChoice(self):
+		"""
+		Returns the chosen player.
+		@rtype: tuple
+		@return: (list kind, roster id), id None if no player is chosen.
+		"""
+		return (self.kind, self.chosen)
 
 def readPlayers(url):
 	"""
@@ -189,24 +318,33 @@ def readPlayers(url):
 	"""
 	# Load the player list from URL into a string
 	txt = util.getUrlAsString(url)
-	if not txt is None:
-		players = []
-		for line in util.lineIter(txt): # Decode the player list from known format of tennischannel.com files
-			line = util.decode(line)
-			strings = line.split("\t")
-			rank = int(strings[0])
-			strings = strings[1].split(",")
-			lastName = strings[0]
-			strings = strings[1].split("(")
-			firstName = strings[0].strip()
-			country = strings[1][0:3]
-			# Creating list of easily parsed strings representative of player objects.
-			# These strings are "pretty" enough to use in dropdown list.
-			players.append('{}. {}, {} ({})'.format(rank, lastName, firstName, country))
-	else:
+	if txt is None:
 		print("readPlayers: Couldn't open {}, exiting.".format(url))
 		# Maybe something better to do than exit. Consider in future version.
 		sys.exit(1)
+	return parsePlayers(txt)
+
+def parsePlayers(txt):
+	"""
+	Parses a player list, as read by readPlayers.
+	@type txt: bytes
+	@param txt: The player list, one "rank<tab>Last, First (CTY)" line per player, UTF-8 encoded.
+	@rtype: list of strings
+	@return: List of players in a special format that can be parsed into a player object.
+	"""
+	players = []
+	for line in util.lineIter(txt): # Decode the player list from known format of tennischannel.com files
+		line = util.decode(line)
+		strings = line.split("\t")
+		rank = int(strings[0])
+		strings = strings[1].split(",")
+		lastName = strings[0]
+		strings = strings[1].split("(")
+		firstName = strings[0].strip()
+		country = strings[1][0:3]
+		# Creating list of easily parsed strings representative of player objects.
+		# These strings are "pretty" enough to use in dropdown list.
+		players.append('{}. {}, {} ({})'.format(rank, lastName, firstName, country))
 	return players
 
 def duplicates(playerList):
@@ -217,16 +355,7 @@ def duplicates(playerList):
 	@rtype: set
 	@return: Set of last names that appear more than once in playerList.
 	"""
-	lastNames = []
-	dups = set([])
-	for pString in playerList:
-		s = pString.split('.') # strip off rank
-		s = s[1].split(',')
-		last = s[0].strip()
-		if last in lastNames:
-			dups.add(last)
-		lastNames.append(last)
-	return dups
+	return NameIndex(player.parsePlayerString(s) for s in playerList).dups
 
 if __name__ == '__main__':
 	p = readPlayers(womensSinglesFile)
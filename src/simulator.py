@@ -0,0 +1,315 @@
+#!/usr/bin/python
+"""
+simulator.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Monte Carlo match simulator for tennis scoreboard based on MVC architecture.
+
+Plays random matches from per-server point-win probabilities, using the scoring
+tables shared with tennisModel.Model. Runs are split into fixed-size chunks, each
+with its own random stream derived from the seed, and spread over a process pool.
+Results for a given seed do not depend on the number of processes.
+
+Regular games starting from love are drawn in one step from the exact distribution of
+(game winner, points played) for the server. Games in progress and tiebreaks are
+played point by point, since the server changes within a tiebreak.
+
+Exported classes:
+
+SimulationResult -- Totals from a batch of simulated matches.
+
+Exported functions:
+
+simulate -- Simulates matches from the start, or from a given position.
+simulateFromModel -- Simulates the rest of the match held by a Model.
+"""
+
+import random
+from bisect import bisect
+import multiprocessing
+
+from matchState import MatchState
+from scoringTables import tiebreakKey, setKey, rulesFor, pack, unpack, eventBits, \
+	GAME_WON, SET_WON, ENTER_TIEBREAK, SERVER_CHANGE, MATCH_WON, MATCH_TIEBREAK
+import matchFormat
+
+chunkSize = 5000 # Matches per task. Fixed, so that results do not depend on the number of processes.
+maxDeuces = 60 # Deuce cycles kept in the game length distribution. The remaining probability is negligible.
+
+class SimulationResult:
+	"""Totals from a batch of simulated matches."""
+	def __init__(self):
+		self.matches = 0
+		self.wins = [0,0]
+		self.setScores = {} # (sets team 1, sets team 2) -> number of matches
+		self.points = 0
+
+	def add(self, other):
+		"""
+		Adds the totals from another result.
+		@type other: SimulationResult
+		@param other: The result to add.
+		"""
+		self.matches += other.matches
+		self.wins[0] += other.wins[0]
+		self.wins[1] += other.wins[1]
+		self.points += other.points
+		for k, v in other.setScores.items():
+			self.setScores[k] = self.setScores.get(k, 0) + v
+
+	def winProbability(self):
+		"""
+		Returns each team's estimated probability of winning the match.
+		@rtype: tuple of floats
+		@return: Win probability for team 1 and team 2.
+		"""
+		if self.matches == 0:
+			return (0.0, 0.0)
+		return (float(self.wins[0]) / self.matches, float(self.wins[1]) / self.matches)
+
+	def setScoreDistribution(self):
+		"""
+		Returns the distribution of final match scores (sets).
+		@rtype: dictionary
+		@return: (sets team 1, sets team 2) -> probability.
+		"""
+		return dict((k, float(v) / self.matches) for k, v in self.setScores.items())
+
+	def expectedPoints(self):
+		"""
+		Returns the mean number of points played per match.
+		@rtype: float
+		@return: Mean points played (from the starting position).
+		"""
+		if self.matches == 0:
+			return 0.0
+		return float(self.points) / self.matches
+
+	def __repr__(self):
+		"""
+		Provides detailed representation of a SimulationResult object.
+		@rtype: string
+		@return: Detailed representation of a SimulationResult object.
+		"""
+		return "matches: {}, winProbability: {}, setScores: {}, expectedPoints: {:.2f}".format(
+			self.matches, self.winProbability(), sorted(self.setScoreDistribution().items()), self.expectedPoints())
+
+def gameDistribution(p, advantage=True):
+	"""
+	Returns the distribution of regular game outcomes for a server.
+	@type p: float
+	@param p: Probability that the server wins a point.
+	@type advantage: boolean
+	@param advantage: Flag, True for advantage games, False for no-ad (the point at deuce wins the game).
+	@rtype: tuple
+	@return: (cumulative probabilities, list of (server won, points played)), for use with bisect.
+	"""
+	q = 1.0 - p
+	outcomes = [(True, 4, p**4), (True, 5, 4 * p**4 * q), (True, 6, 10 * p**4 * q**2),
+		(False, 4, q**4), (False, 5, 4 * q**4 * p), (False, 6, 10 * q**4 * p**2)]
+	deuce = 20 * p**3 * q**3 # Probability of reaching deuce
+	if not advantage:
+		outcomes.append((True, 7, deuce * p))
+		outcomes.append((False, 7, deuce * q))
+	for k in range(maxDeuces if advantage else 0):
+		outcomes.append((True, 8 + 2*k, deuce * p * p))
+		outcomes.append((False, 8 + 2*k, deuce * q * q))
+		deuce *= 2 * p * q
+	cum = []
+	total = 0.0
+	for o in outcomes:
+		total += o[2]
+		cum.append(total)
+	cum[-1] = 2.0 # Absorbs the truncated tail (and rounding), so bisect always finds an outcome.
+	return (cum, [(o[0], o[1]) for o in outcomes])
+
+def _playChunk(args):
+	"""
+	Plays one chunk of matches. Module level, so it can run in a worker process.
+	@type args: tuple
+	@param args: (count, seed, serveWin, format, start).
+	@rtype: SimulationResult
+	@return: Totals for the chunk.
+	"""
+	(count, seed, serveWin, format, start) = args
+	rng = random.Random(seed)
+	rand = rng.random
+	(gameScore, setScore, startSet, matchScore, startServer, startTiebreak, startTiebreakToWin, startWinner) = \
+		MatchState(start).decode()
+	startGames = [g for s in setScore for g in s]
+	startGs = pack(gameScore[0], gameScore[1])
+	rules = rulesFor(format)
+	dist = (gameDistribution(serveWin[0], format.advantage), gameDistribution(serveWin[1], format.advantage))
+	gameNext = rules.gameTable
+	setTabs = rules.setTables
+	setLimits = rules.setLimits
+	tbTabs = rules.tiebreakTables
+	tbTargets = rules.tiebreakTargets
+	matchTab = rules.matchTable
+	result = SimulationResult()
+	for i in range(count):
+		gs = startGs
+		games = startGames[:]
+		cur = startSet
+		m = list(matchScore)
+		server = startServer
+		tb = startTiebreak
+		winner = startWinner
+		if server < 0:
+			server = 1 if rand() < 0.5 else 0 # Pick starting server at random
+		points = 0
+		while winner < 0:
+			setWon = False
+			regularGame = not tb
+			if tb:
+				# Play the tiebreak out, point by point
+				tbTab = tbTabs[cur]
+				tbTarget = tbTargets[cur]
+				(a, b) = unpack(gs)
+				while True:
+					team = server if rand() < serveWin[server] else 1 - server
+					e = tbTab[(tiebreakKey(a, b, tbTarget) << 1) | team]
+					points += 1
+					if team:
+						b += 1
+					else:
+						a += 1
+					if e & SERVER_CHANGE:
+						server = 1 - server
+					if e & GAME_WON:
+						break
+				gs = 0
+				games[2*cur+team] += 1
+				tb = False
+				setWon = True
+			else:
+				if gs == 0:
+					# Draw the whole game
+					(cum, outcomes) = dist[server]
+					(serverWon, n) = outcomes[bisect(cum, rand())]
+					team = server if serverWon else 1 - server
+					points += n
+				else:
+					# Finish the game in progress, point by point
+					while True:
+						team = server if rand() < serveWin[server] else 1 - server
+						e = gameNext[(gs << 1) | team]
+						points += 1
+						if e & GAME_WON:
+							break
+						gs = e >> eventBits
+					gs = 0
+				k = 2*cur
+				e = setTabs[cur][(setKey(games[k], games[k+1], setLimits[cur]) << 1) | team]
+				games[k+team] += 1
+				if e & SET_WON:
+					setWon = True
+				elif e & ENTER_TIEBREAK:
+					tb = True
+			if setWon:
+				e = matchTab[(pack(m[0], m[1]) << 1) | team]
+				m[team] += 1
+				if e & MATCH_WON:
+					winner = team
+					break
+				cur += 1
+				if e & MATCH_TIEBREAK:
+					tb = True
+			if regularGame:
+				# Server changes after every regular game (a tiebreak changes it point by point)
+				server = 1 - server
+		result.matches += 1
+		result.wins[winner] += 1
+		result.points += points
+		key = (m[0], m[1])
+		result.setScores[key] = result.setScores.get(key, 0) + 1
+	return result
+
+def simulate(n, serveWin, numberOfSets=3, doublesMatch=False, noEndingTiebreak=False, winSets=None,
+		state=None, seed=None, processes=None, format=None):
+	"""
+	Simulates matches from the start, or from a given position.
+	@type n: integer
+	@param n: Number of matches to play.
+	@type serveWin: sequence of two floats
+	@param serveWin: Probability that each team wins a point on its own serve.
+	@type numberOfSets: integer
+	@param numberOfSets: Number of sets in the match (2 for doubles with final 10-point tiebreak, 3, or 5).
+	@type doublesMatch: boolean
+	@param doublesMatch: Flag, True if this is a doubles match.
+	@type noEndingTiebreak: boolean
+	@param noEndingTiebreak: Flag, True if final set can NOT end with a tiebreak.
+	@type winSets: integer
+	@param winSets: Number of sets needed to win. If None, derived from numberOfSets.
+	@type state: MatchState
+	@param state: Position to play from. If None, the start of a match with a random first server.
+	@type seed: integer
+	@param seed: Seed for the random streams. If None, results are not reproducible.
+	@type processes: integer
+	@param processes: Number of worker processes. If None, one per core. 1 runs in this process.
+	@type format: matchFormat.MatchFormat
+	@param format: The match format. If None, worked out from numberOfSets, doublesMatch, noEndingTiebreak and winSets.
+	@rtype: SimulationResult
+	@return: Totals over all matches.
+	"""
+	if format is None:
+		format = matchFormat.fromLegacy(numberOfSets, doublesMatch, noEndingTiebreak, winSets)
+	if state is None:
+		state = MatchState.fromFields()
+	if seed is None:
+		seed = random.SystemRandom().getrandbits(64)
+	# One seed per chunk, derived from the master seed
+	seeder = random.Random(seed)
+	tasks = []
+	remaining = n
+	while remaining > 0:
+		count = min(chunkSize, remaining)
+		tasks.append((count, seeder.getrandbits(64), tuple(serveWin), format, int(state)))
+		remaining -= count
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	result = SimulationResult()
+	if processes <= 1 or len(tasks) <= 1:
+		for t in tasks:
+			result.add(_playChunk(t))
+	else:
+		pool = multiprocessing.Pool(min(processes, len(tasks)))
+		try:
+			for r in pool.imap_unordered(_playChunk, tasks):
+				result.add(r)
+		finally:
+			pool.close()
+			pool.join()
+	return result
+
+def simulateFromModel(model, n, serveWin, seed=None, processes=None):
+	"""
+	Simulates the rest of the match held by a Model.
+	@type model: tennisModel.Model
+	@param model: The Model holding the match format and current position.
+	@type n: integer
+	@param n: Number of matches to play.
+	@type serveWin: sequence of two floats
+	@param serveWin: Probability that each team wins a point on its own serve.
+	@type seed: integer
+	@param seed: Seed for the random streams.
+	@type processes: integer
+	@param processes: Number of worker processes. If None, one per core.
+	@rtype: SimulationResult
+	@return: Totals over all matches.
+	"""
+	return simulate(n, serveWin, state=MatchState.fromModel(model), seed=seed, processes=processes,
+		format=model.getFormat())
+
+if __name__ == '__main__':
+	import time
+	start = time.time()
+	r = simulate(1000000, (0.64, 0.62), numberOfSets=5, seed=1)
+	print("{:.2f} s: {}".format(time.time() - start, r))
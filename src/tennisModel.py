@@ -18,41 +18,60 @@ Model -- Provides fields and logic for a tennnis match.
 """
 
 import player
+import scoringTables
+import matchFormat
+import pointSituation
+from pointSituation import GAME_POINT, BREAK_POINT, SET_POINT, MATCH_POINT
+from matchState import MatchState
+from matchStats import MatchStats
+from scoringTables import GAME_WON, SET_WON, ENTER_TIEBREAK, SERVER_CHANGE, MATCH_WON, MATCH_TIEBREAK
 
 import sys
 sys.path.append('../lib')
-import util
-from observable import Observable
+import tracing
+from observable import Observable, Transaction
 
-DEBUG = False
+tr = tracing.getTracer('tennisModel')
 
 class Model:
 	"""Provides fields and logic for a tennnis match."""
 	def __init__(self):
-		self.noEndingTiebreak = Observable(False)
-		self.doublesMatch = Observable(False)
-		self.mensMatch = Observable(0)
-		self.team = Observable(["",""])
-		self.gameScore = Observable([0,0])
-		self.setScore = Observable([[0,0],[0,0],[0,0],[0,0],[0,0]])
-		self.currentSet = Observable(0)
-		self.matchScore = Observable([0,0])
-		self.tiebreak = Observable(False)
-		self.message = Observable("")
-		self.server = Observable(-1)
-		self.winner = Observable(-1)
-		self.numberOfSets = Observable(0)
+		self.transaction = Transaction() # Groups the Observable changes from one point, see batch()
+		# All Observables are in value mode: frozen (tuple) data, only real changes are notified.
+		t = self.transaction
+		self.noEndingTiebreak = Observable(False, 'noEndingTiebreak', t, True)
+		self.doublesMatch = Observable(False, 'doublesMatch', t, True)
+		self.mensMatch = Observable(0, 'mensMatch', t, True)
+		self.team = ["",""] # The two player.Team objects, see setTeams
+		self.gameScore = Observable([0,0], 'gameScore', t, True)
+		self.setScore = Observable([[0,0],[0,0],[0,0],[0,0],[0,0]], 'setScore', t, True)
+		self.currentSet = Observable(0, 'currentSet', t, True)
+		self.matchScore = Observable([0,0], 'matchScore', t, True)
+		self.tiebreak = Observable(False, 'tiebreak', t, True)
+		self.message = Observable("", 'message', t, True)
+		self.server = Observable(-1, 'server', t, True)
+		self.winner = Observable(-1, 'winner', t, True)
+		self.numberOfSets = Observable(0, 'numberOfSets', t, True)
 		self.matchOver = False
-		self.winSets = Observable(0)
-		self.matchType = Observable("")
-		self.tiebreakToWin = 7 # Default for normal tiebreak game. Will set to 10 for end tiebreak in doubles match.
+		self.winSets = Observable(0, 'winSets', t, True)
+		self.matchType = Observable("", 'matchType', t, True)
+		self.tiebreakToWin = 7 # Points to win the current (or next) tiebreak, set from the format's rules.
+		self.format = None # matchFormat.MatchFormat, see setFormat and getFormat
+		self.rules = None # The format compiled, see scoringRules
+		self.situation = None # pointSituation of the current position, from messageCheck, for the next point; None if not known
+		for o in (self.noEndingTiebreak, self.doublesMatch, self.numberOfSets, self.winSets):
+			o.addCallback(self.formatChanged)
 		self.matchPointCount = [0,0]
 		self.setPointCount = [0,0]
 		self.breakPointCount = [0,0]
 		self.deuceCount = 0
+		self.stats = MatchStats() # Running match statistics, see matchStats
 		self.duplicateLastName = set([])
-		self.specialCaseNames = []
+		self.specialCaseNames = set([])
 		self.teamScoreNames = ["",""]
+		self.keepHistory = True # False skips the undo snapshots, e.g. for bulk replays
+		self.undoStack = [] # Snapshots before each point, see snapshot()
+		self.redoStack = [] # Snapshots of undone points
 
 	def setNoEndingTiebreak(self,bool):
 		"""
@@ -62,6 +81,15 @@ class Model:
 		"""
 		self.noEndingTiebreak.set(bool)
 
+	def setTeams(self, teams):
+		"""
+		Establishes the teams, before the first point. Not an Observable: the controller shows the teams
+		when it sets up the scoreboard.
+		@type teams: sequence of player.Team
+		@param teams: The two teams.
+		"""
+		self.team = list(teams)
+
 	def setDoublesMatch(self,bool):
 		"""
 		Establishes whether this is a doubles or singles match.
@@ -84,6 +112,52 @@ class Model:
 			self.numberOfSets.set(3)
 			self.winSets.set(2)
 
+	def setFormat(self, format):
+		"""
+		Establishes the match format, before the first point: sets to win, number of sets, and one set entry per set.
+		Without it, the format is worked out from numberOfSets, winSets, doublesMatch and noEndingTiebreak.
+		@type format: matchFormat.MatchFormat
+		@param format: The match format.
+		"""
+		self.format = format
+		self.rules = None
+		self.situation = None
+		self.tiebreakToWin = self.scoringRules().tiebreakTargets[0]
+		with self.batch():
+			self.winSets.set(format.winSets)
+			self.numberOfSets.set(format.numberOfSets())
+			self.setScore.set([[0,0]] * format.maxSets())
+
+	def getFormat(self):
+		"""
+		Returns the match format.
+		@rtype: matchFormat.MatchFormat
+		@return: The format given to setFormat, or else the one given by numberOfSets, winSets, doublesMatch and noEndingTiebreak.
+		"""
+		if self.format is not None:
+			return self.format
+		return matchFormat.fromLegacy(self.numberOfSets.get(), self.doublesMatch.get(), self.noEndingTiebreak.get(),
+			self.winSets.get())
+
+	def formatChanged(self, data):
+		"""
+		Callback for the fields the format is worked out from (see getFormat): drops the compiled rules.
+		@param data: The field's new value.
+		"""
+		self.rules = None
+		self.situation = None
+
+	def scoringRules(self):
+		"""
+		Returns the compiled rules of the match format, compiling them on first use and again after
+		setFormat or a change to the fields the format is worked out from.
+		@rtype: scoringTables.ScoringRules
+		@return: The rules.
+		"""
+		if self.rules is None:
+			self.rules = scoringTables.rulesFor(self.getFormat())
+		return self.rules
+
 	def changeServer(self):
 		"""
 		Swaps the serving team / player.
@@ -102,6 +176,22 @@ class Model:
 		"""
 		return scoreDelta(self.gameScore.get())
 
+	def pointSituation(self, score=None):
+		"""
+		Returns the point situation: game / break / set / match point, for whom, and by how much.
+		Worked out in one pass, see pointSituation.classify.
+		@type score: list of integers
+		@param score: The game score. If None, the current game score.
+		@rtype: tuple
+		@return: (flags for either team, leading team or -1 if level, lead in points, (team 1 flags, team 2 flags)).
+			Flags are pointSituation.GAME_POINT, BREAK_POINT, SET_POINT, MATCH_POINT.
+		"""
+		if score is None:
+			score = self.gameScore.get()
+		currentSet = self.currentSet.get()
+		return pointSituation.classify(score, self.tiebreak.get(), self.server.get(), self.setScore.get()[currentSet],
+			self.matchScore.get(), self.scoringRules(), currentSet)
+
 	def gamePoint(self, score):
 		"""
 		Returns whether the current score corresponds to game point.
@@ -110,17 +200,7 @@ class Model:
 		@rtype: boolean
 		@return: Whether the current score corresponds to game point.
 		"""
-		gameLeader = leader(score)
-		if gameLeader == -1: # Game is tied
-			return False
-		# All below, game is not tied.
-		# Tiebreak game
-		if (self.tiebreak.get()) and (score[gameLeader] > self.tiebreakToWin - 2):
-			return True
-		# Regular game
-		if (not self.tiebreak.get()) and (score[gameLeader] > 2):
-			return True
-		return False
+		return bool(self.pointSituation(score)[0] & GAME_POINT)
 
 	def breakPoint(self,score):
 		"""
@@ -130,20 +210,7 @@ class Model:
 		@rtype: boolean
 		@return: Whether the current score corresponds to break point.
 		"""
-		if not self.gamePoint(score):
-			return False
-		# All below, it is game point
-		util.dbgprint(DEBUG, "Break point: it is Game point")
-		# No break point in tiebreak game
-		if self.tiebreak.get():
-			return False
-		gameLeader = leader(score)
-		if gameLeader == -1: # I think this cannot be true if get here. Maybe remove this.
-			return False
-		util.dbgprint(DEBUG, "breakPoint: Game leader is {}\tServer is: {}\tSet score is: {}\tGame score is: {}".format(
-			self.team[gameLeader],self.server.get(),self.setScore.get(),score))
-		if gameLeader != self.server.get(): # Game point, and receiver is ahead, so it's break point
-			return True
+		return bool(self.pointSituation(score)[0] & BREAK_POINT)
 
 	def setPoint(self,score):
 		"""
@@ -153,22 +220,7 @@ class Model:
 		@rtype: boolean
 		@return: Whether the current score corresponds to set point.
 		"""
-		if not self.gamePoint(score):
-			return False
-		# All below, it is game point
-		util.dbgprint(DEBUG, "Set point: it is Game point")
-		setScore = self.setScore.get()[self.currentSet.get()]
-		setLeader = leader(setScore)
-		gameLeader = leader(score)
-		util.dbgprint(DEBUG, "setPoint: Set leader is {}\tSet score is: {}\tGame score is: {}".format(
-			self.team[setLeader],self.setScore.get(),score))
-		# Tiebreak game
-		if self.tiebreak.get():
-			util.dbgprint(DEBUG, "Tiebreak set point")
-			return True
-		# Regular game, set not tied, set leader is winning game, and their set score is 5 or higher
-		if setLeader != -1 and setLeader == gameLeader and setScore[setLeader] > 4:
-			return True
+		return bool(self.pointSituation(score)[0] & SET_POINT)
 
 	def matchPoint(self,score):
 		"""
@@ -178,23 +230,7 @@ class Model:
 		@rtype: boolean
 		@return: Whether the current score corresponds to match point.
 		"""
-		if not self.setPoint(score):
-			return False
-		# All below, it is set point
-		util.dbgprint(DEBUG, "Match point: it is Set point")
-		setScore = self.setScore.get()[self.currentSet.get()]
-		gameLeader = leader(score)
-		setLeader = leader(setScore)
-		# Doubles match
-		if self.doublesMatch.get() and self.currentSet.get() + 1 == self.numberOfSets.get():
-			util.dbgprint(DEBUG, "Doubles match, last set, so match point.")
-			return True
-		# Singles match
-		util.dbgprint(DEBUG, "matchPoint: Set leader is {}\tMatch score is: {}\tSet score is: {}\tGame score is: {}".format(
-			self.team[setLeader],self.matchScore.get(),self.setScore.get(),score))
-		# Set point, and game leader match score (# of serts) is one less than tat needed to win
-		if self.matchScore.get()[gameLeader] == self.winSets.get() - 1:
-			return True
+		return bool(self.pointSituation(score)[0] & MATCH_POINT)
 
 	def messageCheck(self, score):
 		"""
@@ -204,9 +240,8 @@ class Model:
 		"""
 		# Note: Prefix is way overdone vs. what you see on TV matches. But, it's accurate, and I like it.
 		prefix = ("","","Double ","Triple ","Quadruple ","Quintuple ","Sextuple ")
-		# Default message is just the match type (e.g. Semifinal)
-		# Might want to revise this so default message is more random, e.g. nothing most of time, match type maybe 25% of time. Later version.
-		msg = self.matchType.get()
+		# Classified once, and kept for the stats of the next point. At a deciding point both teams may have chances.
+		self.situation = self.pointSituation(score)
 		# Deuce
 		if (not self.tiebreak.get()) and (score[0] == 3) and (score[1] == 3):
 			self.deuceCount += 1
@@ -215,50 +250,75 @@ class Model:
 			else:
 				self.message.set("Deuce #{}".format(self.deuceCount)) # Subsequent deuces
 			return
-		if self.tiebreak.get():
-			msg = "Tiebreak"
-		delta = scoreDelta(score)
 		matchScore = self.matchScore.get()
 		matchLeader = leader(matchScore)
-		gameLeader = leader(score)
 		# Someone has won the match
 		if matchLeader != -1 and matchScore[matchLeader] == self.winSets.get():
 			self.message.set(str(self.team[matchLeader])+" won " + self.matchOrChampionship() +"!")
 			return
 		# Game point, check various possibilities
-		if self.gamePoint(score): # if get to here, someone is ahead, so gameLeader in {0,1}
-			if self.matchPoint(score): # It is match point
-				self.matchPointCount[gameLeader] += 1
-				if self.matchType.get() == "Championship": # It is match piont in a championship
-					s = "Championship Point"
-				else:
-					s = "Match Point" # It is match point in a regular game, i.e. not championship
-				# First match point, show prefix (e.g. Double) along with match point message
-				if(self.matchPointCount[gameLeader] <= 1):
-					self.message.set(prefix[delta]+s)
-				else:
-					# Subsequent match point, show match point message along with count for leading player
-					self.message.set(s+" #{}".format(self.matchPointCount[gameLeader]))
-				return
-			if self.setPoint(score):
-				self.setPointCount[gameLeader] += 1
-				# First set point, show prefix (e.g. Double) along with set point message
-				if(self.setPointCount[gameLeader] <= 1):
-					self.message.set(prefix[delta]+"Set Point")
-				else:
-					# Subsequent set point, show set point message along with count for leading player
-					self.message.set("Set Point #{}".format(self.setPointCount[gameLeader]))
-				return
-			if self.breakPoint(score):
-				self.breakPointCount[gameLeader] += 1
-				# First break point, show prefix (e.g. Double) along with break point message
-				if(self.breakPointCount[gameLeader] <= 1):
-					self.message.set(prefix[delta]+"Break Point")
-				else:
-					# Subsequent break point, show break point message along with count for leading player
-					self.message.set("Break Point #{}".format(self.breakPointCount[gameLeader]))
-				return
-		self.message.set(msg)
+		(situation, gameLeader, delta, teams) = self.situation
+		# Leads beyond Sextuple (only possible in a 10-point tiebreak) get no prefix
+		multiple = prefix[delta] if delta < len(prefix) else ""
+		if situation & MATCH_POINT: # It is match point
+			count = self.countChance(self.matchPointCount, teams, MATCH_POINT, gameLeader)
+			if self.matchType.get() == "Championship": # It is match piont in a championship
+				s = "Championship Point"
+			else:
+				s = "Match Point" # It is match point in a regular game, i.e. not championship
+			# First match point, show prefix (e.g. Double) along with match point message
+			if(count <= 1):
+				self.message.set(multiple+s)
+			else:
+				# Subsequent match point, show match point message along with count for leading player
+				self.message.set(s+" #{}".format(count))
+			return
+		if situation & SET_POINT:
+			count = self.countChance(self.setPointCount, teams, SET_POINT, gameLeader)
+			# First set point, show prefix (e.g. Double) along with set point message
+			if(count <= 1):
+				self.message.set(multiple+"Set Point")
+			else:
+				# Subsequent set point, show set point message along with count for leading player
+				self.message.set("Set Point #{}".format(count))
+			return
+		if situation & BREAK_POINT:
+			count = self.countChance(self.breakPointCount, teams, BREAK_POINT, gameLeader)
+			# First break point, show prefix (e.g. Double) along with break point message
+			if(count <= 1):
+				self.message.set(multiple+"Break Point")
+			else:
+				# Subsequent break point, show break point message along with count for leading player
+				self.message.set("Break Point #{}".format(count))
+			return
+		# Default message is just the match type (e.g. Semifinal), or Tiebreak
+		# Might want to revise this so default message is more random, e.g. nothing most of time, match type maybe 25% of time. Later version.
+		if self.tiebreak.get():
+			self.message.set("Tiebreak")
+		else:
+			self.message.set(self.matchType.get())
+
+	def countChance(self, counts, teams, flag, gameLeader):
+		"""
+		Counts a match, set or break point for each team that has one.
+		@type counts: list of integers
+		@param counts: Points of this kind so far for each team, updated.
+		@type teams: tuple of integers
+		@param teams: Each team's situation flags, see pointSituation.classify.
+		@type flag: integer
+		@param flag: The kind of point, e.g. SET_POINT.
+		@type gameLeader: integer
+		@param gameLeader: The leading team, or -1 if level.
+		@rtype: integer
+		@return: The count to show: the leader's, or else the first team's that has the point.
+		"""
+		shown = gameLeader if gameLeader >= 0 and teams[gameLeader] & flag else -1
+		for team in (0,1):
+			if teams[team] & flag:
+				counts[team] += 1
+				if shown < 0:
+					shown = team
+		return counts[shown]
 
 	def matchOrChampionship(self):
 		"""
@@ -271,27 +331,134 @@ class Model:
 		else:
 			return 'match'
 
+	def batch(self):
+		"""
+		Returns the Model's transaction, for use as a context manager (with model.batch(): ...).
+		Inside it, Observable callbacks are deferred. When the outermost batch exits, each changed
+		Observable notifies once with its final value, then the transaction's callbacks get the change set.
+		@rtype: Transaction
+		@return: The Model's transaction.
+		"""
+		return self.transaction
+
 	def incrementGameScore(self,team):
 		"""
-		Increments the current game score, and handles game logic (win, deuce, tiebreak, and message)
+		Increments the current game score, and handles game logic (win, deuce, tiebreak, and message).
+		Observers are notified once per changed field, after the point is fully applied.
+		@type team: integer
+		@param team: The team that scored the point.
+		"""
+		if self.keepHistory and not self.matchOver:
+			self.undoStack.append(self.snapshot())
+			del self.redoStack[:]
+		self.stats.keepLog = self.keepHistory
+		with self.batch():
+			self._incrementGameScore(team)
+
+	def snapshot(self):
+		"""
+		Returns the complete match position, including message and point counters. Cheap: one
+		packed integer plus a few small values. The statistics are kept as a position in their
+		change log (see matchStats.MatchStats.mark), so a snapshot does not grow with the match.
+		@rtype: tuple
+		@return: (MatchState, message, matchPointCount, setPointCount, breakPointCount, deuceCount, stats mark).
+		"""
+		return (MatchState.fromModel(self), self.message.get(), tuple(self.matchPointCount),
+			tuple(self.setPointCount), tuple(self.breakPointCount), self.deuceCount, self.stats.mark())
+
+	def restore(self, snapshot):
+		"""
+		Restores a position returned by snapshot(), as one batch of Observable changes.
+		@type snapshot: tuple
+		@param snapshot: The position to restore.
+		"""
+		(state, message, matchPointCount, setPointCount, breakPointCount, deuceCount, stats) = snapshot
+		self.stats.seek(stats)
+		self.matchPointCount = list(matchPointCount)
+		self.setPointCount = list(setPointCount)
+		self.breakPointCount = list(breakPointCount)
+		self.deuceCount = deuceCount
+		with self.batch():
+			state.toModel(self)
+			self.message.set(message)
+
+	def canUndo(self):
+		"""
+		Returns whether there is a point to undo.
+		@rtype: boolean
+		@return: Whether there is a point to undo.
+		"""
+		return len(self.undoStack) > 0
+
+	def canRedo(self):
+		"""
+		Returns whether there is an undone point to redo.
+		@rtype: boolean
+		@return: Whether there is an undone point to redo.
+		"""
+		return len(self.redoStack) > 0
+
+	def undo(self):
+		"""
+		Takes back the last point. Observers are notified once per changed field.
+		@rtype: boolean
+		@return: True if a point was undone, False if there was nothing to undo.
+		"""
+		if not self.undoStack:
+			return False
+		self.redoStack.append(self.snapshot())
+		self.restore(self.undoStack.pop())
+		return True
+
+	def redo(self):
+		"""
+		Replays the last undone point. Scoring a new point clears the points available to redo.
+		@rtype: boolean
+		@return: True if a point was redone, False if there was nothing to redo.
+		"""
+		if not self.redoStack:
+			return False
+		self.undoStack.append(self.snapshot())
+		self.restore(self.redoStack.pop())
+		return True
+
+	def _incrementGameScore(self,team):
+		"""
+		Applies a point, see incrementGameScore.
 		@type team: integer
 		@param team: The team that scored the point.
 		"""
 		if not self.matchOver:
 			#self.message.set("")
-			s = self.gameScore.get()
+			rules = self.scoringRules()
+			s = list(self.gameScore.get())
+			server = self.server.get()
+			thisSet = self.currentSet.get()
+			tiebreak = self.tiebreak.get()
+			situation = self.situation
+			self.situation = None # Only good for this point
+			if situation is None: # No messageCheck since the last change (first point, undo, redo, new format or position)
+				situation = self.pointSituation(s)
+			self.stats.point(team, server, situation[3], thisSet)
+			# Look up what this point does (deuce / advantage, game won, tiebreak server change)
+			if not tiebreak:
+				(next, events) = rules.gameEvents(s, team)
+			else:
+				events = rules.tiebreakEvents(s, team, thisSet)
 			# Increment score of the team that scored
 			s[team] += 1
-			util.dbgprint(DEBUG, str(self.team[team])+" " + self.singular('score') + ". Score = "+str(s)+". tiebreak is "+
-				str(self.tiebreak.get()))
+			if tr.info:
+				tr.event('point', team=team, score=tuple(s), tiebreak=tiebreak)
 			if not self.tiebreak.get():
 				# NOT a tiebreak
-				# Point was Ad, and non-leading player scored, so back to Deuce
-				if (s[0]==4) and (s[1]==4):
-					s = [3,3]
-				# Scoring player just won the game
-				if (s[team] > 3) and (scoreDelta(s) > 1):
-					util.dbgprint(DEBUG, str(self.team[team])+" "+self.singular('win')+" game.")
+				if not events & GAME_WON:
+					# Next score, e.g. point was Ad, and non-leading player scored, so back to Deuce
+					s = next
+				else:
+					# Scoring player just won the game
+					if tr.info:
+						tr.event('gameWon', team=team, server=server)
+					self.stats.game(team, server, False, thisSet)
 					# Reset for next game
 					s = [0,0]
 					self.breakPointCount = [0,0]
@@ -302,23 +469,27 @@ class Model:
 						self.changeServer()
 			else:
 				# tiebreak
-				if (s[0]+s[1]) % 2 == 1: # It's an odd game, so change server.
+				if events & SERVER_CHANGE: # It's an odd point, so change server.
 					self.changeServer()
-				if (s[team] >=self.tiebreakToWin) and (scoreDelta(s) > 1):
+				if events & GAME_WON:
 					# Point winning team just won the tiebreak
-					util.dbgprint(DEBUG, str(self.team[team])+" "+self.singular('win')+" tiebreak game.")
+					if tr.info:
+						tr.event('tiebreakWon', team=team)
+					self.stats.game(team, server, True, thisSet)
 					# Increment the game winning team's set score
 					self.incrementSetScore(team)
+					# Tiebreak is over. Cleared before the match score, which may start the final 10-point tiebreak.
+					self.tiebreak.set(False)
 					# Increment the game winning team's match score, as they also won the set.
 					self.incrementMatchScore(team)
 					# Reset for next game
 					s = [0,0]
 					self.breakPointCount = [0,0]
 					self.deuceCount = 0
-					self.tiebreak.set(False)
 			# Reset for next game
 			self.gameScore.set(s)
-			util.dbgprint(DEBUG, "Before message check. Score: {}\tSets:\t{}".format(s,self.setScore.get()))
+			if tr.debug:
+				tr.debugEvent('messageCheck', score=tuple(s), sets=self.setScore.get())
 			# Determine what message should be displayed
 			self.messageCheck(s)
 
@@ -328,28 +499,32 @@ class Model:
 		@type team: integer
 		@param team: The team that won the game.
 		"""
-		s = self.setScore.get()
+		s = [list(games) for games in self.setScore.get()]
 		thisSet = self.currentSet.get()
+		# Each set has its own table, so e.g. a final set without a tiebreak just keeps playing games until match winner.
+		rules = self.scoringRules()
+		events = rules.setEvents(s[thisSet], team, thisSet)
 		# Increment game winning team's set score
 		s[thisSet][team] += 1
 		self.setScore.set(s)
-		util.dbgprint(DEBUG, "Set: " + str(self.currentSet.get()) + ". Current set score: "+str(s))
+		if tr.debug:
+			tr.debugEvent('setScore', set=thisSet, games=tuple(s[thisSet]))
 		if not self.tiebreak.get():
 			# NOT a tiebreak
-			if (s[thisSet][team] > 5) and (scoreDelta(s[thisSet]) > 1):
+			if events & SET_WON:
 				# Game winners also won the current set
-				util.dbgprint(DEBUG, str(self.team[team]) +" "+self.singular('win')+ " set "+str(thisSet))
+				if tr.info:
+					tr.event('setWon', team=team, set=thisSet, games=tuple(s[thisSet]))
 				# Reset for next set
 				self.setPointCount = [0,0]
 				self.incrementMatchScore(team)
-			if not self.doublesMatch.get() and self.noEndingTiebreak.get() and (thisSet == self.numberOfSets.get()-1):
-				# Singles match, and no ending tiebreak, and we're in the final set, so just keep playing games until match winner.
-				return
-			if (s[thisSet][0]==6) and (s[thisSet][1]==6):
+			if events & ENTER_TIEBREAK:
 				# We now enter into a tiebreak
 				self.tiebreak.set(True)
+				self.tiebreakToWin = rules.tiebreakTargets[thisSet]
 				self.gameScore.set([0,0])
-				util.dbgprint(DEBUG, "Now entering tiebreak")
+				if tr.info:
+					tr.event('tiebreakStarted', set=thisSet, target=self.tiebreakToWin)
 
 	def incrementMatchScore(self,team):
 		"""
@@ -358,26 +533,28 @@ class Model:
 		@param team: The team that won the set.
 		"""
 		currSet = self.currentSet.get() + 1
-		s = self.matchScore.get()
+		s = list(self.matchScore.get())
+		# Formats with a match tiebreak play it instead of the final set
+		rules = self.scoringRules()
+		events = rules.matchEvents(s, team)
 		# Increment the set winning team's match score
 		s[team] += 1
 		self.matchScore.set(s)
-		util.dbgprint(DEBUG, "Match score in set "+ str(currSet) + " is "+str(s))
-		util.dbgprint(DEBUG, "team # is "+str(team)+", with "+str(s[team])+" sets.")
-		if s[team] == self.winSets.get():
+		if tr.debug:
+			tr.debugEvent('matchScore', set=currSet, sets=tuple(s))
+		if events & MATCH_WON:
 			# The set winning team has won the match
 			self.winner.set(team)
-			util.dbgprint(DEBUG, str(self.team[team])+" "+self.singular('win')+" " + self.matchOrChampionship() + "!")
+			if tr.info:
+				tr.event('matchWon', team=team, sets=tuple(s))
 			self.matchOver = True
 			self.server.set(-1)
 			currSet -= 1
 			return
-		if self.doublesMatch.get() and self.numberOfSets.get() == 2:
-			# It is a doubles match, with two sets
-			if s == [1,1]:
-				# Each team has won a set, so now it is the final 10-point tiebreak
-				self.tiebreak.set(True)
-				self.tiebreakToWin = 10
+		if events & MATCH_TIEBREAK:
+			# Sets are level, so now it is the match tiebreak
+			self.tiebreak.set(True)
+			self.tiebreakToWin = rules.tiebreakTargets[currSet]
 		# Update the set number
 		self.currentSet.set(currSet)
 
@@ -29,19 +29,42 @@ from tennisView import View
 from setup1 import Setup1
 from setup2 import Setup2
 from setup3 import Setup3
+from rosterLoader import RosterLoader
 from playerError import PlayerError
 from scoring import Scoring
-from random import randrange
+from winProbability import WinProbability
+from pointJournal import PointJournal
+import pointJournal
+try:
+	from scoreFeed import ScoreFeed
+except (ImportError, SyntaxError):
+	ScoreFeed = None # Live score feed needs Python 3 (asyncio)
+from random import Random
 import player
 
+import os
 import sys
+import traceback
+import functools
 sys.path.append('../lib')
-import util
+import observable
+import tracing
+
+tr = tracing.getTracer('tennisScore')
+
+# If True, every Model callback is timed. Control-T prints the report, as does the end of the match.
+TIMING = False
+
+# Trace levels, e.g. "tennisModel=debug,tennisView=off" (see tracing.configure). Control-D prints the recent
+# trace events, as does any error in a callback.
+traceLevels = os.environ.get('TENNIS_TRACE', '')
 
-DEBUG = False
+# Typical probability of winning a point on serve, indexed by Model.mensMatch (women's, men's, mixed).
+# Used for the live match win probability shown on the scoreboard.
+serveWinProbability = (0.56, 0.64, 0.60)
 
-# Might want to determine special cases from the list of players, automatically. Later version.
-specialCaseNames = [('Pliskova','K')] # Karolina and Kristyna
+# Journal of the match in progress. If the program dies mid-match, the match is recovered from it on restart.
+journalFile = 'match.journal'
 
 class Controller:
 	"""The controller for a tennis scoreboard program."""
@@ -50,28 +73,78 @@ class Controller:
 		@type root: Toplevel widget
 		@param root: Main application window.
 		"""
+		if TIMING:
+			observable.enableTiming()
+			root.bind_all('<Control-t>', lambda event: self.printTiming())
+		try:
+			tracing.configure(traceLevels)
+		except ValueError as e:
+			print("TENNIS_TRACE ignored: {}".format(e))
+		root.bind_all('<Control-d>', lambda event: tracing.dump())
+		root.report_callback_exception = self.callbackError
 		self.model = Model()
-		# Add needed callbacks for observable fields in Model
-		self.model.gameScore.addCallback(self.gameScoreChanged)
-		self.model.setScore.addCallback(self.setScoreChanged)
-		self.model.message.addCallback(self.messageChanged)
-		self.model.server.addCallback(self.serverChanged)
-		self.model.winner.addCallback(self.winnerNamed)
-		self.model.tiebreak.addCallback(self.tiebreakChanged)
-		self.model.currentSet.addCallback(self.setChanged)
-		self.model.team.addCallback(self.teamChanged)
+		self.rng = Random() # This controller's own random stream, e.g. for picking the starting server
+		self.journal = None
+		self.feed = None
+		self.rosters = None
+		self.scoreboard = None # Made when the match starts (or resumes)
+		self.scoringView = None # The scoring buttons, until the result is confirmed
+		self.winnerShown = False # True while the scoreboard shows a winner (the final point may still be undone)
+		self.addModelCallbacks()
+		# Rebuild an unfinished match. The callbacks leave the view alone until there is one;
+		# resumeMatch then shows the recovered position, teams included.
+		if os.path.exists(journalFile):
+			try:
+				pointJournal.replay(journalFile, self.model)
+				if not self.model.matchOver:
+					self.resumeMatch()
+					return
+			except (ValueError, KeyError, TypeError, IndexError):
+				print("Could not recover match from {}".format(journalFile))
+			self.model = Model()
+			self.addModelCallbacks()
+		# Start loading the player lists now, so they are ready (or arriving) by the third setup dialog
+		self.rosters = RosterLoader()
+		self.rosters.start(root)
 		# Presents first setup dialog (just whether singles or doubles match)
 		self.viewSetup1 = Setup1(root)
 		self.viewSetup1.nextButton.config(command=self.singles)
 
+	def addModelCallbacks(self):
+		"""Adds the callbacks for the observable fields in Model. The teams are shown by initTennisView."""
+		self.model.gameScore.addCallback(self.toScoreboard(self.gameScoreChanged))
+		self.model.setScore.addCallback(self.toScoreboard(self.setScoreChanged))
+		self.model.message.addCallback(self.toScoreboard(self.messageChanged))
+		self.model.server.addCallback(self.toScoreboard(self.serverChanged))
+		self.model.winner.addCallback(self.toScoreboard(self.winnerNamed))
+		self.model.tiebreak.addCallback(self.toScoreboard(self.tiebreakChanged))
+		self.model.currentSet.addCallback(self.toScoreboard(self.setChanged))
+
+	def toScoreboard(self, func):
+		"""
+		Returns a Model callback that updates the scoreboard, and does nothing while there is none
+		(e.g. while a journal is replayed).
+		@type func: function
+		@param func: The update, called with the new value.
+		@rtype: function
+		@return: The callback.
+		"""
+		@functools.wraps(func)
+		def callback(value):
+			if self.scoreboard is not None:
+				func(value)
+		return callback
+
 	def initTennisView(self):
 		"""Initializes the scoreboard in the View class."""
-		util.dbgprint(DEBUG,"initTennisView:")
+		if tr.debug:
+			tr.debugEvent('initTennisView')
 		self.teamChanged(self.model.team)  # set the initial value of the tams in the view
 		self.setChanged(self.model.currentSet.get())  # set the initial value of the set # in the view
 		self.messageChanged(self.model.message.get())  # set the initial value of the message in the view
 		self.serverChanged(self.model.server.get())  # set the initial value of the server in the view
 		self.winnerNamed(self.model.winner.get())  # set the initial value of the winner in the view
+		self.updateWinProbability()  # set the initial match win probability in the view
 
 	def gameScoreChanged(self,gameScore):
 		"""
@@ -122,26 +195,61 @@ class Controller:
 		# Set the Team objects in the view
 		self.scoreboard.setTeam(team)
 		# Set the score names for the teams in the view
-		self.scoreboard.setTeamMembers(
-			self.model.team[0].scoreName(dups=self.model.duplicateLastName,	special=self.model.specialCaseNames),
-			self.model.team[1].scoreName(dups=self.model.duplicateLastName, special=self.model.specialCaseNames))
-		self.model.teamScoreNames = [
-			self.model.team[0].scoreName(dups=self.model.duplicateLastName,	special=self.model.specialCaseNames),
-			self.model.team[1].scoreName(dups=self.model.duplicateLastName, special=self.model.specialCaseNames)]
+		self.model.teamScoreNames = [t.scoreName(dups=self.model.duplicateLastName, special=self.model.specialCaseNames)
+			for t in team]
+		self.scoreboard.setTeamMembers(*self.model.teamScoreNames)
 
 	def winnerNamed(self,winner):
 		"""
-		Sets the winning team for the current match. Shows message, and photo(s).
+		Sets the winning team for the current match. Shows message, and photo(s). The final point can
+		still be undone (taking the winner back) until the operator confirms the result.
 		@type winner: integer
 		@param winner: The number of the winning team / player.
 		"""
 		if (winner >= 0): # winner < 0 means no winner yet
-			util.dbgprint(DEBUG, "In controller, winnerNamed.")
+			if tr.debug:
+				tr.debugEvent('winnerNamed', winner=winner)
 			self.scoreboard.setMessage(self.model.teamScoreNames[winner]+" won!")
 			# Show the winner photo(s) if available
 			self.scoreboard.showWinnerPhotos(winner)
 			self.scoreboard.setSetColorsSame()
-			self.scoringView.destroy()
+			self.scoringView.setMatchOver(True)
+			self.winnerShown = True
+		elif self.winnerShown: # The winning point was undone
+			self.scoreboard.clearWinner()
+			self.scoringView.setMatchOver(False)
+			self.winnerShown = False
+
+	def confirmResult(self):
+		"""Ends the match, once the operator confirms the result: no more undo."""
+		self.scoringView.destroy()
+		self.scoringView = None
+		self.journal.close()
+		try:
+			os.remove(journalFile) # Match is over, nothing left to recover on the next launch
+		except OSError as e:
+			print("Couldn't remove {}: {}".format(journalFile, e))
+		if TIMING:
+			self.printTiming()
+
+	def callbackError(self, excType, excValue, tb):
+		"""
+		Reports an error in a Tk callback: the traceback, then the recent trace events that led up to it.
+		@type excType: class
+		@param excType: The exception class.
+		@type excValue: Exception
+		@param excValue: The exception.
+		@type tb: traceback
+		@param tb: The traceback.
+		"""
+		traceback.print_exception(excType, excValue, tb)
+		sys.stderr.write("Recent trace events:\n")
+		tracing.dump()
+
+	def printTiming(self):
+		"""Prints call counts and latencies of the Model callbacks so far (see observable.enableTiming)."""
+		if observable.timer is not None:
+			print(observable.timer.format())
 
 	def tiebreakChanged(self,tiebreak):
 		"""
@@ -157,16 +265,43 @@ class Controller:
 		@type team: integer
 		@param team: The scoring team.
 		"""
+		if self.model.matchOver:
+			return
 		self.model.incrementGameScore(team)
+		self.journal.point(team)
+		self.updateWinProbability()
+		self.updateUndoButtons()
+
+	def undo(self):
+		"""Takes back the last point. The scoreboard gets one update per changed field."""
+		if self.model.undo():
+			self.journal.undo()
+			self.updateWinProbability()
+		self.updateUndoButtons()
+
+	def redo(self):
+		"""Replays the last undone point."""
+		if self.model.redo():
+			self.journal.redo()
+			self.updateWinProbability()
+		self.updateUndoButtons()
+
+	def updateUndoButtons(self):
+		"""Enables the undo and redo buttons only when there is something to undo or redo."""
+		if self.scoringView is None:
+			return # Result confirmed, scoring window is gone
+		self.scoringView.undoButton.config(state='normal' if self.model.canUndo() else 'disabled')
+		self.scoringView.redoButton.config(state='normal' if self.model.canRedo() else 'disabled')
+
+	def updateWinProbability(self):
+		"""Updates the match win probability shown on the scoreboard."""
+		self.scoreboard.setWinProbability(self.winProbability.matchWinFromModel(self.model))
 
 	def singles(self): # Check for singles or doubles match
 		"""Interprets first setup dialog. Determines whether the current match is singles or doubles. Also, presents next setup dialog."""
 		self.model.doublesMatch.set(self.viewSetup1.getDoublesMatch())
-		if DEBUG:
-			if self.model.doublesMatch.get():
-				print("Doubles")
-			else:
-				print("Singles")
+		if tr.info:
+			tr.event('setup', doublesMatch=self.model.doublesMatch.get())
 		# Present next setup dialog, destroy current dialog
 		self.viewSetup2 = Setup2(root, not self.model.doublesMatch.get())
 		self.viewSetup2.nextButton.config(command=self.setup2)
@@ -175,19 +310,14 @@ class Controller:
 	def setup2(self):
 		"""Interprets second setup dialog. Determines mens / womens / mixed match. Whether end on tiebreak. Also, presents next setup dialog."""
 		self.model.mensMatch.set(self.viewSetup2.getMensMatch())
-		if DEBUG:
-			if self.model.mensMatch.get()==1:
-				print("Men's")
-			elif self.model.mensMatch.get() == 0:
-				print("Women's")
-			else:
-				print("Mixed doubles")
 		self.model.noEndingTiebreak.set(self.viewSetup2.getNoEndingTiebreak())
-		util.dbgprint(DEBUG, "No ending tiebreak is "+str(self.model.noEndingTiebreak.get()))
 		self.model.matchType.set(self.viewSetup2.matchType.get())
-		util.dbgprint(DEBUG, "Match type is: "+self.model.matchType.get())
+		if tr.info:
+			tr.event('setup', mensMatch=self.model.mensMatch.get(), noEndingTiebreak=self.model.noEndingTiebreak.get(),
+				matchType=self.model.matchType.get())
 		# Present next setup dialog, destroy current dialog
-		self.viewSetup3 = Setup3(root, self.model.mensMatch.get(), self.model.doublesMatch.get())
+		self.viewSetup3 = Setup3(root, self.model.mensMatch.get(), self.model.doublesMatch.get(), self.rosters,
+			self.model.noEndingTiebreak.get())
 		self.viewSetup3.startButton.config(command = self.startMatch)
 		self.viewSetup2.destroy()
 
@@ -195,35 +325,41 @@ class Controller:
 		"""Clears and reshows the third setup dialog."""
 		# Not used. I just leave original dialog open until the user gets it right.
 		self.viewSetup3.destroy()
-		self.viewSetup3 = Setup3(root, self.model.mensMatch.get(), self.model.doublesMatch.get())
+		self.viewSetup3 = Setup3(root, self.model.mensMatch.get(), self.model.doublesMatch.get(), self.rosters,
+			self.model.noEndingTiebreak.get())
 		self.viewSetup3.startButton.config(command = self.startMatch)
 
+	def rosterPlayer(self, choice):
+		"""
+		Returns a player chosen in the third setup dialog.
+		@type choice: tuple
+		@param choice: (list kind, roster id), see Setup3.getTeamIds.
+		@rtype: player.Player
+		@return: The player.
+		"""
+		(kind, id) = choice
+		return self.rosters.get(kind).player(id)
+
 	def startMatch(self):
 		"""Starts the match. Interprets third setup dialog. Player names, number of sets, ending tiebreak. Creates scoring buttons. Initializes scoreboard."""
-		# Get the strings for the two team's player names. Each string includes all object properties in parseable format.
-		teamStrings = self.viewSetup3.getTeamStrings()
+		# Get the two team's players, as (list kind, roster id)
+		teamIds = self.viewSetup3.getTeamIds()
 		# Doing next earlier than I'd normally do, so capture change of teams.
 		self.scoreboard = View(root)	# The main scoreboard
 		if self.model.doublesMatch.get():
-			props = parsePlayerString(teamStrings[0][0]) # Parse string for first team, player 1, extract properties
-			player1 = player.Player(props[0],props[1],props[2],props[3])
-			props = parsePlayerString(teamStrings[0][1]) # Parse string for first team, player 2, extract properties
-			player1a = player.Player(props[0],props[1],props[2],props[3])
-			props = parsePlayerString(teamStrings[1][0]) # Parse string for second team, player 1, extract properties
-			player2 = player.Player(props[0],props[1],props[2],props[3])
-			props = parsePlayerString(teamStrings[1][1]) # Parse string for second team, player 2, extract properties
-			player2a = player.Player(props[0],props[1],props[2],props[3])
+			player1 = self.rosterPlayer(teamIds[0][0]) # First team, player 1
+			player1a = self.rosterPlayer(teamIds[0][1]) # First team, player 2
+			player2 = self.rosterPlayer(teamIds[1][0]) # Second team, player 1
+			player2a = self.rosterPlayer(teamIds[1][1]) # Second team, player 2
 			playerList = [player1, player1a, player2, player2a] # List used to check for player uniqueness
 			# Set teams in model
-			self.model.team = [player.Team(player1, player1a), player.Team(player2, player2a)]
+			self.model.setTeams([player.Team(player1, player1a), player.Team(player2, player2a)])
 		else: # singles match
-			props = parsePlayerString(teamStrings[0]) # Parse string for first player, extract properties
-			player1 = player.Player(props[0],props[1],props[2],props[3])
-			props = parsePlayerString(teamStrings[1]) # Parse string for second, extract properties
-			player2 = player.Player(props[0],props[1],props[2],props[3])
+			player1 = self.rosterPlayer(teamIds[0])
+			player2 = self.rosterPlayer(teamIds[1])
 			playerList = [player1, player2] # List used to check for player uniqueness
 			# Set teams in model
-			self.model.team = [player.Team(player1), player.Team(player2)]
+			self.model.setTeams([player.Team(player1), player.Team(player2)])
 
 		# Check for player uniqueness. If not, then re-show dialog.
 		# Recall that when form a set from a list, any duplicate items will be discarded
@@ -232,63 +368,109 @@ class Controller:
 			self.view4 = PlayerError(root)
 			self.view4.okButton.config(command = self.view4.destroy)
 			self.scoreboard.destroy()
+			self.scoreboard = None
 			# Once drop out of view4 dialog, will be back at third setup dialog to allow user to correct error.
 			return # Not sure this is necessary. Likely never gets here.
 
-		self.model.duplicateLastName = self.viewSetup3.duplicateLastName # List of last names that appear mroe than once.
-		self.model.specialCaseNames = specialCaseNames # List of special case names, same last name AND first initial.
+		names = self.viewSetup3.names # Worked out from the player lists
+		self.model.duplicateLastName = names.dups # Set of last names that appear more than once.
+		self.model.specialCaseNames = names.special # Set of special case names, same last name AND first initial.
 
-		self.model.numberOfSets.set(self.viewSetup3.getNumberOfSets())
-		# Following could be more general. It works for three and five set matches. Which is everthing, I think. Later version.
-		if self.model.numberOfSets.get() == 3:
-			self.model.winSets.set(2)
-		else:
-			self.model.winSets.set(3)
-		if self.model.doublesMatch.get():
-			self.model.winSets.set(2)
-
-		if DEBUG:
-			if self.model.noEndingTiebreak.get():
-				print("This match cannot end set {} in a tiebreak.".format(self.model.numberOfSets.get()))
-			else:
-				print("This match can end set {} in a tiebreak.".format(self.model.numberOfSets.get()))
-
-		util.dbgprint(DEBUG, str(self.model.winSets.get())+" sets to win match.")
+		format = self.viewSetup3.getFormat() # Used as chosen; no ending tiebreak only picks the default
+		self.model.noEndingTiebreak.set(format.finalTiebreakAt == 0 and not format.matchTiebreak)
+		self.model.setFormat(format)
 		self.viewSetup3.destroy()
+		# Pick starting server at random
+		self.model.server.set(self.rng.randrange(2))
+		if tr.info:
+			tr.event('matchStarted', teams=self.model.team, format=format, server=self.model.server.get())
+		self.journal = PointJournal.create(journalFile, self.model)
+		self.startScoring()
+		# Initialize scoreboard view, and we are off and running.
+		self.initTennisView()
+
+	def resumeMatch(self):
+		"""Shows the scoreboard and scoring buttons for a match recovered from the journal, and continues its journal."""
+		self.scoreboard = View(root)	# The main scoreboard
+		self.journal = PointJournal(journalFile)
+		self.startScoring()
+		# Bring the scoreboard up to the recovered position: teams, earlier sets first, then the current set and game.
+		for i in range(self.model.currentSet.get()):
+			self.setChanged(i)
+		self.initTennisView()
+		self.tiebreakChanged(self.model.tiebreak.get())
+		self.setScoreChanged(self.model.setScore.get())
+		self.gameScoreChanged(self.model.gameScore.get())
+
+	def startFeed(self):
+		"""Starts the live score feed server (its own thread), publishing the Model to local clients."""
+		if ScoreFeed is None:
+			return
+		self.feed = ScoreFeed()
+		try:
+			self.feed.start()
+		except OSError as e:
+			print("Live score feed not started: {}".format(e))
+			self.feed = None
+			return
+		self.feed.attach(self.model)
+
+	def startScoring(self):
+		"""Creates the win probability calculator and the scoring buttons."""
+		p = serveWinProbability[self.model.mensMatch.get()]
+		self.winProbability = WinProbability.fromModel(self.model, (p, p)) # Same serve strength for both teams
 		# Establish the team scoring buttons.
 		# Q: Should this be done in teamChanged? It works fine here, but may make more sense there.
 		self.scoringView = Scoring(self.scoreboard,
 				self.model.team[0].buttonName(self.model.duplicateLastName, self.model.specialCaseNames),
 				self.model.team[1].buttonName(self.model.duplicateLastName, self.model.specialCaseNames),
 				self.model.doublesMatch.get())   # The scoring buttons
-		# Pick starting server at random
-		self.model.server.set(randrange(2))
 		self.scoringView.team1Button.config(command=lambda: self.incrementGameScore(0))   # Team 1 scores
 		self.scoringView.team2Button.config(command=lambda: self.incrementGameScore(1))   # Team 2 scores
-		if DEBUG:
-			print("Before initTennisView(), self.model.team is {}".format(self.model.team))
-		# Initialize scoreboard view, and we are off and running.
-		self.initTennisView()
-
-def parsePlayerString(s):
+		self.scoringView.undoButton.config(command=self.undo)
+		self.scoringView.redoButton.config(command=self.redo)
+		self.scoringView.confirmButton.config(command=self.confirmResult)
+		self.updateUndoButtons()
+		self.startFeed()
+		if tr.debug:
+			tr.debugEvent('startScoring', teams=self.model.team)
+
+def resumeDemo(root):
 	"""
-	Parses a string representing a player into elements of a Player object.
-	@type s: string
-	@param s: String representing a player.
-	@rtype: tuple
-	@return: Elements of a Player object.
+	Checks crash recovery: journals part of a match, as if the program died mid-match, then builds a
+	Controller, which resumes it from the journal. Run with "python tennisScore.py --resume-demo".
+	@type root: Toplevel widget
+	@param root: Main application window.
+	@rtype: Controller
+	@return: The Controller, showing the resumed match.
 	"""
-	l1 = s.split('.')
-	rank = l1[0]
-	l2 = l1[1].split(',')
-	lastName = l2[0].strip()
-	l3 = l2[1].split('(')
-	firstName = l3[0].strip()
-	country = l3[1][0:3] # Three-letter IOC code for country.
-	return (rank, firstName, lastName, country)
+	global journalFile
+	import tempfile
+	journalFile = os.path.join(tempfile.mkdtemp(), 'resumeDemo.journal')
+	m = Model()
+	m.setMensMatch(1)
+	m.matchType.set("Final")
+	m.setTeams([player.Team(player.Player(1, 'Novak', 'Djokovic', 'SRB')), player.Team(player.Player(2, 'Rafael', 'Nadal', 'ESP'))])
+	m.server.set(0)
+	journal = PointJournal.create(journalFile, m)
+	rng = Random(1)
+	for i in range(150):
+		team = 0 if rng.random() < 0.55 else 1
+		m.incrementGameScore(team)
+		journal.point(team)
+	journal.close() # The program "dies" here
+	app = Controller(root)
+	assert app.scoreboard is not None, "Match not resumed"
+	assert (app.model.setScore.get(), app.model.gameScore.get()) == (m.setScore.get(), m.gameScore.get())
+	print("Resumed from {}: sets {}, game {}, {} to serve".format(journalFile, app.model.setScore.get(),
+		app.model.gameScore.get(), app.model.teamScoreNames[app.model.server.get()]))
+	return app
 
 if __name__ == '__main__':
         root = tk.Tk()
         root.withdraw()   # removes widget from screen
-        app = Controller(root)
+        if '--resume-demo' in sys.argv[1:]:
+                app = resumeDemo(root)
+        else:
+                app = Controller(root)
         root.mainloop()
\ No newline at end of file
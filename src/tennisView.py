@@ -36,22 +36,19 @@ Note that as of October 2014, PIL (Python Imaging Library) is not available
 for Python 3.\n""")
 	pilAvailable = False
 
-# For downloading and displaying flags and pictures:
-import urllib
-if py == 3:
-	import urllib.request
-import base64
-if py == 2:
-	from StringIO import StringIO
+# For displaying flags and pictures:
+import io
 
 import sys
 sys.path.append('../lib')
 import util
+import tracing
+import assetCache
 
-DEBUG = False
+tr = tracing.getTracer('tennisView')
 
 # Start of URL address for player photos
-baseImageName = "http://tylasky.com/res/tennisScore/pics/"
+baseImageName = "http://tylasky.com/res/tennisScore/pics/" # Followed by Player.getPhotoName()
 imageSuffix = ".jpg"
 
 # Used to convert integer (0, 1, 2, 3, 4) into normal tennis score representation
@@ -82,6 +79,7 @@ setWidth = 5
 gameWidth = 5
 rankCol = 2
 rankwidth = 5
+winProbabilityRow = 3
 buttonCol = 5
 xLoc = '10'
 yLoc = '175'
@@ -166,6 +164,7 @@ class View(tk.Toplevel):
 		self.flag2a = tk.Label(self) # Second team, player 2
 		self.flagImages = []	# Will just be used to keep a reference to flag images (so not garbage collected)
 		self.playerImages = []	# Will just be used to keep a reference to player images (so not garbage collected)
+		self.photoWin = None # Window showing the winner photo(s), if any
 		# Team ranking labels
 		self.rank1 = tk.Label(self, width=rankWidth,
 			bg=mainBackground, fg=mainForeground, justify='center', font=myFont)
@@ -173,6 +172,12 @@ class View(tk.Toplevel):
 			bg=mainBackground, fg=mainForeground, justify='center', font=myFont)
 		self.rank1.grid(row=1, column=rankCol)
 		self.rank2.grid(row=2, column=rankCol)
+		# Live match win probability, hidden until first shown
+		self.teamNames = ("", "")
+		self.winProbabilityCtrl = tk.Label(self, bg=mainBackground, fg=mainForeground, justify='center')
+		self.winProbabilityCtrl.config(font=(fontFace, msgFontSize, fontMod))
+		self.winProbabilityCtrl.grid(row=winProbabilityRow, column=messageCol, columnspan=messageSpan)
+		self.winProbabilityCtrl.grid_remove()
 		# Button for exiting the program
 		btnGroup = tk.LabelFrame(self, bg=mainBackground, fg=mainForeground)
 		# may want to move this around for different sets. Or, put it before message control
@@ -196,9 +201,12 @@ class View(tk.Toplevel):
 		sys.exit(0)
 
 	def readCountries(self):
-		"""Read in IOC country codes (key) from URL, and set corresponding country and flag name (values)."""
-		# Read in the country information as a string fro the URL
-		txt = util.getUrlAsString(countryUrl)
+		"""
+		Read in IOC country codes (key) from URL, and set corresponding country and flag name (values).
+		The copy saved last time is used, and checked with the server once it is a week old (see assetCache).
+		"""
+		# Read in the country information as a string from the URL, or the copy saved last time
+		txt = assetCache.getCache().get(countryUrl)
 		if not txt is None: # String read from URL
 			self.countries = {}
 			for line in util.lineIter(txt): # Parse each line, key = IOC code, value = tuple of country name, flag file name prefix.
@@ -222,6 +230,20 @@ class View(tk.Toplevel):
 		"""
 		self.team1Ctrl.config(text = team1String)
 		self.team2Ctrl.config(text = team2String)
+		self.teamNames = (team1String, team2String)
+
+	def setWinProbability(self, probability):
+		"""
+		Shows each team's probability of winning the match.
+		@type probability: tuple of floats
+		@param probability: Win probability for team 1 and team 2. If None, the display is hidden.
+		"""
+		if probability is None:
+			self.winProbabilityCtrl.grid_remove()
+			return
+		self.winProbabilityCtrl.config(text = "WIN PROBABILITY:  {} {:.0%}   {} {:.0%}".format(
+			self.teamNames[0].upper(), probability[0], self.teamNames[1].upper(), probability[1]))
+		self.winProbabilityCtrl.grid()
 
 	def setTeam(self,team):
 		"""
@@ -242,8 +264,8 @@ class View(tk.Toplevel):
 
 	def setFlags(self):
 		"""Sets the flags for each team member's country."""
-		util.dbgprint(DEBUG, "For team 1, flags will be for: {}".format(self.team[0].getCountryCode()))
-		util.dbgprint(DEBUG, "For team 2, flags will be for: {}".format(self.team[1].getCountryCode()))
+		if tr.debug:
+			tr.debugEvent('setFlags', countries=(self.team[0].getCountryCode(), self.team[1].getCountryCode()))
 		# Set flag for first team, player 1
 		self.setOneFlag(self.flag1, self.team[0].getCountryCode()[0], 1, firstFlagCol)
 		#
@@ -304,7 +326,8 @@ class View(tk.Toplevel):
 		if countryCode == 'TPE': # This flag is not available on http://www.33ff.com. Found it elsewhere, scaled, placed in my resources
 			# Flag for Chinese Taipei / Taiwan:
 			flagString = 'http://tylasky.com/res/tennisScore/Chinese-Taipei.gif'
-		util.dbgprint(DEBUG, "getFlagImage: "+flagString)
+		if tr.debug:
+			tr.debugEvent('getFlagImage', url=flagString)
 		# following is test code to see how handle no resource on server:
 		#
 		# flagString = flagPrefix
@@ -313,23 +336,10 @@ class View(tk.Toplevel):
 		#
 		# flagString = 'http://xyz.badsite.dbg'
 		#
-		try:
-			if py == 2:
-				u = urllib.urlopen(flagString)
-			else: # Python 3
-				u = urllib.request.urlopen(flagString)
-		except IOError:
-			print("getFlagImage: Could not locate server {}".format(flagString))
-			u.close()
-			return None
-		if u.getcode() != 200:
-			print("getFlagImage: Resource not found on server {} : code = {}".format(flagString,u.getcode()))
-			u.close()
+		rawData = assetCache.getCache().get(flagString) # From disk, unless not seen in a week
+		if rawData is None: # No copy, and the server can not be reached
 			return None
-		# Successful, finish up
-		rawData = u.read() # Any error to check here?
-		u.close()
-		return tk.PhotoImage(data=base64.encodestring(rawData))
+		return util.gifImage(rawData)
 
 	def showWinnerPhotos(self, winner):
 		"""
@@ -357,6 +367,18 @@ class View(tk.Toplevel):
 		photoWin.overrideredirect(1) # No window decorations, no normal way to close window (added below)
 		(x,y) = util.centerCoords(photoWin)
 		util.positionWindow(photoWin, x, y-300)		
+		self.photoWin = photoWin
+
+	def clearWinner(self):
+		"""Takes back the winner display, when the winning point is undone: the photo(s), and the set colors."""
+		if self.photoWin is not None:
+			self.photoWin.destroy()
+			self.photoWin = None
+			self.playerImages = []
+		for i in range(self.currentSet + 1):
+			(foreground,background) = self.getSetColor(i)
+			self.team1SetCtrl[i].config(fg=foreground,bg=background)
+			self.team2SetCtrl[i].config(fg=foreground,bg=background)
 
 	def setServer(self,server):
 		"""
@@ -448,16 +470,25 @@ class View(tk.Toplevel):
 	def setSet(self,currentSet):
 		"""
 		Starts a new set. Hides game score at beginning of set.
+		Also goes back to an earlier set (after undo), removing the later set controls.
 		@type currentSet: integer.
 		@param currentSet: Number of the current set (0 = first set)
 		"""
 		self.currentSet = currentSet
+		# Remove controls for sets after this one (set was undone).
+		while len(self.team1SetCtrl) > currentSet + 1:
+			self.team1SetCtrl.pop().destroy()
+			self.team2SetCtrl.pop().destroy()
 		# Create controls and add them to the list of set controls.
-		self.addSetCtrl(currentSet)
+		if len(self.team1SetCtrl) == currentSet:
+			self.addSetCtrl(currentSet)
 		for i in range(currentSet+1):
 			(foreground,background) = self.getSetColor(i)
 			self.team1SetCtrl[i].config(fg=foreground,bg=background)
 			self.team2SetCtrl[i].config(fg=foreground,bg=background)
+			if i < currentSet: # Earlier sets have been played, so show them (already shown, unless recovering a match)
+				self.team1SetCtrl[i].grid()
+				self.team2SetCtrl[i].grid()
 		# Move the game score one spot to the right to accomodate the new set score boxes.
 		self.gameScoreTeam1.grid(row=1, column=currentSet+firstSetCol+1)
 		self.gameScoreTeam2.grid(row=2, column=currentSet+firstSetCol+1)
@@ -541,9 +572,7 @@ def getPlayerPhoto(player):
 	# returns photo for player
 	if player is None:
 		return None
-	# Form JPEG file name. Substitute spaces in last name with "_":
-	jpgFileName = (player.firstName[0:2]+"_"+player.lastName.replace(" ", "_")+imageSuffix).lower()
-	img = getUrlPhoto(baseImageName + jpgFileName)
+	img = getUrlPhoto(baseImageName + player.getPhotoName())
 	return img
 
 def getUrlPhoto(jpgUrl):
@@ -565,25 +594,10 @@ def getUrlPhoto(jpgUrl):
 	# jpgUrl = 'http://xyz.badsite.dbg'
 	#
 	if pilAvailable:
-		try:
-			if py == 2:
-				u = urllib.urlopen(jpgUrl)
-			else:
-				u = urllib.request.urlopen(jpgUrl)
-		except IOError:
-			print("getPhoto: Could not locate server {}".format(jpgUrl))
-			u.close()
-			return None
-		if u.getcode() != 200:
-			print("getPhoto: Resource not found on server {} : code = {}".format(jpgUrl,u.getcode()))
-			u.close()
+		rawData = assetCache.getCache().get(jpgUrl) # From disk, unless not seen in a week
+		if rawData is None: # No copy, and the server can not be reached
 			return None
-		rawData = u.read() # Any error check here?
-		u.close()
-		if py == 3:
-			img = Image.open(io.StringIO(rawData))
-		else: # Python 2
-			img = Image.open(StringIO(rawData))
+		img = Image.open(io.BytesIO(rawData))
 		return ImageTk.PhotoImage(img)
 	else:
 		# Can't show JPEG images without PIL
@@ -595,15 +609,9 @@ if __name__ == '__main__':
 	myView = View(master)
 	country = 'Australia'
 	url = flagPrefix + country + flagSuffix
-	if py == 2:
-		u = urllib.urlopen(url)
-	else:
-		u = urllib.request.urlopen(url)
-	rawData = u.read()
-	u.close()
+	rawData = assetCache.getCache().get(url)
 
-	b64Data = base64.encodestring(rawData)
-	image = tk.PhotoImage(data=b64Data)
+	image = util.gifImage(rawData)
 
 	label = tk.Label()
 	label.config(image=image)
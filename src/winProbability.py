@@ -0,0 +1,316 @@
+#!/usr/bin/python
+"""
+winProbability.py
+
+Copyright 2014, Ty A. Lasky
+
+Released under the GNU General Public License 3.0
+
+See LICENSE.txt for license information.
+
+---------------------------------------------------
+
+Exact live win probability for tennis scoreboard based on MVC architecture.
+
+Given the probability that each team wins a point on its own serve, computes the
+exact probability of winning the match from any position, by memoized recursion
+over game, tiebreak, set and match levels. Transitions come from scoringTables, so
+the rules are the same as tennisModel.Model, including who serves after a tiebreak.
+Sub-results are cached on the WinProbability object, so after the first call each
+per-point update is mostly cache hits.
+
+Repeating cycles (deuce, level tiebreaks beyond the target, level advantage sets) are
+solved in closed form.
+
+Exported classes:
+
+WinProbability -- Exact match win probability for one match format and serve strength.
+"""
+
+from matchState import MatchState
+from scoringTables import rulesFor, tiebreakKey, setKey, unpack, \
+	GAME_WON, SET_WON, ENTER_TIEBREAK, SERVER_CHANGE, MATCH_WON, MATCH_TIEBREAK
+import matchFormat
+
+class WinProbability:
+	"""Exact match win probability for one match format and serve strength."""
+	def __init__(self, serveWin, numberOfSets=3, doublesMatch=False, noEndingTiebreak=False, winSets=None, format=None):
+		"""
+		@type serveWin: sequence of two floats
+		@param serveWin: Probability that each team wins a point on its own serve.
+		@type numberOfSets: integer
+		@param numberOfSets: Number of sets in the match (2 for doubles with final 10-point tiebreak, 3, or 5).
+		@type doublesMatch: boolean
+		@param doublesMatch: Flag, True if this is a doubles match.
+		@type noEndingTiebreak: boolean
+		@param noEndingTiebreak: Flag, True if final set can NOT end with a tiebreak.
+		@type winSets: integer
+		@param winSets: Number of sets needed to win. If None, derived from numberOfSets.
+		@type format: matchFormat.MatchFormat
+		@param format: The match format. If None, worked out from the other arguments.
+		"""
+		if format is None:
+			format = matchFormat.fromLegacy(numberOfSets, doublesMatch, noEndingTiebreak, winSets)
+		self.format = format
+		self.rules = rulesFor(format)
+		# Probability that the first team wins a point, by server
+		self.pointWin = (serveWin[0], 1.0 - serveWin[1])
+		self._games = {}
+		self._tiebreaks = {}
+		self._sets = {}
+		self._matches = {}
+		self._states = {}
+
+	@classmethod
+	def fromModel(cls, model, serveWin):
+		"""
+		Creates a calculator for the match format held by a Model.
+		@type model: tennisModel.Model
+		@param model: The Model holding the match format.
+		@type serveWin: sequence of two floats
+		@param serveWin: Probability that each team wins a point on its own serve.
+		@rtype: WinProbability
+		@return: The calculator.
+		"""
+		return cls(serveWin, format=model.getFormat())
+
+	def matchWin(self, state):
+		"""
+		Returns each team's probability of winning the match from a position.
+		@type state: MatchState, or integer
+		@param state: The match position.
+		@rtype: tuple of floats
+		@return: Win probability for team 1 and team 2.
+		"""
+		p = self._states.get(state)
+		if p is None:
+			p = self._states[state] = self._fromState(MatchState(state))
+		return (p, 1.0 - p)
+
+	def matchWinFromModel(self, model):
+		"""
+		Returns each team's probability of winning the match held by a Model.
+		@type model: tennisModel.Model
+		@param model: The Model holding the current position.
+		@rtype: tuple of floats
+		@return: Win probability for team 1 and team 2.
+		"""
+		return self.matchWin(MatchState.fromModel(model))
+
+	def _fromState(self, state):
+		"""
+		Returns the first team's probability of winning the match from a position.
+		@type state: MatchState
+		@param state: The match position.
+		@rtype: float
+		@return: The first team's win probability.
+		"""
+		(gameScore, setScore, cur, matchScore, server, tb, tbWin, winner) = state.decode()
+		if winner >= 0:
+			return 1.0 if winner == 0 else 0.0
+		if server < 0:
+			# Starting server not chosen yet, equally likely
+			return 0.5 * sum(self._fromState(MatchState.fromFields(gameScore, setScore, cur, matchScore, s, tb, tbWin))
+				for s in (0, 1))
+		(a, b) = gameScore
+		games = setScore[cur]
+		outcomes = self._set(games[0], games[1], a, b, server, tb, cur)
+		return self._afterSet(outcomes, matchScore[0], matchScore[1], cur)
+
+	def _afterSet(self, outcomes, m0, m1, cur):
+		"""
+		Combines the outcomes of a set with the rest of the match.
+		@type outcomes: dictionary
+		@param outcomes: (set winner, next server) -> probability.
+		@type m0: integer
+		@param m0: Sets won by the first team before this set.
+		@type m1: integer
+		@param m1: Sets won by the second team before this set.
+		@type cur: integer
+		@param cur: The set (0 = first set).
+		@rtype: float
+		@return: The first team's match win probability.
+		"""
+		total = 0.0
+		for (w, s), p in outcomes.items():
+			events = self.rules.matchEvents((m0, m1), w)
+			n0 = m0 + (w == 0)
+			n1 = m1 + (w == 1)
+			if events & MATCH_WON:
+				total += p if w == 0 else 0.0
+			elif events & MATCH_TIEBREAK:
+				# The match tiebreak is the last set
+				total += p * self._afterSet(self._tiebreak(0, 0, s, cur + 1), n0, n1, cur + 1)
+			else:
+				total += p * self._match(n0, n1, cur + 1, s)
+		return total
+
+	def _match(self, m0, m1, cur, server):
+		"""
+		Returns the first team's match win probability at the start of a set.
+		@type m0: integer
+		@param m0: Sets won by the first team.
+		@type m1: integer
+		@param m1: Sets won by the second team.
+		@type cur: integer
+		@param cur: The set about to start (0 = first set).
+		@type server: integer
+		@param server: The team serving the first game of the set.
+		@rtype: float
+		@return: The first team's match win probability.
+		"""
+		key = (m0, m1, cur, server)
+		p = self._matches.get(key)
+		if p is None:
+			outcomes = self._set(0, 0, 0, 0, server, False, cur)
+			p = self._matches[key] = self._afterSet(outcomes, m0, m1, cur)
+		return p
+
+	def _game(self, a, b, server):
+		"""
+		Returns the first team's probability of winning a regular game.
+		@type a: integer
+		@param a: First team's points (0-4, 4 = advantage).
+		@type b: integer
+		@param b: Second team's points.
+		@type server: integer
+		@param server: The team serving.
+		@rtype: float
+		@return: The first team's game win probability.
+		"""
+		key = (a, b, server)
+		p = self._games.get(key)
+		if p is None:
+			r = self.pointWin[server]
+			if a == 3 and b == 3 and self.format.advantage:
+				# Deuce: win two points in a row before losing two in a row
+				p = r * r / (r * r + (1.0 - r) * (1.0 - r))
+			else:
+				p = 0.0
+				for team, q in ((0, r), (1, 1.0 - r)):
+					(score, events) = self.rules.gameEvents((a, b), team)
+					if events & GAME_WON:
+						p += q if team == 0 else 0.0
+					else:
+						p += q * self._game(score[0], score[1], server)
+			self._games[key] = p
+		return p
+
+	def _tiebreak(self, a, b, server, cur):
+		"""
+		Returns the outcomes of a tiebreak.
+		@type a: integer
+		@param a: First team's points.
+		@type b: integer
+		@param b: Second team's points.
+		@type server: integer
+		@param server: The team serving the next point.
+		@type cur: integer
+		@param cur: The set the tiebreak decides (0 = first set), which gives its target and margin.
+		@rtype: dictionary
+		@return: (tiebreak winner, server after the tiebreak) -> probability.
+		"""
+		rules = self.rules
+		target = rules.tiebreakTargets[cur]
+		margin = rules.tiebreakMargins[cur]
+		key = (tiebreakKey(a, b, target), server, target, margin)
+		outcomes = self._tiebreaks.get(key)
+		if outcomes is None:
+			if a == b and a >= target - 1 and margin == 2:
+				# Level at target - 1 or beyond (the total is even). Each team serves one of the next two points.
+				# Two points to one team wins; a split returns to level. Whoever wins, the team that received
+				# the first tiebreak point serves next: the other team if an even number of pairs has been played.
+				other = 1 - server
+				r = self.pointWin[server] * self.pointWin[other]
+				l = (1.0 - self.pointWin[server]) * (1.0 - self.pointWin[other])
+				after = other if a % 2 == 0 else server
+				outcomes = {(0, after): r / (r + l), (1, after): l / (r + l)}
+			else:
+				outcomes = {}
+				rw = self.pointWin[server]
+				for team, q in ((0, rw), (1, 1.0 - rw)):
+					events = rules.tiebreakEvents((a, b), team, cur)
+					s = 1 - server if events & SERVER_CHANGE else server
+					if events & GAME_WON:
+						_add(outcomes, (team, s), q)
+					else:
+						for k, p in self._tiebreak(a + (team == 0), b + (team == 1), s, cur).items():
+							_add(outcomes, k, q * p)
+			self._tiebreaks[key] = outcomes
+		return outcomes
+
+	def _set(self, x, y, a, b, server, tb, cur):
+		"""
+		Returns the outcomes of a set.
+		@type x: integer
+		@param x: First team's games.
+		@type y: integer
+		@param y: Second team's games.
+		@type a: integer
+		@param a: First team's points in the current game (or tiebreak).
+		@type b: integer
+		@param b: Second team's points in the current game (or tiebreak).
+		@type server: integer
+		@param server: The team serving.
+		@type tb: boolean
+		@param tb: Flag, True if the set is in its tiebreak.
+		@type cur: integer
+		@param cur: The set (0 = first set), which gives its rules.
+		@rtype: dictionary
+		@return: (set winner, server of the next set) -> probability.
+		"""
+		if tb:
+			# The set goes to the tiebreak winner. Server does not change again after a tiebreak.
+			return self._tiebreak(a, b, server, cur)
+		rules = self.rules
+		(kx, ky) = unpack(setKey(x, y, rules.setLimits[cur])) # Long advantage sets reduce to an equivalent score
+		key = (kx, ky, a, b, server, cur)
+		outcomes = self._sets.get(key)
+		if outcomes is None:
+			other = 1 - server
+			if not rules.tiebreakAts[cur] and x == y and x >= self.format.gamesPerSet - 1 and a == 0 and b == 0:
+				# Level advantage set: two games to one team wins it (server back to the same team),
+				# a split returns to level with the same server.
+				g = self._game(0, 0, server)
+				h = self._game(0, 0, other)
+				r = g * h
+				l = (1.0 - g) * (1.0 - h)
+				outcomes = {(0, server): r / (r + l), (1, server): l / (r + l)}
+			else:
+				outcomes = {}
+				g = self._game(a, b, server)
+				for team, q in ((0, g), (1, 1.0 - g)):
+					events = rules.setEvents((x, y), team, cur)
+					if events & SET_WON:
+						_add(outcomes, (team, other), q)
+					else:
+						nx = x + (team == 0)
+						ny = y + (team == 1)
+						more = self._set(nx, ny, 0, 0, other, bool(events & ENTER_TIEBREAK), cur)
+						for k, p in more.items():
+							_add(outcomes, k, q * p)
+			self._sets[key] = outcomes
+		return outcomes
+
+def _add(outcomes, key, p):
+	"""
+	Adds probability to an outcome.
+	@type outcomes: dictionary
+	@param outcomes: Outcome -> probability.
+	@type key: tuple
+	@param key: The outcome.
+	@type p: float
+	@param p: Probability to add.
+	"""
+	outcomes[key] = outcomes.get(key, 0.0) + p
+
+if __name__ == '__main__':
+	import time
+	wp = WinProbability((0.64, 0.62), numberOfSets=5)
+	start = time.time()
+	print("Pre-match, first team serving: {}".format(wp.matchWin(MatchState.fromFields(server=0))))
+	print("First call: {:.3f} ms".format(1000 * (time.time() - start)))
+	s = MatchState.fromFields((3,1), ((6,4),(5,5),(0,0),(0,0),(0,0)), 1, (1,0), 1)
+	start = time.time()
+	print("{}: {}".format(repr(s), wp.matchWin(s)))
+	print("Next call: {:.3f} ms".format(1000 * (time.time() - start)))